@@ -0,0 +1,212 @@
+"""Рекомендации альбомом против отдельных фото: вызовы Bot API и трафик на один запрос.
+
+Фото товаров раздаёт локальный сервер с полноразмерными JPEG, заглушка Bot API,
+как Telegram, сама скачивает фото, переданные ссылкой. Для каждого режима
+печатается на один запрос рекомендаций: вызовы Bot API, байты, отправленные
+ботом в Bot API, байты, которые «Telegram» скачал по ссылкам, байты, которые
+скачал сам бот для миниатюр, и время ответа.
+
+Запуск из корня репозитория: python -m benchmarks.album
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+from telegram import Update
+
+import bot
+import callbacks
+import config
+from benchmarks.fake_bot_api import FakeBotApi, callback_update
+from photo_cache import PhotoCache
+from thumbnails import ThumbnailCache
+
+USERS = 20
+API_LATENCY = 0.02
+# Размер исходных фото: типичная картинка товара в магазине
+PHOTO_SIZE = (1600, 1200)
+
+
+def make_photo(seed: int) -> bytes:
+    # Плавный градиент с шумом сжимается примерно как фотография
+    rng = np.random.default_rng(seed)
+    width, height = PHOTO_SIZE
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * rng.random(3, dtype=np.float32)
+    pixels = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, 'JPEG', quality=90)
+    return output.getvalue()
+
+
+class PhotoServer:
+    """Полноразмерные фото товаров; считает отданные байты отдельно по клиентам."""
+
+    def __init__(self, photos: dict):
+        self.photos = photos
+        self.bytes_by_client = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def take(self) -> Counter:
+        with self._lock:
+            counts, self.bytes_by_client = self.bytes_by_client, Counter()
+        return counts
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = server.photos.get(self.path, b'')
+                # httpx — это «Telegram» из заглушки, requests — сам бот
+                client = 'telegram' if 'httpx' in self.headers.get('User-Agent', '') else 'bot'
+                with server._lock:
+                    server.bytes_by_client[client] += len(body)
+                self.send_response(200 if body else 404)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def local_catalog(directory: str, server_url) -> tuple:
+    """Копия tech_data.json, где фото товаров указывают на локальный сервер, и сами фото."""
+    with open('tech_data.json', 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    photos = {}
+    for category, brands in data.items():
+        for brand, models in brands.items():
+            for model, raw in models.items():
+                path = f"/photos/{len(photos)}.jpg"
+                photos[path] = make_photo(len(photos))
+                raw['photo_url'] = server_url(path)
+    path = os.path.join(directory, 'tech_data.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+    return path, photos
+
+
+def requests_data() -> list:
+    nodes = bot.catalog.get().indexes['nodes']
+    categories = [callbacks.encode(callbacks.RECOMMEND, nodes.category(category))
+                  for category in ('mice', 'keyboards', 'headphones')]
+    return [callbacks.RECOMMEND] + categories
+
+
+async def run(album: bool, thumbnails_dir: str, photo_cache_path: str, photo_server: PhotoServer) -> dict:
+    config.RECOMMENDATIONS_ALBUM = album
+    api = await FakeBotApi(latency=API_LATENCY, fetch_photos=True).start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url, concurrent_updates=16)
+    thumbnails = ThumbnailCache(thumbnails_dir) if album and thumbnails_dir else None
+    if thumbnails is not None:
+        application.bot_data['thumbnails'] = thumbnails
+    photo_cache = PhotoCache(photo_cache_path) if photo_cache_path else None
+    album_cache = PhotoCache(photo_cache_path, table='album_photos') if photo_cache_path and thumbnails else None
+    if photo_cache is not None:
+        application.bot_data['photo_cache'] = photo_cache
+    if album_cache is not None:
+        application.bot_data['album_photo_cache'] = album_cache
+    await application.initialize()
+    await application.start()
+    photo_server.take()
+    calls_before = api.total_calls - api.calls['getMe']
+    bytes_before = api.bytes_received
+
+    variants = requests_data()
+    timings = []
+    for user_id in range(1, USERS + 1):
+        photos_before = api.calls['sendPhoto'] + api.calls['sendMediaGroup'] + api.calls['sendMessage']
+        started = time.perf_counter()
+        update = callback_update(user_id, user_id, variants[user_id % len(variants)])
+        await application.update_queue.put(Update.de_json(update, application.bot))
+        expected = 1 if album else 3
+        while api.calls['sendPhoto'] + api.calls['sendMediaGroup'] + api.calls['sendMessage'] < photos_before + expected:
+            await asyncio.sleep(0.001)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    await application.stop()
+    await application.shutdown()
+    if thumbnails is not None:
+        thumbnails.close()
+    for cache in (photo_cache, album_cache):
+        if cache is not None:
+            cache.close()
+    await api.stop()
+    fetched = photo_server.take()
+    return {
+        'calls': (api.total_calls - api.calls['getMe'] - calls_before) / USERS,
+        'uploaded_kb': (api.bytes_received - bytes_before) / USERS / 1024,
+        'telegram_kb': fetched['telegram'] / USERS / 1024,
+        'bot_kb': fetched['bot'] / USERS / 1024,
+        'p50_ms': statistics.median(timings),
+        'thumbnails': len(thumbnails) if thumbnails is not None else 0,
+    }
+
+
+def check_eviction(directory: str):
+    """Кэш миниатюр, открытый с меньшим лимитом, удаляет давно использованные файлы, оставляя свежие."""
+    cache = ThumbnailCache(directory)
+    names = list(cache._files)
+    limit = sum(list(cache._files.values())[-3:])
+    cache.close()
+    cache = ThumbnailCache(directory, max_bytes=limit)
+    assert list(cache._files) == names[-3:] and cache.size <= limit, (names, list(cache._files))
+    assert sorted(os.listdir(directory)) == sorted(names[-3:])
+    cache.close()
+    print(f"вытеснение: из {len(names)} миниатюр при лимите {limit / 1024:.0f} КБ остались 3 последние")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        photo_server = PhotoServer({})
+        path, photos = local_catalog(directory, photo_server.url)
+        photo_server.photos.update(photos)
+        bot.catalog.path = path
+        bot.catalog.reload(force=True)
+        average = sum(map(len, photos.values())) / len(photos) / 1024
+        print(f"{USERS} запросов рекомендаций, фото {PHOTO_SIZE[0]}×{PHOTO_SIZE[1]} в среднем {average:.0f} КБ, "
+              f"миниатюры до {config.THUMBNAIL_MAX_SIDE} px")
+        print(f"{'режим':>24} {'вызовов':>8} {'в Bot API, КБ':>14} {'Telegram скачал, КБ':>20} "
+              f"{'бот скачал, КБ':>15} {'p50, мс':>8}")
+        thumbnails_dir = os.path.join(directory, 'thumbnails')
+        photo_cache = os.path.join(directory, 'photo_cache.sqlite3')
+        modes = (('по одному фото', False, '', ''), ('альбом без миниатюр', True, '', ''),
+                 ('альбом, холодный кэш', True, thumbnails_dir, ''), ('альбом, тёплый кэш', True, thumbnails_dir, ''),
+                 ('альбом, кэш и file_id', True, thumbnails_dir, photo_cache))
+        for name, album, thumbnails, file_ids in modes:
+            result = asyncio.run(run(album, thumbnails, file_ids, photo_server))
+            print(f"{name:>24} {result['calls']:>8.1f} {result['uploaded_kb']:>14.1f} {result['telegram_kb']:>20.1f} "
+                  f"{result['bot_kb']:>15.1f} {result['p50_ms']:>8.1f}")
+        check_eviction(thumbnails_dir)
+        photo_server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Каталог в SQLite против каталога в памяти.
+
+Для каждого размера: время и пик памяти импорта JSON в базу (файл читается
+потоком) против загрузки того же файла в CatalogSnapshot, затем задержки
+запросов бота к базе без кэша. Ответы базы сверяются со снимком:
+списки брендов и моделей, карточки, top-k рекомендаций и подобранные сетапы.
+
+Запуск из корня репозитория: python -m benchmarks.catalog_db
+"""
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_catalog
+from catalog import CatalogSnapshot, MouseSize
+from catalog_db import (SqlCatalog, SqlCatalogStore, SqlNodeIndex, SqlScoring, SqlSearch, SqlSetupIndex,
+                        import_json)
+from gaming_setup import GENRE_PROFILES, SetupIndex
+from scoring import ScoringEngine
+
+SIZES = (45, 10_000, 100_000)
+QUERIES = 200
+USAGES = ('gaming', 'work', 'budget')
+SETUP_BUDGETS = (None, 150, 300, 600)
+
+
+def measure(function):
+    """(результат, секунды, пик памяти в МБ): tracemalloc сильно замедляет разбор, поэтому время — отдельным прогоном."""
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def latency(fresh, function, arguments: list) -> str:
+    timings = []
+    for args in arguments:
+        # Новый объект каталога на каждый замер: запрос идёт в базу, а не в LRU
+        catalog = fresh()
+        started = time.perf_counter()
+        function(catalog, *args)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return f"медиана {statistics.median(timings):.2f} мс, p95 {timings[int(len(timings) * 0.95)]:.2f} мс"
+
+
+def load_snapshot(path: str) -> CatalogSnapshot:
+    with open(path, 'r', encoding='utf-8') as file:
+        return CatalogSnapshot(json.load(file), 1, 0, {'scoring': ScoringEngine, 'setup': SetupIndex})
+
+
+def check_parity(snapshot: CatalogSnapshot, sql, keys: list):
+    assert sql.categories() == snapshot.categories()
+    for category in snapshot.categories():
+        assert sql.brand_names(category) == snapshot.brand_names(category), category
+        for brand in snapshot.brand_names(category)[:5]:
+            assert sql.model_names(category, brand) == snapshot.model_names(category, brand), (category, brand)
+        for usage in USAGES:
+            expected = [(product.key, score) for product, score in snapshot.indexes['scoring'].top(usage, category, 3)]
+            found = [(product.key, score) for product, score in sql.indexes['scoring'].top(usage, category, 3)]
+            assert found == expected, (usage, category, found, expected)
+    for key in keys:
+        assert sql.product(*key) == snapshot.product(*key), key
+    for query in setup_queries():
+        expected = [setup.score for setup in snapshot.indexes['setup'].solve(*query)]
+        found = [setup.score for setup in sql.indexes['setup'].solve(*query)]
+        assert found == expected, (query, found, expected)
+
+
+def setup_queries() -> list:
+    return [(genre, size.value, feel, budget) for genre in GENRE_PROFILES for size in MouseSize
+            for feel in ('linear', 'tactile', 'clicky') for budget in SETUP_BUDGETS]
+
+
+def run(size: int, directory: str):
+    source = os.path.join(directory, f'catalog_{size}.json')
+    with open(source, 'w', encoding='utf-8') as file:
+        json.dump(generate_catalog(size), file, ensure_ascii=False)
+    url = f"sqlite:///{os.path.join(directory, f'catalog_{size}.sqlite3')}"
+
+    count, import_seconds, import_peak = measure(lambda: import_json(source, url))
+    snapshot, load_seconds, load_peak = measure(lambda: load_snapshot(source))
+    print(f"{count} товаров: импорт в SQLite {import_seconds:.2f} с, пик {import_peak:.1f} МБ; "
+          f"загрузка JSON в память {load_seconds:.2f} с, пик {load_peak:.1f} МБ")
+
+    builders = {'scoring': SqlScoring, 'nodes': SqlNodeIndex, 'search': SqlSearch, 'setup': SqlSetupIndex}
+    store = SqlCatalogStore(url, index_builders=builders)
+    store.reload()
+    sql = store.get()
+    rng = random.Random(size)
+    keys = [product.key for product in rng.sample(list(snapshot.iter_products()), min(QUERIES, count))]
+    check_parity(snapshot, sql, keys)
+
+    def fresh():
+        return SqlCatalog(store.engine, sql.version, sql.revision, builders)
+
+    print(f"  карточка товара: {latency(fresh, lambda catalog, *key: catalog.product(*key), keys)}")
+    print(f"  список моделей: {latency(fresh, lambda catalog, c, b, _: catalog.model_names(c, b), keys)}")
+    print(f"  top-3 рекомендаций: "
+          f"{latency(fresh, lambda catalog, c, *_: catalog.indexes['scoring'].top('gaming', c), keys)}")
+    queries = random.Random(size).choices(setup_queries(), k=len(keys))
+    print(f"  подбор сетапа: {latency(fresh, lambda catalog, *query: catalog.indexes['setup'].solve(*query), queries)}")
+    words = [(f"{key[1]} {key[2].split()[0]}",) for key in keys]
+    print(f"  поиск: {latency(fresh, lambda catalog, text: catalog.indexes['search'].search(text), words)}")
+    store.engine.dispose()
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            run(size, directory)
+
+
+if __name__ == '__main__':
+    main()
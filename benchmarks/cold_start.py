@@ -0,0 +1,132 @@
+"""Холодный старт бота: разбор tech_data.json со сборкой индексов против готового снимка каталога.
+
+Для синтетического каталога каждого размера снимок собирается командой
+python bot.py build-snapshot, затем бот много раз запускается в новом процессе,
+каждый раз отдельно с JSON и со снимком. Печатаются время импорта, загрузки
+каталога (catalog.reload) и пиковая память процесса. Проверяется:
+- ответы индексов (поиск, рекомендации, похожие, фасеты, сетап, экраны) совпадают
+  для обоих путей, в том числе после точечного обновления цены;
+- снимок, собранный из другого содержимого tech_data.json, пропускается,
+  и бот загружает JSON.
+
+Запуск из корня репозитория: python -m benchmarks.cold_start [--sizes 10000 100000]
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_catalog
+
+SIZES = (10_000, 100_000)
+REPEATS = 3
+
+
+def answers(snapshot) -> list:
+    indexes = snapshot.indexes
+    first, last = snapshot.products[0], snapshot.products[-1]
+    setups = indexes['setup'].solve('shooter', 'medium', 'linear', budget=300)
+    return [
+        [product.key for product in indexes['search'].search('logitech wireless', 5)],
+        [product.key for product in indexes['search'].search('razr', 5)],
+        [(product.key, score) for product, score in indexes['scoring'].top('gaming', 'mice')],
+        [(product.key, score) for product, score in indexes['scoring'].top('work')],
+        [product.key for product in indexes['similar'].similar(*last.key)],
+        indexes['facets'].get('mice').count({'p': 1, 'c': 0}),
+        [[getattr(setup, component).key for component in ('mouse', 'keyboard', 'headphones')] for setup in setups],
+        indexes['nodes'].model(*last.key),
+        indexes['render'].product_card(*first.key)[0],
+    ]
+
+
+def child():
+    """Один запуск бота в этом процессе: печатает JSON с временем, источником каталога и ответами."""
+    started = time.perf_counter()
+    import bot
+    imported = time.perf_counter()
+    messages = []
+    handler = logging.Handler()
+    handler.emit = lambda record: messages.append(record.getMessage())
+    logging.getLogger('catalog').addHandler(handler)
+    assert bot.catalog.reload(force=True)
+    loaded = time.perf_counter()
+
+    snapshot = bot.catalog.get()
+    result = answers(snapshot)
+    # Точечное обновление поверх прочитанных только для чтения массивов
+    product = snapshot.products[len(snapshot.products) // 2]
+    assert bot.catalog.apply_updates({product.key: {'price': '$1'}})
+    result.append(answers(bot.catalog.get()))
+    print(json.dumps({
+        'source': 'snapshot' if any('из снимка' in message for message in messages) else 'json',
+        'import': imported - started,
+        'reload': loaded - imported,
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'answers': result,
+    }, ensure_ascii=False))
+
+
+def start(json_path: str, snapshot_path: str) -> dict:
+    env = dict(os.environ, TECH_DATA_PATH=json_path, CATALOG_SNAPSHOT_PATH=snapshot_path,
+               REFRESH_INTERVAL='0', METRICS_PORT='0')
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.cold_start', 'child'], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(size: int, directory: str):
+    json_path = os.path.join(directory, f'catalog_{size}.json')
+    snapshot_path = os.path.join(directory, f'catalog_{size}.snapshot')
+    with open(json_path, 'w', encoding='utf-8') as file:
+        json.dump(generate_catalog(size), file, ensure_ascii=False)
+
+    env = dict(os.environ, TECH_DATA_PATH=json_path, CATALOG_SNAPSHOT_PATH=snapshot_path)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, 'bot.py', 'build-snapshot'], env=env, check=True, capture_output=True)
+    build_seconds = time.perf_counter() - started
+    print(f"{size} товаров: JSON {os.path.getsize(json_path) / 2 ** 20:.0f} МБ, снимок "
+          f"{os.path.getsize(snapshot_path) / 2 ** 20:.0f} МБ собран за {build_seconds:.1f} с")
+
+    runs = {'json': [], 'snapshot': []}
+    for _ in range(REPEATS):
+        runs['json'].append(start(json_path, ''))
+        runs['snapshot'].append(start(json_path, snapshot_path))
+    assert all(run['source'] == 'json' for run in runs['json'])
+    assert all(run['source'] == 'snapshot' for run in runs['snapshot'])
+    expected = runs['json'][0]['answers']
+    assert all(run['answers'] == expected for run in runs['json'] + runs['snapshot']), "ответы путей расходятся"
+
+    print(f"{'путь':>10} {'импорт, с':>10} {'каталог, с':>11} {'всего, с':>9} {'память, МБ':>11}")
+    for name, results in runs.items():
+        imported = statistics.median(run['import'] for run in results)
+        reload = statistics.median(run['reload'] for run in results)
+        memory = statistics.median(run['rss_mb'] for run in results)
+        print(f"{name:>10} {imported:>10.2f} {reload:>11.2f} {imported + reload:>9.2f} {memory:>11.0f}")
+
+    # Другое содержимое файла: снимок устарел, бот обязан разобрать JSON
+    with open(json_path, 'a', encoding='utf-8') as file:
+        file.write('\n')
+    stale = start(json_path, snapshot_path)
+    assert stale['source'] == 'json' and stale['answers'] == expected
+    print(f"снимок от прежнего содержимого пропущен: JSON за {stale['reload']:.2f} с")
+
+
+def main():
+    if sys.argv[1:] == ['child']:
+        return child()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            measure(size, directory)
+
+
+if __name__ == '__main__':
+    main()
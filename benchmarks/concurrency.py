@@ -0,0 +1,76 @@
+"""Пропускная способность bot.py в зависимости от CONCURRENT_UPDATES.
+
+Бот работает против локальной заглушки Bot API с задержкой ответа, каждый
+пользователь проходит путь категория → бренд → модель. Заодно проверяется,
+что апдейты одного пользователя обработаны по порядку (правки сообщения
+могут склеиться очередью исходящих запросов, но не обгоняют фото).
+
+Запуск из корня репозитория: python -m benchmarks.concurrency
+"""
+import asyncio
+import logging
+import time
+
+from telegram import Update
+
+import bot
+import callbacks
+import config
+from benchmarks.fake_bot_api import FakeBotApi, callback_update
+
+LEVELS = (1, 4, 16, 64)
+USERS = 50
+API_LATENCY = 0.05
+EXPECTED_CHAT_LOG = ['editMessageText', 'editMessageText', 'sendPhoto']
+# С очередью OUTBOUND_QUEUE правка из первого нажатия может склеиться со второй
+COALESCED_CHAT_LOG = ['editMessageText', 'sendPhoto']
+
+
+def journey() -> tuple:
+    nodes = bot.catalog.get().indexes['nodes']
+    return (
+        callbacks.encode(callbacks.CATEGORY, nodes.category('mice')),
+        callbacks.encode(callbacks.BRAND, nodes.brand('mice', 'Razer')),
+        callbacks.encode(callbacks.MODEL, nodes.model('mice', 'Razer', 'Viper V2 Pro')),
+    )
+
+
+async def run(concurrency: int) -> float:
+    api = await FakeBotApi(latency=API_LATENCY).start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url, concurrent_updates=concurrency)
+    await application.initialize()
+    await application.start()
+
+    update_id = 0
+    started = time.perf_counter()
+    # Все нажатия приходят пачкой: как будто пользователи жмут быстрее, чем бот отвечает
+    for data in journey():
+        for user_id in range(1, USERS + 1):
+            update_id += 1
+            await application.update_queue.put(Update.de_json(callback_update(update_id, user_id, data), application.bot))
+    await api.wait_for_calls('answerCallbackQuery', update_id)
+    await api.wait_for_calls('sendPhoto', USERS)
+    elapsed = time.perf_counter() - started
+
+    for user_id in range(1, USERS + 1):
+        assert api.chat_log[str(user_id)] in (EXPECTED_CHAT_LOG, COALESCED_CHAT_LOG), (user_id, api.chat_log[str(user_id)])
+
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+    return update_id / elapsed
+
+
+def main():
+    logging.disable(logging.WARNING)
+    # Меряется сам бот: лимиты Telegram на исходящие запросы заглушка не вводит
+    config.OUTBOUND_GLOBAL_RATE = config.OUTBOUND_CHAT_RATE = 0
+    bot.catalog.reload(force=True)
+    print(f"{USERS} пользователей × {len(journey())} нажатия, задержка Bot API {API_LATENCY * 1000:.0f} мс")
+    print(f"{'CONCURRENT_UPDATES':>18} {'апдейтов/с':>12}")
+    for level in LEVELS:
+        print(f"{level:>18} {asyncio.run(run(level)):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Сквозной нагрузочный прогон bot.py против заглушки Bot API.
+
+Для каждого размера синтетического каталога (в отдельном процессе, чтобы пик
+памяти не смешивался) настоящий Application из bot.py обрабатывает сценарии
+пользователей: просмотр категория → бренд → модель, рекомендации и подбор
+сетапа. Пользователи работают одновременно, каждый жмёт следующую кнопку после
+ответа на предыдущую.
+
+Результат — JSON с пропускной способностью, p50/p95/p99 по обработчикам и
+сценариям и пиком памяти. С --baseline прогон сравнивается с сохранённым:
+рост p95 собственного времени обработчиков (без ожидания Bot API) или падение
+пропускной способности больше допуска завершает процесс с кодом 1.
+
+Запуск из корня репозитория:
+    python -m benchmarks.e2e --sizes 45 10000 --output e2e.json
+    python -m benchmarks.e2e --baseline e2e.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+
+import bot
+import callbacks
+import config
+from benchmarks.fake_bot_api import FakeBotApi, callback_update, command_update
+from benchmarks.synthetic import generate_catalog
+
+SIZES = (45, 10_000, 100_000)
+JOURNEYS = ('browse', 'recommend', 'setup')
+# Изменения p95 меньше этого не считаются регрессией: шум планировщика
+NOISE_MS = 1.0
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    # Метод ближайшего ранга: значение, не превышенное в p% замеров
+    rank = lambda p: values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+    return {'count': len(values), 'p50_ms': rank(50), 'p95_ms': rank(95), 'p99_ms': rank(99)}
+
+
+def peak_memory_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def journey_steps(snapshot, rng: random.Random, journey: str) -> list:
+    nodes = snapshot.indexes['nodes']
+    category, brand, model = rng.choice(snapshot.products).key
+    if journey == 'browse':
+        return [
+            '/start',
+            callbacks.encode(callbacks.CATEGORY, nodes.category(category)),
+            callbacks.encode(callbacks.BRAND, nodes.brand(category, brand)),
+            callbacks.encode(callbacks.MODEL, nodes.model(category, brand, model)),
+        ]
+    if journey == 'recommend':
+        return [
+            '/start',
+            callbacks.ASK_PREFERENCES,
+            callbacks.encode(callbacks.PREFERENCE, rng.choice(('gaming', 'work', 'budget'))),
+            callbacks.encode(callbacks.RECOMMEND, nodes.category(category)),
+        ]
+    return [
+        '/start',
+        callbacks.SETUP_START,
+        callbacks.encode(callbacks.SETUP_GENRE, rng.choice(list(bot.GAMING_GENRES))),
+        callbacks.encode(callbacks.SETUP_HAND, rng.choice(list(bot.HAND_SIZES))),
+        callbacks.encode(callbacks.SETUP_SWITCH, rng.choice(list(bot.SWITCH_TYPES))),
+        callbacks.encode(callbacks.SETUP_BUDGET, rng.choice(list(bot.SETUP_BUDGETS))),
+    ]
+
+
+class UpdateLog(logging.Handler):
+    """Собирает JSON-строки, которые metrics пишет по каждому апдейту."""
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+async def run_users(application, snapshot, args) -> tuple:
+    update_ids = iter(range(1, 10 ** 9))
+    journey_times = defaultdict(list)
+
+    async def send(user_id: int, step: str):
+        if step.startswith('/'):
+            data = command_update(next(update_ids), user_id, step)
+        else:
+            data = callback_update(next(update_ids), user_id, step)
+        update = Update.de_json(data, application.bot)
+        # Тот же путь, что и у апдейтов из очереди: лимит параллельности и очередь пользователя
+        await application.update_processor.process_update(update, application.process_update(update))
+
+    async def user(user_id: int):
+        rng = random.Random(args.seed * 100_003 + user_id)
+        for _ in range(args.repeat):
+            for journey in rng.sample(JOURNEYS, len(JOURNEYS)):
+                started = time.perf_counter()
+                for step in journey_steps(snapshot, rng, journey):
+                    await send(user_id, step)
+                    if args.think:
+                        await asyncio.sleep(args.think)
+                journey_times[journey].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(1, args.users + 1)))
+    return time.perf_counter() - started, journey_times
+
+
+async def run_size(size: int, args) -> dict:
+    data = generate_catalog(size, args.seed)
+    with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as file:
+        json.dump(data, file, ensure_ascii=False)
+    try:
+        bot.catalog.path = file.name
+        started = time.perf_counter()
+        assert bot.catalog.reload(force=True), "каталог не загрузился"
+        load_seconds = time.perf_counter() - started
+    finally:
+        os.unlink(file.name)
+    snapshot = bot.catalog.get()
+    memory_after_load = peak_memory_mb()
+
+    api = await FakeBotApi(
+        latency=args.latency, photo_latency=args.photo_latency,
+        failure_rate=args.failure_rate, seed=args.seed
+    ).start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url,
+                                        concurrent_updates=args.concurrency)
+    await application.initialize()
+    await application.start()
+
+    update_log = UpdateLog()
+    logging.getLogger('metrics').addHandler(update_log)
+    elapsed, journey_times = await run_users(application, snapshot, args)
+    logging.getLogger('metrics').removeHandler(update_log)
+
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+
+    by_handler = defaultdict(list)
+    for record in update_log.records:
+        by_handler[record['handler']].append(record)
+    handlers = {}
+    for handler, records in sorted(by_handler.items()):
+        handlers[handler] = {
+            'total': percentiles([record['total_ms'] for record in records]),
+            # Собственное время обработчика: каталог, рендеринг и скоринг без ожидания Bot API,
+            # включая очереди к нему (слоты рассылки, правки в очереди, лимиты чатов), и без очереди пула потоков
+            'own': percentiles([record['total_ms'] - record['telegram_ms'] - record['queued_ms'] for record in records]),
+            'errors': sum(record['outcome'] != 'ok' for record in records),
+        }
+
+    return {
+        'size': size,
+        'products': len(snapshot.products),
+        'catalog_load_s': round(load_seconds, 3),
+        'updates': len(update_log.records),
+        'errors': sum(record['outcome'] != 'ok' for record in update_log.records),
+        'duration_s': round(elapsed, 3),
+        'throughput_per_s': round(len(update_log.records) / elapsed, 1),
+        'peak_memory_after_load_mb': round(memory_after_load, 1),
+        'peak_memory_mb': round(peak_memory_mb(), 1),
+        'api_calls': dict(api.calls),
+        'handlers': handlers,
+        'journeys': {journey: percentiles(times) for journey, times in sorted(journey_times.items())},
+    }
+
+
+def child(args):
+    # Остальное логирование глушим, метрики по апдейтам нужны только в UpdateLog
+    logging.getLogger().setLevel(logging.CRITICAL)
+    logging.getLogger('metrics').setLevel(logging.INFO)
+    logging.getLogger('metrics').propagate = False
+    config.METRICS_SAMPLE_RATE = 1.0
+    config.METRICS_LOG_UPDATES = True
+    # Синтетические пользователи жмут быстрее живых: лимиты Telegram заглушка не вводит
+    config.OUTBOUND_GLOBAL_RATE = config.OUTBOUND_CHAT_RATE = 0
+    result = asyncio.run(run_size(args.size, args))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def run_in_subprocess(size: int, argv: list) -> dict:
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.e2e', '--child', '--size', str(size)] + argv,
+        stdout=subprocess.PIPE, check=True
+    )
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+
+def print_run(run: dict):
+    print(f"\n{run['products']} товаров: каталог за {run['catalog_load_s']:.2f} с, "
+          f"{run['updates']} апдейтов за {run['duration_s']:.2f} с ({run['throughput_per_s']:.0f}/с), "
+          f"ошибок {run['errors']}, пик памяти {run['peak_memory_mb']:.0f} МБ")
+    print(f"  {'обработчик':24} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'своё p95':>9}")
+    for handler, stats in run['handlers'].items():
+        total, own = stats['total'], stats['own']
+        print(f"  {handler:24} {total['count']:>5} {total['p50_ms']:>8.1f} {total['p95_ms']:>8.1f} "
+              f"{total['p99_ms']:>8.1f} {own['p95_ms']:>9.2f}")
+    for journey, stats in run['journeys'].items():
+        print(f"  сценарий {journey:15} {stats['count']:>5} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f}")
+
+
+def compare(runs: list, baseline: dict, tolerance: float) -> list:
+    """Регрессии относительно сохранённого прогона: список строк с описанием."""
+    regressions = []
+    previous_runs = {run['size']: run for run in baseline['runs']}
+    for run in runs:
+        previous = previous_runs.get(run['size'])
+        if previous is None:
+            continue
+        if run['throughput_per_s'] < previous['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{run['size']}: пропускная способность "
+                               f"{previous['throughput_per_s']} → {run['throughput_per_s']}/с")
+        for handler, stats in run['handlers'].items():
+            before = previous['handlers'].get(handler, {}).get('own', {}).get('p95_ms')
+            after = stats['own'].get('p95_ms')
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > NOISE_MS:
+                regressions.append(f"{run['size']}: {handler} своё p95 {before:.2f} → {after:.2f} мс")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=2, help="сколько раз каждый пользователь проходит все сценарии")
+    parser.add_argument('--think', type=float, default=0.0, help="пауза пользователя между нажатиями, с")
+    parser.add_argument('--concurrency', type=int, default=64, help="CONCURRENT_UPDATES бота")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка Bot API, с")
+    parser.add_argument('--photo-latency', type=float, default=None, help="задержка sendPhoto, с")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля отправок сообщений с ошибкой 400")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='e2e_results.json')
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="допустимый рост p95 / падение пропускной способности")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(args)
+        return
+
+    workload = {
+        'users': args.users, 'repeat': args.repeat, 'think': args.think, 'concurrency': args.concurrency,
+        'latency': args.latency, 'photo_latency': args.photo_latency, 'failure_rate': args.failure_rate,
+        'seed': args.seed,
+    }
+    baseline = None
+    if args.baseline:
+        # Читаем до прогона: --output может указывать на тот же файл
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    argv = [arg for key, value in workload.items() if value is not None
+            for arg in (f"--{key.replace('_', '-')}", str(value))]
+    runs = []
+    for size in args.sizes:
+        run = run_in_subprocess(size, argv)
+        print_run(run)
+        runs.append(run)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'workload': workload, 'runs': runs},
+                  file, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if baseline is not None:
+        regressions = compare(runs, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Регрессий относительно базового прогона нет")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Время построения FacetIndex и вычисления экрана фильтров.
+
+Экран фильтров — это число подходящих товаров, счётчики для каждого варианта
+каждого фасета и первые товары списка; всё это пересечения битовых множеств.
+
+Запуск из корня репозитория: python -m benchmarks.facets
+"""
+import logging
+import random
+import time
+
+from benchmarks.synthetic import build_snapshot
+from facets import FacetIndex
+
+SIZES = (45, 10_000, 100_000)
+SELECTIONS = 200
+RESULTS = 20
+
+
+def random_selections(index, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    selections = []
+    for _ in range(count):
+        facets = rng.sample(index.facets, rng.randint(0, len(index.facets)))
+        selections.append({facet.code: rng.randrange(len(facet.options)) for facet in facets})
+    return [index.clean(selection) for selection in selections]
+
+
+def filter_screen(index, selection: dict):
+    index.count(selection)
+    for facet in index.facets:
+        index.option_counts(selection, facet.code)
+    index.first(selection, RESULTS)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'товаров':>8} {'категория':>10} {'в категории':>12} {'построение, мс':>15} {'экран, мкс':>11}")
+    for size in SIZES:
+        snapshot = build_snapshot(size)
+        started = time.perf_counter()
+        facet_index = FacetIndex(snapshot)
+        build_ms = (time.perf_counter() - started) * 1000
+        for category, index in facet_index.categories.items():
+            selections = random_selections(index, SELECTIONS)
+            started = time.perf_counter()
+            for selection in selections:
+                filter_screen(index, selection)
+            screen_us = (time.perf_counter() - started) / len(selections) * 1_000_000
+            print(f"{size:>8} {category:>10} {len(index.products):>12} {build_ms:>15.0f} {screen_us:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+Понимает ровно те методы, которые вызывает bot.py, отвечает правдоподобными
+объектами и умеет добавлять задержку и случайные ошибки. По желанию ведёт
+себя строже, как настоящий Telegram: ограничивает частоту сообщений в чат
+(429 с retry_after), отвергает правку, которая ничего не меняет, и, как
+Telegram, сам скачивает фото, переданные ссылкой.
+"""
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
+import httpx
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': True}
+
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+
+class FakeBotApi:
+    def __init__(self, latency: float = 0.0, photo_latency: float = None, failure_rate: float = 0.0, seed: int = 0,
+                 chat_rate: float = 0.0, chat_burst: int = 1, check_modified: bool = False, fetch_photos: bool = False):
+        self.latency = latency
+        self.photo_latency = latency if photo_latency is None else photo_latency
+        self.failure_rate = failure_rate
+        # chat_rate сообщений в секунду на чат с запасом chat_burst; 0 — без ограничения
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.check_modified = check_modified
+        # Скачивать фото по ссылкам, как это делает Telegram; bytes_fetched — сколько скачано
+        self.fetch_photos = fetch_photos
+        self.bytes_fetched = 0
+        self._http = None
+        self._chat_tokens = {}  # chat_id -> (токены, время)
+        self._contents = {}  # (chat_id, message_id) -> (текст, клавиатура)
+        self.calls = Counter()
+        # Успешно выполненные методы: calls считает и запросы, получившие ошибку
+        self.delivered = Counter()
+        self.chat_log = defaultdict(list)
+        self.requests = []  # (метод, параметры) в порядке прихода
+        self.bytes_received = 0
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def wait_for_calls(self, method: str, count: int, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while self.calls[method] < count:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{method}: {self.calls[method]} из {count}")
+            await asyncio.sleep(0.005)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                _, path, _ = lines[0].split(' ', 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.bytes_received += len(head) + len(body)
+
+                status, payload = await self._dispatch(path.rsplit('/', 1)[-1], headers, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _params(self, headers: dict, body: bytes) -> dict:
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        if content_type.startswith('multipart/form-data'):
+            return self._multipart(content_type, body)
+        return {}
+
+    @staticmethod
+    def _multipart(content_type: str, body: bytes) -> dict:
+        boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+        params = {}
+        for part in body.split(b'--' + boundary):
+            if b'\r\n\r\n' not in part:
+                continue
+            head, value = part.split(b'\r\n\r\n', 1)
+            head = head.decode('latin-1')
+            if 'name="' not in head or 'filename=' in head:
+                continue
+            name = head.split('name="', 1)[1].split('"', 1)[0]
+            params[name] = value.rstrip(b'\r\n').decode('utf-8', 'replace')
+        return params
+
+    async def _dispatch(self, method: str, headers: dict, body: bytes):
+        params = self._params(headers, body)
+        self.calls[method] += 1
+        self.requests.append((method, params))
+        if 'chat_id' in params:
+            self.chat_log[str(params['chat_id'])].append(method)
+
+        chat_id = params.get('chat_id')
+        if self.chat_rate and chat_id is not None and method in MESSAGE_METHODS | {'sendMediaGroup'}:
+            retry_after = self._throttle(str(chat_id))
+            if retry_after:
+                self.calls['flood'] += 1
+                return 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': retry_after},
+                             'description': f'Too Many Requests: retry after {retry_after}'}
+        if self.check_modified and method == 'editMessageText':
+            content = (params.get('text', ''), str(params.get('reply_markup')))
+            if self._contents.get((str(chat_id), str(params.get('message_id')))) == content:
+                self.calls['not_modified'] += 1
+                return 400, {'ok': False, 'error_code': 400,
+                             'description': 'Bad Request: message is not modified: specified new message content '
+                                            'and reply markup are exactly the same as a current content and '
+                                            'reply markup of the message'}
+
+        if self.fetch_photos and method in ('sendPhoto', 'sendMediaGroup'):
+            if method == 'sendMediaGroup':
+                urls = [item.get('media', '') for item in json.loads(params.get('media', '[]'))]
+            else:
+                urls = [params.get('photo', '')]
+            await self._fetch_photos(urls)
+
+        delay = self.photo_latency if method in ('sendPhoto', 'sendMediaGroup') else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+
+        if method in MESSAGE_METHODS | {'sendMediaGroup'} and self._rng.random() < self.failure_rate:
+            self.calls['failed'] += 1
+            return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: fake failure'}
+
+        self.delivered[method] += 1
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+        if method in MESSAGE_METHODS:
+            return 200, {'ok': True, 'result': self._message(method, params)}
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            return 200, {'ok': True, 'result': [
+                self._message('sendPhoto', {**params, 'photo': item.get('media', ''), 'caption': item.get('caption', '')})
+                for item in media
+            ]}
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': []}
+        return 200, {'ok': True, 'result': True}
+
+    async def _fetch_photos(self, urls: list):
+        urls = [url for url in urls if isinstance(url, str) and url.startswith('http')]
+        if not urls:
+            return
+        if self._http is None:
+            self._http = httpx.AsyncClient()
+        responses = await asyncio.gather(*(self._http.get(url) for url in urls), return_exceptions=True)
+        self.bytes_fetched += sum(len(response.content) for response in responses if isinstance(response, httpx.Response))
+
+    def _throttle(self, chat_id: str) -> int:
+        """0, если сообщение в чат можно отправить, иначе retry_after в секундах."""
+        now = time.monotonic()
+        tokens, updated = self._chat_tokens.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        if tokens < 1:
+            self._chat_tokens[chat_id] = (tokens, now)
+            return math.ceil((1 - tokens) / self.chat_rate)
+        self._chat_tokens[chat_id] = (tokens - 1, now)
+        return 0
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+        if self.check_modified and method in ('sendMessage', 'editMessageText'):
+            self._contents[(str(chat_id), str(message['message_id']))] = (
+                params.get('text', ''), str(params.get('reply_markup'))
+            )
+        if method == 'sendPhoto':
+            file_id = f"photo-{abs(hash(params.get('photo', ''))) % 10 ** 12}"
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 800, 'height': 600}]
+            message['caption'] = params.get('caption', '')
+        else:
+            message['text'] = params.get('text', '')
+        return message
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def command_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}"},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+        },
+    }
@@ -0,0 +1,76 @@
+"""Время подбора сетапа SetupIndex.solve и сверка с полным перебором.
+
+На небольшом каталоге оценки k лучших сетапов сравниваются с перебором всех
+сочетаний; на больших печатается время одного подбора для разных бюджетов.
+
+Запуск из корня репозитория: python -m benchmarks.gaming_setup
+"""
+import itertools
+import logging
+import random
+import statistics
+import time
+
+from benchmarks.synthetic import build_snapshot
+from catalog import MouseSize
+from gaming_setup import GENRE_PROFILES, SetupIndex
+
+SIZES = (45, 3_000, 30_000, 100_000)
+CHECK_SIZE = 240
+BUDGETS = (None, 150, 250, 400, 600, 900)
+QUERIES = 50
+VARIANTS = 3
+
+
+def random_query(rng: random.Random) -> tuple:
+    return (rng.choice(list(GENRE_PROFILES)), rng.choice([size.value for size in MouseSize]),
+            rng.choice(['linear', 'tactile', 'clicky']))
+
+
+def brute_force(index: SetupIndex, genre: str, hand_size: str, switch_feel: str, budget, k: int) -> list:
+    options = [
+        list(zip(features.scores(component, GENRE_PROFILES[genre], MouseSize(hand_size), switch_feel),
+                 features.price))
+        for component, features in index.components.items()
+    ]
+    totals = [
+        sum(score for score, _ in combination)
+        for combination in itertools.product(*options)
+        if budget is None or sum(price for _, price in combination) <= budget
+    ]
+    return [round(total, 4) for total in sorted(totals, reverse=True)[:k]]
+
+
+def check(rng: random.Random):
+    index = build_snapshot(CHECK_SIZE, {'setup': SetupIndex}).indexes['setup']
+    for _ in range(QUERIES):
+        query = random_query(rng)
+        budget = rng.choice(BUDGETS)
+        found = [setup.score for setup in index.solve(*query, budget, VARIANTS)]
+        expected = brute_force(index, *query, budget, VARIANTS)
+        assert all(abs(a - b) < 1e-3 for a, b in zip(found, expected)) and len(found) == len(expected), \
+            (query, budget, found, expected)
+    print(f"{CHECK_SIZE} товаров: {QUERIES} подборов совпали с полным перебором")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    rng = random.Random(1)
+    check(rng)
+    for size in SIZES:
+        snapshot = build_snapshot(size, {'setup': SetupIndex})
+        index = snapshot.indexes['setup']
+        results = []
+        for budget in BUDGETS:
+            timings = []
+            for _ in range(QUERIES):
+                query = random_query(rng)
+                started = time.perf_counter()
+                index.solve(*query, budget, VARIANTS)
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append(f"{budget or 'без бюджета'}: {statistics.median(timings):.2f}/{max(timings):.2f}")
+        print(f"{size} товаров, мс (медиана/максимум): " + ", ".join(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Накладные расходы инструментирования на один апдейт.
+
+Сравнивает пустой обработчик с тем же обработчиком под metrics.instrument
+(с разбивкой времени и без неё) и печатает пример вывода /metrics.
+
+Запуск из корня репозитория: python -m benchmarks.metrics
+"""
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import config
+import metrics
+
+UPDATES = 100_000
+
+
+async def handler(update, context):
+    metrics.record_blocking(0.0)
+
+
+async def per_update(function) -> float:
+    update = SimpleNamespace(update_id=1)
+    context = SimpleNamespace(application=SimpleNamespace(update_queue=asyncio.Queue()))
+    started = time.perf_counter()
+    for _ in range(UPDATES):
+        await function(update, context)
+    return (time.perf_counter() - started) / UPDATES * 1_000_000
+
+
+async def run():
+    plain = await per_update(handler)
+    config.METRICS_SAMPLE_RATE = 1.0
+    timed = await per_update(metrics.instrument(handler))
+    config.METRICS_SAMPLE_RATE = 0.01
+    sampled = await per_update(metrics.instrument(handler))
+    print(f"без метрик: {plain:.2f} мкс, с разбивкой времени: {timed:.2f} мкс, "
+          f"выборка 1%: {sampled:.2f} мкс на апдейт")
+    print('\n'.join(metrics.render().splitlines()[:12]))
+
+
+def main():
+    logging.disable(logging.WARNING)
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
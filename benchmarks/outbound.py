@@ -0,0 +1,98 @@
+"""Очередь исходящих запросов OUTBOUND_QUEUE против прямых вызовов Bot API.
+
+Пользователи нетерпеливо жмут кнопки по два-три раза подряд, а заглушка
+Bot API ведёт себя как настоящий Telegram: ограничивает частоту сообщений
+в чат (429 с retry_after) и отвергает правку, которая ничего не меняет.
+Для обоих режимов печатаются вызовы Bot API, отказы, доставленные фото
+и время до отправки последнего запроса.
+
+Запуск из корня репозитория: python -m benchmarks.outbound
+"""
+import asyncio
+import logging
+import random
+import time
+
+from telegram import Update
+
+import bot
+import callbacks
+import config
+import metrics
+from benchmarks.fake_bot_api import FakeBotApi, callback_update
+
+USERS = 30
+API_LATENCY = 0.05
+CHAT_RATE = 1.0
+CHAT_BURST = 5
+MAX_TAPS = 3
+
+
+def taps(rng: random.Random) -> list:
+    """Нажатия одного пользователя: категорию и бренд жмёт по 1–3 раза, модель — один."""
+    nodes = bot.catalog.get().indexes['nodes']
+    category = callbacks.encode(callbacks.CATEGORY, nodes.category('mice'))
+    brand = callbacks.encode(callbacks.BRAND, nodes.brand('mice', 'Razer'))
+    model = callbacks.encode(callbacks.MODEL, nodes.model('mice', 'Razer', 'Viper V2 Pro'))
+    return [category] * rng.randint(1, MAX_TAPS) + [brand] * rng.randint(1, MAX_TAPS) + [model]
+
+
+async def run(queue: bool) -> dict:
+    config.OUTBOUND_QUEUE = queue
+    api = await FakeBotApi(latency=API_LATENCY, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST,
+                           check_modified=True).start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url, concurrent_updates=64)
+    await application.initialize()
+    await application.start()
+    saved_before = metrics.API_CALLS_SAVED.total()
+    retries_before = metrics.API_RETRIES.total()
+
+    rng = random.Random(1)
+    journeys = {user_id: taps(rng) for user_id in range(1, USERS + 1)}
+    update_id = 0
+    started = time.perf_counter()
+    # Повторные нажатия приходят раньше, чем бот успевает ответить на первое
+    for step in range(max(len(journey) for journey in journeys.values())):
+        for user_id, journey in journeys.items():
+            if step < len(journey):
+                update_id += 1
+                update = callback_update(update_id, user_id, journey[step])
+                await application.update_queue.put(Update.de_json(update, application.bot))
+    await api.wait_for_calls('answerCallbackQuery', update_id)
+    # stop дожидается обработчиков, shutdown — отложенных правок
+    await application.stop()
+    await application.shutdown()
+    elapsed = time.perf_counter() - started
+    await api.stop()
+
+    calls = sum(count for method, count in api.calls.items()
+                if method not in ('getMe', 'answerCallbackQuery', 'flood', 'not_modified', 'failed'))
+    return {
+        'taps': update_id,
+        'calls': calls,
+        'flood': api.calls['flood'],
+        'not_modified': api.calls['not_modified'],
+        'photos': api.delivered['sendPhoto'],
+        'saved': metrics.API_CALLS_SAVED.total() - saved_before,
+        'retries': metrics.API_RETRIES.total() - retries_before,
+        'elapsed': elapsed,
+    }
+
+
+def main():
+    # Без очереди ошибки 429 и «not modified» ожидаемы: их трейсбеки не печатаем
+    logging.disable(logging.CRITICAL)
+    bot.catalog.reload(force=True)
+    print(f"{USERS} пользователей, до {MAX_TAPS} нажатий на кнопку, лимит чата {CHAT_RATE:.0f}/с "
+          f"(запас {CHAT_BURST}), задержка Bot API {API_LATENCY * 1000:.0f} мс")
+    print(f"{'режим':>10} {'нажатий':>8} {'вызовов':>8} {'429':>5} {'not modified':>13} {'фото':>5} "
+          f"{'сэкономлено':>12} {'повторов':>9} {'время, с':>9}")
+    for queue in (False, True):
+        result = asyncio.run(run(queue))
+        print(f"{'очередь' if queue else 'напрямую':>10} {result['taps']:>8} {result['calls']:>8} "
+              f"{result['flood']:>5} {result['not_modified']:>13} {result['photos']:>5}/{USERS:<3} "
+              f"{result['saved']:>8.0f} {result['retries']:>9.0f} {result['elapsed']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
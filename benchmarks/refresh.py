@@ -0,0 +1,278 @@
+"""Обновление цен PriceRefresher против локального магазина.
+
+Поднимает HTTP-сервер, который отдаёт страницы товаров из fixtures/product_pages
+с ETag и Last-Modified, и прогоняет проходы обновления над копией tech_data.json:
+- страницы совпадают с каталогом — ничего не меняется;
+- повторный проход получает только 304;
+- изменённые страницы точечно меняют свои товары, версии и экраны остальных
+  категорий сохраняются;
+- цена в чужой валюте не применяется, недоступная страница не ломает проход;
+- после перезагрузки файла обновления возвращаются сразу, без загрузки страниц.
+Затем сравнивается время полной перезагрузки синтетического каталога и точечного обновления.
+
+Запуск из корня репозитория: python -m benchmarks.refresh
+"""
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bot
+from benchmarks.synthetic import generate_catalog
+from catalog import CatalogStore
+from refresh import PriceRefresher
+from similar import IncrementalSimilarity
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'product_pages')
+TEMPLATES = {'mice': 'microdata.html', 'keyboards': 'json_ld.html', 'headphones': 'table.html'}
+PAGE_LATENCY = 0.02
+CONCURRENCY = 4
+SIZES = (10_000, 100_000)
+PATCHED_PRODUCTS = 10
+
+
+class ShopServer:
+    """Страницы товаров с условными ответами: 304 на совпавший ETag или не изменившуюся дату."""
+
+    def __init__(self):
+        self.pages = {}  # путь -> (html, etag, last_modified)
+        self.broken = set()
+        self.statuses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def publish(self, path: str, html: str):
+        body = html.encode()
+        if path in self.pages and self.pages[path][0] == body:
+            return
+        # Дата с точностью до секунды: у изменённой страницы она должна отличаться и от прошлой
+        modified = time.time() + len(self.pages) + 1 if path in self.pages else time.time()
+        self.pages[path] = (body, f'"{hashlib.md5(body).hexdigest()[:16]}"',
+                            email.utils.formatdate(modified, usegmt=True))
+
+    def take_statuses(self) -> dict:
+        with self._lock:
+            statuses, self.statuses = self.statuses, []
+        return {status: statuses.count(status) for status in sorted(set(statuses))}
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        shop = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with shop._lock:
+                    shop.in_flight += 1
+                    shop.max_in_flight = max(shop.max_in_flight, shop.in_flight)
+                try:
+                    time.sleep(PAGE_LATENCY)
+                    self._respond()
+                finally:
+                    with shop._lock:
+                        shop.in_flight -= 1
+
+            def _respond(self):
+                page = shop.pages.get(self.path)
+                if page is None or self.path in shop.broken:
+                    return self._send(404 if page is None else 500, b'')
+                body, etag, modified = page
+                match = self.headers.get('If-None-Match')
+                since = self.headers.get('If-Modified-Since')
+                if match == etag or match is None and since and (
+                        email.utils.parsedate_to_datetime(since) >= email.utils.parsedate_to_datetime(modified)):
+                    return self._send(304, b'', etag, modified)
+                self._send(200, body, etag, modified)
+
+            def _send(self, status: int, body: bytes, etag: str = None, modified: str = None):
+                with shop._lock:
+                    shop.statuses.append(status)
+                self.send_response(status)
+                if etag:
+                    self.send_header('ETag', etag)
+                    self.send_header('Last-Modified', modified)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def render_page(template: str, title: str, price: str, spec_name: str, spec_value: str) -> str:
+    with open(os.path.join(FIXTURES, template), 'r', encoding='utf-8') as file:
+        html = file.read()
+    for name, value in (('title', title), ('price', price), ('spec_name', spec_name), ('spec_value', spec_value)):
+        html = html.replace('{{' + name + '}}', value)
+    return html
+
+
+def index_builders() -> dict:
+    # Свой строитель похожих товаров: у бота он помнит прошлый индекс своего каталога
+    return dict(bot.catalog.index_builders, similar=IncrementalSimilarity())
+
+
+def check(directory: str):
+    with open('tech_data.json', 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    shop = ServerPages(ShopServer(), data)
+    path = os.path.join(directory, 'tech_data.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+
+    store = CatalogStore(path, index_builders=index_builders())
+    store.reload()
+    refresher = PriceRefresher(store, concurrency=CONCURRENCY, timeout=5)
+
+    started = time.perf_counter()
+    assert refresher.run() == 0
+    statuses = shop.server.take_statuses()
+    print(f"первый проход: {len(shop.products)} страниц за {time.perf_counter() - started:.2f} с, "
+          f"ответы {statuses}, одновременно до {shop.server.max_in_flight} запросов")
+    assert statuses == {200: len(shop.products)}
+    assert 1 < shop.server.max_in_flight <= CONCURRENCY
+
+    started = time.perf_counter()
+    assert refresher.run() == 0
+    statuses = shop.server.take_statuses()
+    print(f"повторный проход: за {time.perf_counter() - started:.2f} с, ответы {statuses}")
+    assert statuses == {304: len(shop.products)}
+
+    before = store.get()
+    mouse, keyboard, other_keyboard = shop.first('mice'), shop.first('keyboards'), shop.last('keyboards')
+    render = before.indexes['render']
+    render.product_card(*mouse)
+    render.product_card(*keyboard)
+    shop.set_price(keyboard, '111.50')
+    shop.set_spec(other_keyboard, 'Обновлено магазином')
+    shop.set_price(shop.foreign, '9990')
+
+    assert refresher.run() == 2
+    statuses = shop.server.take_statuses()
+    after = store.get()
+    print(f"изменены 3 страницы: ответы {statuses}, версия каталога {before.version} → {after.version}")
+    assert statuses == {200: 3, 304: len(shop.products) - 3}
+    assert after.product(*keyboard).price == 111.5 and after.product(*keyboard).price_text == '$111.50'
+    assert after.product(*other_keyboard).specs[shop.spec_names[other_keyboard]] == 'Обновлено магазином'
+    assert after.product(*shop.foreign) is before.product(*shop.foreign), "цена в рублях не должна применяться"
+    assert after.product(*mouse) is before.product(*mouse)
+    assert after.category_version('keyboards') == after.version
+    assert after.category_version('mice') == before.category_version('mice')
+    render = after.indexes['render']
+    render.product_card(*mouse)
+    assert (render.hits, render.misses) == (1, 0), "экран нетронутого товара должен перейти в новый кэш"
+    assert '$111.50' in render.product_card(*keyboard)[0]
+
+    mouse_price = shop.prices[mouse]
+    shop.server.broken.add(shop.paths[mouse])
+    shop.set_price(mouse, '1')
+    assert refresher.run() == 0
+    assert store.get().product(*mouse).price == before.product(*mouse).price
+    print(f"страница недоступна: ответы {shop.server.take_statuses()}, товар не изменён")
+    shop.server.broken.clear()
+    shop.set_price(mouse, mouse_price)
+
+    store.add_reload_listener(refresher.reapply)
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    store.reload()
+    assert store.get().product(*keyboard).price == 111.5, "обновления должны вернуться сразу после перезагрузки"
+    assert refresher.run() == 0
+    statuses = shop.server.take_statuses()
+    print(f"после перезагрузки файла: обновления применены заново, следующий проход — ответы {statuses}")
+    assert statuses == {304: len(shop.products)}
+    refresher.close()
+    shop.server.close()
+
+
+class ServerPages:
+    """Страницы магазина для товаров каталога: вначале с теми же ценами и характеристиками."""
+
+    def __init__(self, server: ShopServer, data: dict):
+        self.server = server
+        self.products = []
+        self.paths, self.prices, self.spec_names, self.spec_values, self.templates = {}, {}, {}, {}, {}
+        for category, brands in data.items():
+            for brand, models in brands.items():
+                for model, raw in models.items():
+                    key = (category, brand, model)
+                    self.products.append(key)
+                    self.paths[key] = f"/p/{len(self.products)}"
+                    self.prices[key] = raw['price'].replace('$', '')
+                    self.spec_names[key], self.spec_values[key] = next(iter(raw['specs'].items()))
+                    self.templates[key] = TEMPLATES[category]
+                    raw['source_url'] = server.url(self.paths[key])
+        # У одного товара страница в рублях
+        self.foreign = self.last('mice')
+        self.templates[self.foreign] = 'foreign_currency.html'
+        for key in self.products:
+            self._publish(key)
+
+    def first(self, category: str) -> tuple:
+        return next(key for key in self.products if key[0] == category)
+
+    def last(self, category: str) -> tuple:
+        return [key for key in self.products if key[0] == category][-1]
+
+    def set_price(self, key: tuple, price: str):
+        self.prices[key] = price
+        self._publish(key)
+
+    def set_spec(self, key: tuple, value: str):
+        self.spec_values[key] = value
+        self._publish(key)
+
+    def _publish(self, key: tuple):
+        self.server.publish(self.paths[key], render_page(
+            self.templates[key], f"{key[1]} {key[2]}", self.prices[key], self.spec_names[key], self.spec_values[key]
+        ))
+
+
+def patch_timing(size: int, directory: str):
+    path = os.path.join(directory, f'catalog_{size}.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(generate_catalog(size), file, ensure_ascii=False)
+    store = CatalogStore(path, index_builders=index_builders())
+    store.reload()
+
+    started = time.perf_counter()
+    store.reload(force=True)
+    reload_seconds = time.perf_counter() - started
+
+    products = list(store.get().iter_products())[::size // PATCHED_PRODUCTS][:PATCHED_PRODUCTS]
+    updates = {product.key: {'price': f"${(product.price or 100) + 1:.0f}"} for product in products}
+    started = time.perf_counter()
+    assert store.apply_updates(updates)
+    patch_seconds = time.perf_counter() - started
+    print(f"{size} товаров: полная перезагрузка {reload_seconds:.2f} с, "
+          f"точечное обновление {PATCHED_PRODUCTS} товаров {patch_seconds:.2f} с")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        check(directory)
+        for size in SIZES:
+            patch_timing(size, directory)
+
+
+if __name__ == '__main__':
+    main()
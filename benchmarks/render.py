@@ -0,0 +1,98 @@
+"""Процессорное время на один callback с кэшем отрисовки и без него.
+
+Обработчики bot.py вызываются напрямую на синтетическом каталоге, вместо Bot API —
+заглушки без сети, так что меряется только работа самого бота. «Без кэша» —
+RenderCache, который строит экран заново при каждом обращении, как до кэша.
+
+Запуск из корня репозитория: python -m benchmarks.render
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+import bot
+import callbacks
+from benchmarks.synthetic import generate_catalog
+from render import RenderCache
+
+SIZE = 10_000
+CALLBACKS = 3_000
+
+
+class StubQuery:
+    def __init__(self, data: str):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=1)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+class StubBot:
+    async def send_photo(self, *args, **kwargs):
+        pass
+
+
+def callback_mix(snapshot, count: int, seed: int = 0) -> list:
+    # Типичная прогулка по каталогу: бренды и карточки товаров, изредка список брендов
+    nodes = snapshot.indexes['nodes']
+    rng = random.Random(seed)
+    brands = list(snapshot.models)
+    products = snapshot.products
+    mix = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.1:
+            category = rng.choice(list(snapshot.brands))
+            mix.append(callbacks.encode(callbacks.CATEGORY, nodes.category(category)))
+        elif roll < 0.4:
+            mix.append(callbacks.encode(callbacks.BRAND, nodes.brand(*rng.choice(brands))))
+        else:
+            mix.append(callbacks.encode(callbacks.MODEL, nodes.model(*rng.choice(products).key)))
+    return mix
+
+
+async def replay(mix: list) -> float:
+    context = SimpleNamespace(bot=StubBot(), bot_data={}, user_data={})
+    started = time.process_time()
+    for data in mix:
+        action, args = callbacks.decode(data)
+        await bot.CALLBACK_ROUTES[action](SimpleNamespace(callback_query=StubQuery(data)), context, *args)
+    return (time.process_time() - started) / len(mix) * 1_000_000
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tech_data.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(generate_catalog(SIZE), file, ensure_ascii=False)
+        bot.catalog.path = path
+        bot.catalog.reload(force=True)
+
+    snapshot = bot.catalog.get()
+    mix = callback_mix(snapshot, CALLBACKS)
+
+    memo = RenderCache._memo
+    RenderCache._memo = lambda self, key, build: build()
+    uncached = asyncio.run(replay(mix))
+    RenderCache._memo = memo
+
+    asyncio.run(replay(mix))  # прогрев кэша
+    cached = asyncio.run(replay(mix))
+
+    print(f"{len(snapshot.products)} товаров, {len(mix)} callback'ов (категории/бренды/карточки)")
+    print(f"без кэша: {uncached:8.1f} мкс CPU на callback")
+    print(f"с кэшем:  {cached:8.1f} мкс CPU на callback ({uncached / cached:.1f}×)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Сравнение векторного ScoringEngine с поштучным циклом.
+
+Запуск из корня репозитория: python -m benchmarks.scoring
+"""
+import logging
+import time
+
+from benchmarks.synthetic import build_snapshot
+from scoring import ScoringEngine, profile_weight, score_product
+
+SIZES = (45, 10_000, 100_000)
+REPEATS = 20
+
+
+def loop_top(snapshot, usage, category=None, k=3):
+    products = snapshot.by_category.get(category, ()) if category else snapshot.products
+    weight = profile_weight(usage)
+    scored = [(product, round(score_product(product, weight), 2)) for product in products]
+    return sorted(scored, key=lambda item: item[1], reverse=True)[:k]
+
+
+def measure(fn, repeats=REPEATS):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'товаров':>8} {'запрос':>18} {'цикл, мс':>10} {'numpy, мс':>10} {'ускорение':>10}")
+    for size in SIZES:
+        snapshot = build_snapshot(size, {'scoring': ScoringEngine})
+        engine = snapshot.indexes['scoring']
+        for usage in ('gaming', 'work', 'budget'):
+            for category in (None, 'mice'):
+                expected = loop_top(snapshot, usage, category)
+                assert engine.top(usage, category) == expected, (size, usage, category)
+                repeats = REPEATS if size < 100_000 else 3
+                loop_ms = measure(lambda: loop_top(snapshot, usage, category), repeats)
+                engine_ms = measure(lambda: engine.top(usage, category), repeats)
+                label = f"{usage}/{category or 'all'}"
+                print(f"{size:>8} {label:>18} {loop_ms:>10.3f} {engine_ms:>10.3f} {loop_ms / engine_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Время построения SearchIndex и ответа на типичные запросы.
+
+Запуск из корня репозитория: python -m benchmarks.search
+"""
+import logging
+import time
+
+from benchmarks.synthetic import build_snapshot
+from search import SearchIndex
+
+SIZES = (45, 10_000, 100_000)
+REPEATS = 50
+QUERIES = (
+    'razer',
+    'viper v2 pro',
+    'разер вайпер',
+    'кфяук',
+    'logitech g pro x superlight',
+    'беспроводная игровая мышь',
+    'механические красные',
+    'hyperx clod',
+    'dpi 16000',
+)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    for size in SIZES:
+        started = time.perf_counter()
+        snapshot = build_snapshot(size, {'search': SearchIndex})
+        index = snapshot.indexes['search']
+        print(f"{size} товаров: каталог с индексом за {time.perf_counter() - started:.2f} с, "
+              f"слов в словаре {len(index.vocabulary)}")
+        for query in QUERIES:
+            started = time.perf_counter()
+            for _ in range(REPEATS):
+                results = index.search(query)
+            elapsed = (time.perf_counter() - started) / REPEATS * 1000
+            top = f"{results[0].brand} {results[0].model}" if results else '—'
+            print(f"  {query!r:32} {elapsed:6.2f} мс  {top}")
+
+
+if __name__ == '__main__':
+    main()
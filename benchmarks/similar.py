@@ -0,0 +1,76 @@
+"""Время построения индекса похожих товаров: с нуля и после изменения части каталога.
+
+Инкрементальный пересчёт сверяется с полным: расстояния до найденных соседей
+должны совпадать (сами соседи при равных расстояниях могут отличаться).
+
+Запуск из корня репозитория: python -m benchmarks.similar
+"""
+import copy
+import logging
+import random
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_catalog
+from catalog import CatalogSnapshot
+from similar import SimilarityIndex
+
+SIZES = (45, 10_000, 100_000)
+# Доля товаров, у которых между перезагрузками меняется цена
+CHANGED_SHARE = 0.01
+REMOVED_PER_CATEGORY = 3
+ADDED_PER_CATEGORY = 3
+
+
+def mutate(data: dict, seed: int = 1) -> dict:
+    data = copy.deepcopy(data)
+    rng = random.Random(seed)
+    keys = [(category, brand, model) for category, brands in data.items()
+            for brand, models in brands.items() for model in models]
+    for category, brand, model in rng.sample(keys, max(1, int(len(keys) * CHANGED_SHARE))):
+        data[category][brand][model]['price'] = f"${rng.randint(29, 399)}"
+    for category, brands in data.items():
+        brand = next(iter(brands))
+        template = next(iter(brands[brand].values()))
+        for model in list(brands[brand])[:REMOVED_PER_CATEGORY]:
+            del brands[brand][model]
+        for i in range(ADDED_PER_CATEGORY):
+            brands[brand][f"Новинка {i}"] = dict(copy.deepcopy(template), price=f"${rng.randint(29, 399)}")
+    return data
+
+
+def neighbour_distances(index: SimilarityIndex) -> dict:
+    distances = {}
+    for category, neighbours in index.categories.items():
+        features = neighbours.features
+        distances[category] = np.sort(((features[:, None, :] - features[neighbours.neighbours]) ** 2).sum(-1), axis=1)
+    return distances
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'товаров':>8} {'с нуля, с':>10} {'после изменений:':>17} {'пересчитано':>12} {'инкрем., с':>11} {'полный, с':>10}")
+    for size in SIZES:
+        data = generate_catalog(size)
+        first, full_time = timed(lambda: SimilarityIndex(CatalogSnapshot(data, 1, 0.0)))
+        changed = CatalogSnapshot(mutate(data), 2, 0.0)
+        incremental, incremental_time = timed(lambda: SimilarityIndex(changed, first))
+        reference, reference_time = timed(lambda: SimilarityIndex(changed))
+
+        expected = neighbour_distances(reference)
+        for category, distances in neighbour_distances(incremental).items():
+            assert np.allclose(distances, expected[category], atol=1e-5), category
+
+        print(f"{size:>8} {full_time:>10.2f} {'':>17} {incremental.recomputed:>12} "
+              f"{incremental_time:>11.2f} {reference_time:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
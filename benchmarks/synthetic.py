@@ -0,0 +1,57 @@
+import copy
+import json
+import random
+
+from catalog import CatalogSnapshot
+
+SWITCHES = [
+    'Механические (красные)', 'Механические (коричневые, тактильные)', 'Механические (синие, кликающие)',
+    'Оптические (линейные)', 'Оптические', 'Мембранные'
+]
+MOUSE_SIZES = ['Компактная', 'Средняя', 'Большая']
+POLLING_RATES = [500, 1000, 4000, 8000]
+
+
+def load_templates(path: str = 'tech_data.json') -> dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def generate_catalog(size: int, seed: int = 42, templates: dict = None) -> dict:
+    """Каталог из size товаров, размноженный из tech_data.json со случайными характеристиками."""
+    templates = templates or load_templates()
+    rng = random.Random(seed)
+    pool = [
+        (category, brand, model, product)
+        for category, brands in templates.items()
+        for brand, models in brands.items()
+        for model, product in models.items()
+    ]
+    if size <= len(pool):
+        data = {}
+        for category, brand, model, product in pool[:size]:
+            data.setdefault(category, {}).setdefault(brand, {})[model] = copy.deepcopy(product)
+        return data
+
+    data = {}
+    for i in range(size):
+        category, brand, model, product = pool[i % len(pool)]
+        product = copy.deepcopy(product)
+        product['price'] = f"${rng.randint(29, 399)}"
+        specs = product.setdefault('specs', {})
+        if category == 'mice':
+            specs['DPI'] = f"{rng.choice([8000, 12000, 16000, 26000, 30000])} DPI"
+            specs['Частота опроса'] = f"{rng.choice(POLLING_RATES)}Hz"
+            specs['Размер'] = rng.choice(MOUSE_SIZES)
+            specs['Вес'] = f"{rng.randint(45, 140)} г"
+        elif category == 'keyboards':
+            specs['Тип переключателей'] = rng.choice(SWITCHES)
+        elif category == 'headphones':
+            specs['Тип'] = rng.choice(['Накладные', 'Вкладыши'])
+        brand_name = f"{brand} {i % 97}"
+        data.setdefault(category, {}).setdefault(brand_name, {})[f"{model} #{i}"] = product
+    return data
+
+
+def build_snapshot(size: int, index_builders: dict = None, seed: int = 42) -> CatalogSnapshot:
+    return CatalogSnapshot(generate_catalog(size, seed), 1, 0.0, index_builders)
@@ -0,0 +1,82 @@
+"""Прогон записанных апдейтов через webhook-режим bot.py.
+
+Поднимает встроенный webhook-сервер PTB на локальном порту, регистрирует его
+в заглушке Bot API и отправляет апдейты из fixtures/webhook_updates.json так,
+как это делает Telegram. Проверяет проверку секрета, время ответа webhook и
+то, что каждый апдейт дошёл до обработчиков.
+
+Запуск из корня репозитория: python -m benchmarks.webhook_replay
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import time
+
+import httpx
+
+import bot
+from benchmarks.fake_bot_api import FakeBotApi
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'webhook_updates.json')
+SECRET = 'replay-secret'
+PATH = 'telegram'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def replay():
+    with open(FIXTURE, 'r', encoding='utf-8') as file:
+        updates = json.load(file)
+
+    api = await FakeBotApi(latency=0.02).start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/{PATH}"
+
+    await application.initialize()
+    await application.updater.start_webhook(
+        listen='127.0.0.1', port=port, url_path=PATH, webhook_url=url, secret_token=SECRET, max_connections=10
+    )
+    await application.start()
+    assert api.calls['setWebhook'] == 1
+
+    timings = []
+    async with httpx.AsyncClient() as client:
+        rejected = await client.post(url, json=updates[0], headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+        assert rejected.status_code == 403, rejected.status_code
+
+        for update in updates:
+            started = time.perf_counter()
+            response = await client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+
+    callbacks = sum(1 for update in updates if 'callback_query' in update)
+    await api.wait_for_calls('answerCallbackQuery', callbacks)
+    await api.wait_for_calls('sendMessage', 2)
+    await api.wait_for_calls('answerInlineQuery', 1)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+
+    print(f"апдейтов: {len(updates)}, вызовов Bot API: {dict(api.calls)}")
+    print(f"ответ webhook: медиана {statistics.median(timings):.1f} мс, максимум {max(timings):.1f} мс")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    bot.catalog.reload(force=True)
+    asyncio.run(replay())
+
+
+if __name__ == '__main__':
+    main()
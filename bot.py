@@ -1,7 +1,31 @@
-import json
+import argparse
+import asyncio
 import logging
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.error import BadRequest
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler
+
+import callbacks
+import config
+import metrics
+from callbacks import NodeIndex
+from cache import LRUCache
+from catalog import CatalogRepository, CatalogStore, CatalogUnavailable
+from catalog_db import SqlCatalogStore, SqlNodeIndex, SqlRenderCache, SqlScoring, SqlSearch, SqlSetupIndex
+from delivery import Card, send_album, send_cards
+from facets import FacetIndex, decode_selection, encode_selection
+from gaming_setup import COMPONENTS, SetupIndex
+from outbound import OutboundRequest
+from persistence import create_persistence
+from photo_cache import PhotoCache, photo_key
+from processing import PerUserUpdateProcessor, run_blocking
+from refresh import PriceRefresher
+from render import CATEGORY_LABELS, RenderCache
+from scoring import ScoringEngine
+from search import SearchIndex
+from similar import IncrementalSimilarity
+from thumbnails import ThumbnailCache
 
 # Настройка логгирования
 logging.basicConfig(
@@ -10,9 +34,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Состояния для кнопки "Назад"
-BACK_TO_CATEGORIES = "back_to_categories"
-BACK_TO_BRANDS = "back_to_brands"
+CATALOG_UNAVAILABLE_TEXT = "⚠️ База данных не загружена. Попробуйте позже."
+STALE_BUTTON_TEXT = "⚠️ Этот раздел каталога больше не доступен. Начните заново из главного меню."
+SEARCH_USAGE_TEXT = "🔎 Напишите, что найти: /search viper или /search беспроводная мышь"
+SEARCH_RESULTS_LIMIT = 10
+INLINE_RESULTS_LIMIT = 20
+INLINE_CACHE_TIME = 300
+FILTER_RESULTS_LIMIT = 20
+SETUP_EXPIRED_TEXT = "⌛ Подбор сетапа устарел, начнём заново.\n\n🎮 Выберите ваш любимый игровой жанр:"
+SETUP_UNAVAILABLE_TEXT = "😔 В каталоге пока не хватает товаров, чтобы собрать сетап. Попробуйте позже."
+# Сколько сетапов показывать: лучший и запасные варианты
+SETUP_VARIANTS = 3
+
+if config.CATALOG_URL:
+    # Фильтры по параметрам и похожие товары есть только у каталога из JSON: их кнопки не показываются
+    catalog = SqlCatalogStore(
+        config.CATALOG_URL,
+        check_interval=config.CATALOG_CHECK_INTERVAL,
+        index_builders={'scoring': SqlScoring, 'nodes': SqlNodeIndex, 'render': SqlRenderCache,
+                        'search': SqlSearch, 'setup': SqlSetupIndex}
+    )
+else:
+    catalog = CatalogStore(
+        config.TECH_DATA_PATH,
+        check_interval=config.CATALOG_CHECK_INTERVAL,
+        index_builders={'scoring': ScoringEngine, 'nodes': NodeIndex, 'render': RenderCache,
+                        'search': SearchIndex, 'facets': FacetIndex, 'setup': SetupIndex,
+                        'similar': IncrementalSimilarity()},
+        snapshot_path=config.CATALOG_SNAPSHOT_PATH
+    )
+
+# Готовые подборки зависят только от входных параметров и версий категорий, из которых собраны
+results_cache = LRUCache(config.RESULT_CACHE_SIZE)
+# Результаты поиска привязаны к версии всего каталога
+search_cache = LRUCache(config.SEARCH_CACHE_SIZE)
+
+
+def clear_results(snapshot: CatalogRepository):
+    search_cache.clear()
+    # После точечного обновления подборки по нетронутым категориям остаются верными: их ключи не изменились
+    if snapshot.changed is None:
+        results_cache.clear()
+
+
+catalog.add_reload_listener(clear_results)
 
 # Данные для генератора киберспортивного сетапа
 GAMING_GENRES = {
@@ -34,6 +99,14 @@ SWITCH_TYPES = {
     "clicky": "Кликающие (синие, с щелчком)"
 }
 
+# Бюджет сетапа в долларах; "0" — без ограничений
+SETUP_BUDGETS = {
+    "250": "💵 До $250",
+    "400": "💵 До $400",
+    "600": "💵 До $600",
+    "0": "💎 Без ограничений"
+}
+
 GAMING_SETUP_ADVICE = {
     "shooter": {
         "mouse": "Высокий DPI (16000+) и легкий корпус для быстрых движений",
@@ -61,16 +134,67 @@ GAMING_SETUP_ADVICE = {
     }
 }
 
+# Экраны, не зависящие от каталога, собираются один раз при импорте
+OFFLINE_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌟 Получить рекомендации", callback_data=callbacks.ASK_PREFERENCES)],
+    [InlineKeyboardButton("🎮 Собрать киберспортивный сетап", callback_data=callbacks.SETUP_START)]
+])
 
-def load_tech_data():
-    try:
-        with open('tech_data.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            logger.info("Данные успешно загружены из tech_data.json")
-            return data
-    except Exception as e:
-        logger.error(f"Ошибка загрузки данных: {e}")
-        return {}
+MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 В главное меню", callback_data=callbacks.MENU)]])
+
+PREFERENCES_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎮 Для игр", callback_data=callbacks.encode(callbacks.PREFERENCE, "gaming"))],
+    [InlineKeyboardButton("💼 Для работы", callback_data=callbacks.encode(callbacks.PREFERENCE, "work"))],
+    [InlineKeyboardButton("💰 Бюджетный вариант", callback_data=callbacks.encode(callbacks.PREFERENCE, "budget"))]
+])
+
+GENRES_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(genre, callback_data=callbacks.encode(callbacks.SETUP_GENRE, genre_id))]
+    for genre_id, genre in GAMING_GENRES.items()
+])
+
+HAND_SIZES_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(size, callback_data=callbacks.encode(callbacks.SETUP_HAND, size_id))]
+    for size_id, size in HAND_SIZES.items()
+])
+
+SWITCH_TYPES_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(switch_type, callback_data=callbacks.encode(callbacks.SETUP_SWITCH, switch_id))]
+    for switch_id, switch_type in SWITCH_TYPES.items()
+])
+
+SETUP_BUDGETS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(budget, callback_data=callbacks.encode(callbacks.SETUP_BUDGET, budget_id))]
+    for budget_id, budget in SETUP_BUDGETS.items()
+])
+
+
+async def reload_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in config.ADMIN_IDS:
+        return
+
+    if await run_blocking(catalog.reload, True):
+        await update.message.reply_text(f"✅ Каталог перезагружен (версия {catalog.get().version})")
+    elif catalog.available:
+        await update.message.reply_text("⚠️ Не удалось перезагрузить каталог, используется предыдущая версия")
+    else:
+        await update.message.reply_text(CATALOG_UNAVAILABLE_TEXT)
+
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in config.ADMIN_IDS:
+        return
+
+    stats = results_cache.stats()
+    search_stats = search_cache.stats()
+    saved = metrics.API_CALLS_SAVED.total()
+    await update.message.reply_text(
+        f"📊 Кэш подборок: {stats['size']}/{stats['maxsize']}\n"
+        f"Попадания: {stats['hits']}, промахи: {stats['misses']} ({stats['hit_rate']:.0%})\n"
+        f"Кэш поиска: {search_stats['size']}/{search_stats['maxsize']}, "
+        f"попадания: {search_stats['hits']} ({search_stats['hit_rate']:.0%})\n"
+        f"Сэкономлено запросов к Bot API: {saved:.0f}, повторов после 429: {metrics.API_RETRIES.total():.0f}"
+    )
 
 
 async def send_photo_with_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE,
@@ -85,6 +209,8 @@ async def send_photo_with_fallback(update: Update, context: ContextTypes.DEFAULT
         return True
     except Exception as e:
         logger.error(f"Ошибка отправки фото: {e}")
+        metrics.PHOTO_FAILURES.inc('error')
+        metrics.PHOTO_FALLBACKS.inc()
         if message_to_edit:
             await message_to_edit.edit_text("🖼 " + text, parse_mode="HTML")
         else:
@@ -96,139 +222,330 @@ async def send_photo_with_fallback(update: Update, context: ContextTypes.DEFAULT
         return False
 
 
+async def send_product_photo(context: ContextTypes.DEFAULT_TYPE, chat_id: int, key: str,
+                             photo_url: str, caption: str, reply_markup=None):
+    photo_cache = context.bot_data.get('photo_cache')
+    file_id = photo_cache.lookup(key, photo_url) if photo_cache is not None else None
+
+    if file_id:
+        try:
+            return await context.bot.send_photo(
+                chat_id=chat_id,
+                photo=file_id,
+                caption=caption,
+                parse_mode='HTML',
+                reply_markup=reply_markup
+            )
+        except BadRequest as e:
+            logger.warning(f"file_id для {key} больше не действителен: {e}")
+            metrics.PHOTO_FAILURES.inc('stale_file_id')
+            photo_cache.forget(key)
+
+    message = await context.bot.send_photo(
+        chat_id=chat_id,
+        photo=photo_url,
+        caption=caption,
+        parse_mode='HTML',
+        reply_markup=reply_markup
+    )
+    if photo_cache is not None:
+        photo_cache.remember(key, photo_url, message)
+    return message
+
+
+async def warm_up_photos(application: Application):
+    # Загружаем фото всех товаров в служебный чат, чтобы у пользователей они отправлялись по file_id
+    photo_cache = application.bot_data['photo_cache']
+    uploaded = 0
+    for product in catalog.get().iter_products():
+        key = photo_key(*product.key)
+        if not product.photo_url or photo_cache.lookup(key, product.photo_url):
+            continue
+        try:
+            message = await application.bot.send_photo(
+                chat_id=config.PHOTO_WARMUP_CHAT_ID,
+                photo=product.photo_url,
+                disable_notification=True
+            )
+            photo_cache.remember(key, product.photo_url, message)
+            uploaded += 1
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Прогрев фото {key} не удался: {e}")
+            metrics.PHOTO_FAILURES.inc('warmup')
+        await asyncio.sleep(config.PHOTO_WARMUP_DELAY)
+    logger.info(f"Прогрев фото завершён: загружено {uploaded}")
+
+
+def cache_requests(application: Application) -> dict:
+    caches = {'results': results_cache, 'search': search_cache, 'photo': application.bot_data.get('photo_cache'),
+              'album_photo': application.bot_data.get('album_photo_cache'),
+              'thumbnail': application.bot_data.get('thumbnails')}
+    if catalog.available:
+        # Счётчики кэша экранов начинаются заново с каждой версией каталога
+        caches['render'] = catalog.get().indexes['render']
+    requests = {}
+    for name, cache in caches.items():
+        if cache is not None:
+            requests[(name, 'hit')] = cache.hits
+            requests[(name, 'miss')] = cache.misses
+    return requests
+
+
+async def post_init(application: Application):
+    application.bot_data['catalog_watcher'] = asyncio.create_task(catalog.watch(run_blocking))
+    if config.REFRESH_INTERVAL and not config.CATALOG_URL:
+        refresher = PriceRefresher(catalog)
+        catalog.add_reload_listener(refresher.reapply)
+        application.bot_data['price_refresher'] = refresher
+        application.bot_data['price_refresh_task'] = asyncio.create_task(refresher.watch(config.REFRESH_INTERVAL))
+
+    metrics.collect('bot_update_queue_depth', "Апдейты, ожидающие обработки", 'gauge', (),
+                    lambda: {(): application.update_queue.qsize()})
+    metrics.collect('bot_cache_requests_total', "Обращения к кэшам", 'counter', ('cache', 'result'),
+                    lambda: cache_requests(application))
+    if config.METRICS_PORT:
+        application.bot_data['metrics_server'] = await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)
+
+    if config.PHOTO_CACHE_PATH:
+        photo_cache = PhotoCache(config.PHOTO_CACHE_PATH)
+        application.bot_data['photo_cache'] = photo_cache
+        if catalog.available:
+            photo_cache.prune(catalog.get())
+        catalog.add_reload_listener(photo_cache.prune)
+
+        if config.PHOTO_WARMUP_CHAT_ID and catalog.available:
+            application.create_task(warm_up_photos(application))
+
+    if config.RECOMMENDATIONS_ALBUM and config.THUMBNAIL_CACHE_DIR:
+        application.bot_data['thumbnails'] = ThumbnailCache(config.THUMBNAIL_CACHE_DIR)
+        if config.PHOTO_CACHE_PATH:
+            # file_id миниатюр отдельно: карточке товара они дали бы фото низкого разрешения
+            album_cache = PhotoCache(config.PHOTO_CACHE_PATH, table='album_photos')
+            application.bot_data['album_photo_cache'] = album_cache
+            if catalog.available:
+                album_cache.prune(catalog.get())
+            catalog.add_reload_listener(album_cache.prune)
+
+
+async def post_shutdown(application: Application):
+    watcher = application.bot_data.get('catalog_watcher')
+    if watcher:
+        watcher.cancel()
+
+    refresh_task = application.bot_data.get('price_refresh_task')
+    if refresh_task:
+        refresh_task.cancel()
+        application.bot_data['price_refresher'].close()
+
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+    for name in ('photo_cache', 'album_photo_cache'):
+        photo_cache = application.bot_data.get(name)
+        if photo_cache is not None:
+            photo_cache.close()
+
+    thumbnails = application.bot_data.get('thumbnails')
+    if thumbnails is not None:
+        thumbnails.close()
+
+
+async def show_stale_button(query):
+    await query.edit_message_text(STALE_BUTTON_TEXT, reply_markup=MENU_MARKUP)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("⌨️ Клавиатуры", callback_data="category_keyboards")],
-        [InlineKeyboardButton("🖱 Мышки", callback_data="category_mice")],
-        [InlineKeyboardButton("🎧 Наушники", callback_data="category_headphones")],
-        [InlineKeyboardButton("🌟 Получить рекомендации", callback_data="get_recommendations")],
-        [InlineKeyboardButton("🎮 Собрать киберспортивный сетап", callback_data="gaming_setup_start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Ссылка из inline-режима: t.me/<бот>?start=m_<id> сразу открывает карточку товара
+    if update.message and context.args:
+        action, args = callbacks.decode_start(context.args[0])
+        if action == callbacks.MODEL and args and await open_model_link(update, context, args[0]):
+            return
+
+    try:
+        reply_markup = catalog.get().indexes['render'].main_menu()
+    except CatalogUnavailable:
+        reply_markup = OFFLINE_MENU_MARKUP
     if update.message:
         await update.message.reply_text("🖥 Выберите тип периферии:", reply_markup=reply_markup)
     else:
         await update.callback_query.edit_message_text("🖥 Выберите тип периферии:", reply_markup=reply_markup)
 
 
+async def open_model_link(update: Update, context: ContextTypes.DEFAULT_TYPE, model_id: str) -> bool:
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        return False
+    node = snapshot.indexes['nodes'].resolve(model_id, callbacks.NODE_MODEL)
+    card = snapshot.indexes['render'].product_card(*node) if node else None
+    if card is None:
+        return False
+
+    message, reply_markup = card
+    product = snapshot.product(*node)
+    if product.photo_url:
+        try:
+            await send_product_photo(context, update.effective_chat.id, photo_key(*node),
+                                     product.photo_url, message, reply_markup)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка отправки фото: {e}")
+            metrics.PHOTO_FAILURES.inc('error')
+            metrics.PHOTO_FALLBACKS.inc()
+    await update.message.reply_text(message, parse_mode="HTML", reply_markup=reply_markup)
+    return True
+
+
+async def find_products(snapshot: CatalogRepository, text: str, limit: int) -> list:
+    key = ('search', snapshot.version, ' '.join(text.lower().split()), limit)
+    return await search_cache.get_or_await(
+        key, lambda: run_blocking(snapshot.indexes['search'].search, text, limit)
+    )
+
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = ' '.join(context.args)
+    if not text:
+        await update.message.reply_text(SEARCH_USAGE_TEXT)
+        return
+
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await update.message.reply_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    products = await find_products(snapshot, text, SEARCH_RESULTS_LIMIT)
+    if not products:
+        await update.message.reply_text(f"😢 По запросу «{text}» ничего не нашлось")
+        return
+
+    render = snapshot.indexes['render']
+    keyboard = [[render.product_button(*product.key)] for product in products]
+    keyboard.append([InlineKeyboardButton("🔙 В главное меню", callback_data=callbacks.MENU)])
+    await update.message.reply_text(f"🔎 Найдено по запросу «{text}»:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    inline_query = update.inline_query
+    text = inline_query.query.strip()
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await inline_query.answer([], cache_time=0)
+        return
+
+    products = await find_products(snapshot, text, INLINE_RESULTS_LIMIT) if text else []
+    render = snapshot.indexes['render']
+    results = [render.inline_result(*product.key, context.bot.username) for product in products]
+    await inline_query.answer([result for result in results if result], cache_time=INLINE_CACHE_TIME)
+
+
+async def ignore_button(update: Update, context: ContextTypes.DEFAULT_TYPE, *args):
+    await update.callback_query.answer()
+
+
+async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    await start(update, context)
+
+
 async def ask_preferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    keyboard = [
-        [InlineKeyboardButton("🎮 Для игр", callback_data="pref_gaming")],
-        [InlineKeyboardButton("💼 Для работы", callback_data="pref_work")],
-        [InlineKeyboardButton("💰 Бюджетный вариант", callback_data="pref_budget")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
         "📝 Чтобы получить персональные рекомендации, ответьте на 2 вопроса:\n\n"
         "1. Как вы планируете использовать устройство?",
-        reply_markup=reply_markup
+        reply_markup=PREFERENCES_MARKUP
     )
 
 
-async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str = '', page: str = ''):
     query = update.callback_query
     await query.answer()
 
-    if query.data == BACK_TO_CATEGORIES:
-        return await start(update, context)
-
-    category = query.data.split('_')[1]
-    context.user_data['current_category'] = category
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
 
-    brands = ["Razer", "Logitech", "HyperX", "SteelSeries", "Asus", "Lunacy"]
-    buttons = [
-        [InlineKeyboardButton(brand, callback_data=f"brand_{category}_{brand}")]
-        for brand in brands
-    ]
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=BACK_TO_CATEGORIES)])
+    node = snapshot.indexes['nodes'].resolve(category_id, callbacks.NODE_CATEGORY)
+    if node is None:
+        await show_stale_button(query)
+        return
+    category, = node
 
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await query.edit_message_text(f"🏷 Выберите бренд:", reply_markup=reply_markup)
+    text, reply_markup = snapshot.indexes['render'].brand_list(category, callbacks.decode_page(page))
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 
-async def handle_brand(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_brand(update: Update, context: ContextTypes.DEFAULT_TYPE, brand_id: str = '', page: str = ''):
     query = update.callback_query
     await query.answer()
 
-    if query.data == BACK_TO_BRANDS:
-        category = context.user_data.get('current_category', 'keyboards')
-        return await handle_category(update, context)
-
-    _, category, brand = query.data.split('_')
-    context.user_data['current_brand'] = brand
-    data = load_tech_data()
-
-    if not data:
-        await query.edit_message_text("⚠️ База данных не загружена. Попробуйте позже.")
-        return
-
-    if category not in data:
-        await query.edit_message_text(f"⚠️ Категория '{category}' не найдена")
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
         return
 
-    if brand not in data[category]:
-        await query.edit_message_text(f"⚠️ Бренд '{brand}' не найден в категории '{category}'")
+    node = snapshot.indexes['nodes'].resolve(brand_id, callbacks.NODE_BRAND)
+    if node is None:
+        await show_stale_button(query)
         return
+    category, brand = node
 
-    models = list(data[category][brand].keys())
-    if not models:
+    model_list = snapshot.indexes['render'].model_list(category, brand, callbacks.decode_page(page))
+    if model_list is None:
         await query.edit_message_text(f"⚠️ Нет моделей для бренда '{brand}'")
         return
 
-    buttons = [
-        [InlineKeyboardButton(model, callback_data=f"model_{category}_{brand}_{model}")]
-        for model in models
-    ]
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=BACK_TO_BRANDS)])
-
-    reply_markup = InlineKeyboardMarkup(buttons)
-    await query.edit_message_text(f"📋 Модели {brand}:", reply_markup=reply_markup)
+    text, reply_markup = model_list
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 
-async def handle_model(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_model(update: Update, context: ContextTypes.DEFAULT_TYPE, model_id: str = ''):
     query = update.callback_query
     await query.answer()
-    _, category, brand, model = query.data.split('_')
-    data = load_tech_data()
 
     try:
-        if not data or category not in data or brand not in data[category] or model not in data[category][brand]:
-            raise KeyError("Продукт не найден в базе данных")
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
 
-        product = data[category][brand][model]
+    node = snapshot.indexes['nodes'].resolve(model_id, callbacks.NODE_MODEL)
+    if node is None:
+        await show_stale_button(query)
+        return
+    category, brand, model = node
 
-        if 'description' not in product or 'specs' not in product or 'price' not in product:
+    try:
+        card = snapshot.indexes['render'].product_card(category, brand, model)
+        if card is None:
             raise ValueError("Неполные данные о продукте")
+        message, reply_markup = card
+        product = snapshot.product(category, brand, model)
 
-        specs = "\n".join([f"• {key}: {value}" for key, value in product.get('specs', {}).items()])
-
-        message = (
-            f"🔹 <b>{model}</b> ({brand})\n\n"
-            f"📝 <b>Описание:</b> {product['description']}\n\n"
-            f"⚙️ <b>Характеристики:</b>\n{specs}\n\n"
-            f"💰 <b>Цена:</b> {product['price']}"
-        )
-
-        keyboard = [
-            [InlineKeyboardButton("🔙 Назад", callback_data=BACK_TO_BRANDS)],
-            [InlineKeyboardButton("🌟 Похожие товары", callback_data=f"similar_{category}_{brand}_{model}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        if product.get('photo_url'):
+        if product.photo_url:
             try:
-                await context.bot.send_photo(
-                    chat_id=query.message.chat_id,
-                    photo=product['photo_url'],
-                    caption=message,
-                    parse_mode="HTML",
-                    reply_markup=reply_markup
+                await send_product_photo(
+                    context,
+                    query.message.chat_id,
+                    photo_key(category, brand, model),
+                    product.photo_url,
+                    message,
+                    reply_markup
                 )
             except Exception as e:
                 logger.error(f"Ошибка отправки фото: {e}")
+                metrics.PHOTO_FAILURES.inc('error')
+                metrics.PHOTO_FALLBACKS.inc()
                 await query.edit_message_text(
                     "🖼 " + message,
                     parse_mode="HTML",
@@ -250,128 +567,223 @@ async def handle_model(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(error_msg)
 
 
-async def handle_preferences(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_similar(update: Update, context: ContextTypes.DEFAULT_TYPE, model_id: str = ''):
     query = update.callback_query
     await query.answer()
 
-    pref = query.data.split('_')[1]
-    context.user_data['preferences'] = {'usage': pref}
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.message.reply_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    node = snapshot.indexes['nodes'].resolve(model_id, callbacks.NODE_MODEL)
+    if node is None:
+        await query.message.reply_text(STALE_BUTTON_TEXT, reply_markup=MENU_MARKUP)
+        return
+
+    # Карточка товара обычно фото, поэтому список отправляем отдельным сообщением под ней
+    similar = snapshot.indexes['render'].similar_list(*node)
+    if similar is None:
+        await query.message.reply_text("😢 Похожих товаров не нашлось", reply_markup=MENU_MARKUP)
+        return
+    text, reply_markup = similar
+    await query.message.reply_text(text, reply_markup=reply_markup)
+
+
+def resolve_filter(snapshot: CatalogRepository, category_id: str, selection_text: str) -> Optional[tuple]:
+    node = snapshot.indexes['nodes'].resolve(category_id, callbacks.NODE_CATEGORY)
+    facets = snapshot.indexes.get('facets')
+    index = facets.get(node[0]) if node and facets else None
+    if index is None:
+        return None
+    return node[0], index, index.clean(decode_selection(selection_text))
+
+
+async def handle_filter(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str = '', selection: str = ''):
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    resolved = resolve_filter(snapshot, category_id, selection)
+    if resolved is None:
+        await show_stale_button(query)
+        return
+    category, index, chosen = resolved
+    selection = encode_selection(chosen)
+    matched = index.count(chosen)
+
+    keyboard = []
+    for facet in index.facets:
+        number = chosen.get(facet.code)
+        value = facet.options[number].label if number is not None else "любое"
+        keyboard.append([InlineKeyboardButton(f"{facet.title}: {value}", callback_data=callbacks.encode(
+            callbacks.FILTER_FACET, category_id, selection, facet.code))])
+    keyboard.append([InlineKeyboardButton(f"📋 Показать ({matched})", callback_data=callbacks.encode(
+        callbacks.FILTER_RESULTS, category_id, selection))])
+    if chosen:
+        keyboard.append([InlineKeyboardButton("♻️ Сбросить фильтры", callback_data=callbacks.encode(
+            callbacks.FILTER, category_id, ''))])
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.encode(callbacks.CATEGORY, category_id))])
 
+    await query.edit_message_text(
+        f"🎛 {CATEGORY_LABELS.get(category, category)}: подбор по параметрам\n\nПодходит товаров: {matched}",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def handle_filter_facet(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str = '',
+                              selection: str = '', code: str = ''):
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    resolved = resolve_filter(snapshot, category_id, selection)
+    facet = resolved[1].facet(code) if resolved else None
+    if facet is None:
+        await show_stale_button(query)
+        return
+    _, index, chosen = resolved
+    others = {other: number for other, number in chosen.items() if other != code}
+
+    # Рядом с вариантом — сколько товаров останется, если выбрать его при остальных фильтрах
     keyboard = [
-        [InlineKeyboardButton("⌨️ Клавиатуры", callback_data="rec_category_keyboards")],
-        [InlineKeyboardButton("🖱 Мышки", callback_data="rec_category_mice")],
-        [InlineKeyboardButton("🎧 Наушники", callback_data="rec_category_headphones")],
-        [InlineKeyboardButton("❌ Пропустить", callback_data="rec_skip")]
+        [InlineKeyboardButton(
+            f"{'✅ ' if chosen.get(code) == number else ''}{facet.options[number].label} ({count})",
+            callback_data=callbacks.encode(callbacks.FILTER, category_id, encode_selection({**others, code: number}))
+        )]
+        for number, count in index.option_counts(chosen, code)
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard.append([InlineKeyboardButton(f"Любое ({index.count(others)})", callback_data=callbacks.encode(
+        callbacks.FILTER, category_id, encode_selection(others)))])
+
+    await query.edit_message_text(f"{facet.title}: выберите вариант", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def show_filter_results(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str = '',
+                              selection: str = ''):
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    resolved = resolve_filter(snapshot, category_id, selection)
+    if resolved is None:
+        await show_stale_button(query)
+        return
+    _, index, chosen = resolved
+
+    back = [InlineKeyboardButton("🔙 К фильтрам", callback_data=callbacks.encode(
+        callbacks.FILTER, category_id, encode_selection(chosen)))]
+    matched = index.count(chosen)
+    if not matched:
+        await query.edit_message_text("😢 Ничего не нашлось, попробуйте ослабить фильтры",
+                                      reply_markup=InlineKeyboardMarkup([back]))
+        return
+
+    render = snapshot.indexes['render']
+    keyboard = [[render.product_button(*product.key)] for product in index.first(chosen, FILTER_RESULTS_LIMIT)]
+    keyboard.append(back)
+    text = f"📋 Подходит товаров: {matched}"
+    if matched > FILTER_RESULTS_LIMIT:
+        text += f", показаны первые {FILTER_RESULTS_LIMIT}"
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def handle_preferences(update: Update, context: ContextTypes.DEFAULT_TYPE, pref: str = 'gaming'):
+    query = update.callback_query
+    await query.answer()
+
+    context.user_data['preferences'] = {'usage': pref}
+
+    try:
+        reply_markup = catalog.get().indexes['render'].recommendation_categories()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
     await query.edit_message_text(
         "2. Какая категория вас интересует?",
         reply_markup=reply_markup
     )
 
 
-def get_recommendations(user_preferences: dict, data: dict, selected_category: str = None) -> list:
-    recommendations = []
+async def get_recommendations(user_preferences: dict, snapshot: CatalogRepository, selected_category: str = None) -> list:
+    usage = user_preferences.get('usage', 'gaming')
+    version = snapshot.category_version(selected_category) if selected_category else snapshot.version
+    key = ('recommendations', version, usage, selected_category or None)
+    return await results_cache.get_or_await(
+        key, lambda: run_blocking(_compute_recommendations, snapshot, usage, selected_category)
+    )
 
-    weights = {
-        'gaming': {'price': 0.3, 'specs': 0.7},
-        'work': {'price': 0.5, 'ergonomics': 0.5},
-        'budget': {'price': 0.8, 'value': 0.2}
-    }
 
-    user_type = user_preferences.get('usage', 'gaming')
-    weight = weights.get(user_type, weights['gaming'])
+def _compute_recommendations(snapshot: CatalogRepository, usage: str, selected_category: str = None) -> list:
+    top = snapshot.indexes['scoring'].top(usage, selected_category or None, k=3)
 
-    categories = [selected_category] if selected_category else data.keys()
+    return [
+        {
+            'product': product.model,
+            'brand': product.brand,
+            'category': product.category,
+            'score': score,
+            'price': product.price_text,
+            'photo': product.photo_url
+        }
+        for product, score in top
+    ]
 
-    for category in categories:
-        if category not in data:
-            continue
 
-        for brand, products in data[category].items():
-            for product_name, product in products.items():
-                score = 0
-
-                try:
-                    price = float(product['price'].replace('$', ''))
-                    price_score = (1 - min(price / 300, 1)) * weight['price']
-                    score += price_score
-                except:
-                    pass
-
-                if 'specs' in product:
-                    specs_score = 0
-                    specs = product['specs']
-
-                    if category == 'mice':
-                        if 'DPI' in specs:
-                            try:
-                                dpi = int(specs['DPI'].split()[0])
-                                specs_score += min(dpi / 16000, 1) * 0.4
-                            except:
-                                pass
-                        if 'Частота опроса' in specs:
-                            try:
-                                polling = int(specs['Частота опроса'].replace('Hz', ''))
-                                specs_score += polling / 8000 * 0.3
-                            except:
-                                pass
-
-                    elif category == 'keyboards':
-                        if 'Тип переключателей' in specs:
-                            if 'механические' in specs['Тип переключателей'].lower():
-                                specs_score += 0.5
-                            elif 'оптические' in specs['Тип переключателей'].lower():
-                                specs_score += 0.7
-
-                    elif category == 'headphones':
-                        if 'Частотный диапазон' in specs:
-                            try:
-                                freq_range = specs['Частотный диапазон']
-                                if 'Hz' in freq_range and 'kHz' in freq_range:
-                                    specs_score += 0.4
-                            except:
-                                pass
-                        if 'Тип' in specs and specs['Тип'] == 'Накладные':
-                            specs_score += 0.3
-
-                    score += specs_score * weight.get('specs', 0)
-
-                recommendations.append({
-                    'product': product_name,
-                    'brand': brand,
-                    'category': category,
-                    'score': round(score, 2),
-                    'price': product['price'],
-                    'photo': product.get('photo_url', '')
-                })
-
-    return sorted(recommendations, key=lambda x: x['score'], reverse=True)[:3]
-
-
-async def show_recommendations(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_recommendations(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id: str = None):
     query = update.callback_query
     await query.answer()
 
-    data = load_tech_data()
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
     preferences = context.user_data.get('preferences', {})
 
-    if query.data.startswith('rec_category_'):
-        selected_category = query.data.split('_')[2]
-    elif query.data == 'rec_skip':
+    if category_id is None:
         selected_category = None
     else:
-        await query.edit_message_text("⚠️ Неверный запрос рекомендаций")
-        return
+        node = snapshot.indexes['nodes'].resolve(category_id, callbacks.NODE_CATEGORY)
+        if node is None:
+            await show_stale_button(query)
+            return
+        selected_category, = node
 
-    recommendations = get_recommendations(preferences, data, selected_category)
+    recommendations = await get_recommendations(preferences, snapshot, selected_category)
 
     if not recommendations:
         await query.edit_message_text("😢 Не удалось найти подходящие рекомендации")
         return
 
-    await query.edit_message_text("✅ Вот лучшие варианты для вас:")
+    render = snapshot.indexes['render']
+    if config.RECOMMENDATIONS_ALBUM:
+        # У альбома не бывает кнопок: кнопки моделей остаются на сообщении над ним
+        buttons = [[render.product_button(item['category'], item['brand'], item['product'])]
+                   for item in recommendations]
+        await query.edit_message_text("✅ Вот лучшие варианты для вас:", reply_markup=InlineKeyboardMarkup(buttons))
+    else:
+        await query.edit_message_text("✅ Вот лучшие варианты для вас:")
 
+    cards = []
     for i, item in enumerate(recommendations, 1):
         message = (
             f"🏆 Рекомендация #{i}\n\n"
@@ -381,183 +793,147 @@ async def show_recommendations(update: Update, context: ContextTypes.DEFAULT_TYP
             f"💰 Цена: {item['price']}\n\n"
         )
 
-        keyboard = [
-            [InlineKeyboardButton("🔍 Посмотреть",
-                                  callback_data=f"model_{item['category']}_{item['brand']}_{item['product']}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        cards.append(Card(
+            text=message,
+            reply_markup=render.view_button(item['category'], item['brand'], item['product']),
+            photo_url=item['photo'],
+            photo_key=photo_key(item['category'], item['brand'], item['product'])
+        ))
 
-        if item['photo']:
-            try:
-                await context.bot.send_photo(
-                    chat_id=query.message.chat_id,
-                    photo=item['photo'],
-                    caption=message,
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки фото: {e}")
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=message,
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
-        else:
-            await context.bot.send_message(
-                chat_id=query.message.chat_id,
-                text=message,
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
+    if config.RECOMMENDATIONS_ALBUM:
+        await send_album(context.bot, query.message.chat_id, cards, context.bot_data.get('photo_cache'),
+                         context.bot_data.get('thumbnails'), context.bot_data.get('album_photo_cache'))
+    else:
+        await send_cards(context.bot, query.message.chat_id, cards, context.bot_data.get('photo_cache'))
+
+
+async def ask_genre(query, text: str = "🎮 Выберите ваш любимый игровой жанр:"):
+    await query.edit_message_text(text, reply_markup=GENRES_MARKUP)
 
 
 async def start_gaming_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-
-    keyboard = [
-        [InlineKeyboardButton(genre, callback_data=f"gs_genre_{genre_id}")]
-        for genre_id, genre in GAMING_GENRES.items()
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
-        "🎮 Выберите ваш любимый игровой жанр:",
-        reply_markup=reply_markup
-    )
+    await ask_genre(query)
 
 
-async def ask_hand_size(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def ask_hand_size(update: Update, context: ContextTypes.DEFAULT_TYPE, genre: str = 'shooter'):
     query = update.callback_query
     await query.answer()
 
-    genre = query.data.split('_')[-1]
     context.user_data['gaming_setup'] = {'genre': genre}
 
-    keyboard = [
-        [InlineKeyboardButton(size, callback_data=f"gs_hand_{size_id}")]
-        for size_id, size in HAND_SIZES.items()
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
         "✋ Какой у вас размер руки? (измерьте от кончика среднего пальца до запястья):",
-        reply_markup=reply_markup
+        reply_markup=HAND_SIZES_MARKUP
     )
 
 
-async def ask_switch_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def ask_switch_type(update: Update, context: ContextTypes.DEFAULT_TYPE, hand_size: str = 'medium'):
     query = update.callback_query
     await query.answer()
 
-    hand_size = query.data.split('_')[-1]
-    context.user_data['gaming_setup']['hand_size'] = hand_size
+    setup_data = context.user_data.get('gaming_setup')
+    if setup_data is None:
+        # Сценарий устарел (истёк TTL состояния или бот перезапущен без хранилища)
+        await ask_genre(query, SETUP_EXPIRED_TEXT)
+        return
+    setup_data['hand_size'] = hand_size
 
-    keyboard = [
-        [InlineKeyboardButton(switch_type, callback_data=f"gs_switch_{switch_id}")]
-        for switch_id, switch_type in SWITCH_TYPES.items()
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
         "⌨️ Какой тип переключателей клавиатуры вы предпочитаете?",
-        reply_markup=reply_markup
+        reply_markup=SWITCH_TYPES_MARKUP
     )
 
 
-async def generate_gaming_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def ask_budget(update: Update, context: ContextTypes.DEFAULT_TYPE, switch_type: str = 'linear'):
     query = update.callback_query
     await query.answer()
 
-    switch_type = query.data.split('_')[-1]
-    context.user_data['gaming_setup']['switch_type'] = switch_type
+    setup_data = context.user_data.get('gaming_setup')
+    if setup_data is None or 'hand_size' not in setup_data:
+        await ask_genre(query, SETUP_EXPIRED_TEXT)
+        return
+    setup_data['switch_type'] = switch_type
+
+    await query.edit_message_text("💰 Сколько вы готовы потратить на весь сетап?", reply_markup=SETUP_BUDGETS_MARKUP)
+
+
+async def pick_gaming_setup(snapshot: CatalogRepository, genre: str, hand_size: str, switch_type: str,
+                            budget: Optional[int]) -> list:
+    versions = tuple(snapshot.category_version(category) for _, category in COMPONENTS)
+    key = ('gaming_setup', versions, genre, hand_size, switch_type, budget)
+    return await results_cache.get_or_await(key, lambda: run_blocking(
+        snapshot.indexes['setup'].solve, genre, hand_size, switch_type, budget, SETUP_VARIANTS
+    ))
+
+
+def _setup_price(setup) -> str:
+    return f"${setup.price:.0f}" if setup.price is not None else "?"
+
+
+async def generate_gaming_setup(update: Update, context: ContextTypes.DEFAULT_TYPE, budget: str = '0'):
+    query = update.callback_query
+    await query.answer()
 
-    setup_data = context.user_data['gaming_setup']
+    setup_data = context.user_data.get('gaming_setup')
+    if setup_data is None or 'switch_type' not in setup_data:
+        await ask_genre(query, SETUP_EXPIRED_TEXT)
+        return
     genre = setup_data['genre']
     hand_size = setup_data['hand_size']
+    switch_type = setup_data['switch_type']
+    try:
+        budget = int(budget) or None
+    except ValueError:
+        budget = None
 
-    data = load_tech_data()
-
-    # Выбираем мышь по размеру руки
-    mouse_recommendations = []
-    if 'mice' in data:
-        for brand, mice in data['mice'].items():
-            for model, specs in mice.items():
-                if 'specs' in specs and 'Размер' in specs['specs']:
-                    size_match = False
-                    if hand_size == 'small' and 'компактная' in specs['specs']['Размер'].lower():
-                        size_match = True
-                    elif hand_size == 'medium' and 'средняя' in specs['specs']['Размер'].lower():
-                        size_match = True
-                    elif hand_size == 'large' and 'большая' in specs['specs']['Размер'].lower():
-                        size_match = True
-
-                    if size_match:
-                        mouse_recommendations.append({
-                            'brand': brand,
-                            'model': model,
-                            'specs': specs
-                        })
-
-    # Выбираем клавиатуру по типу переключателей
-    keyboard_recommendations = []
-    if 'keyboards' in data:
-        for brand, keyboards in data['keyboards'].items():
-            for model, specs in keyboards.items():
-                if 'specs' in specs and 'Тип переключателей' in specs['specs']:
-                    switch_match = False
-                    if switch_type == 'linear' and (
-                            'красные' in specs['specs']['Тип переключателей'].lower() or 'линейные' in specs['specs'][
-                        'Тип переключателей'].lower()):
-                        switch_match = True
-                    elif switch_type == 'tactile' and (
-                            'коричневые' in specs['specs']['Тип переключателей'].lower() or 'тактильные' in
-                            specs['specs']['Тип переключателей'].lower()):
-                        switch_match = True
-                    elif switch_type == 'clicky' and (
-                            'синие' in specs['specs']['Тип переключателей'].lower() or 'кликающие' in specs['specs'][
-                        'Тип переключателей'].lower()):
-                        switch_match = True
-
-                    if switch_match:
-                        keyboard_recommendations.append({
-                            'brand': brand,
-                            'model': model,
-                            'specs': specs
-                        })
-
-    # Выбираем наушники по жанру
-    headphones_recommendations = []
-    if 'headphones' in data:
-        for brand, headphones in data['headphones'].items():
-            for model, specs in headphones.items():
-                headphones_recommendations.append({
-                    'brand': brand,
-                    'model': model,
-                    'specs': specs
-                })
-
-    # Выбираем лучшие варианты (просто берем первые подходящие)
-    mouse = mouse_recommendations[0] if mouse_recommendations else None
-    keyboard = keyboard_recommendations[0] if keyboard_recommendations else None
-    headphones = headphones_recommendations[0] if headphones_recommendations else None
+    try:
+        snapshot = catalog.get()
+    except CatalogUnavailable:
+        await query.edit_message_text(CATALOG_UNAVAILABLE_TEXT)
+        return
+
+    setups = await pick_gaming_setup(snapshot, genre, hand_size, switch_type, budget)
+    if not setups and budget is None:
+        # Без ограничения бюджета сетап не собирается, только если в каталоге нет нужных категорий
+        await query.edit_message_text(SETUP_UNAVAILABLE_TEXT, reply_markup=MENU_MARKUP)
+        return
+    if not setups:
+        await query.edit_message_text(
+            f"😔 В бюджет ${budget} полный сетап не собрать. Попробуйте бюджет побольше:",
+            reply_markup=SETUP_BUDGETS_MARKUP
+        )
+        return
+    best = setups[0]
 
     # Формируем сообщение с рекомендациями
     message = "🎮 <b>Ваш идеальный киберспортивный сетап:</b>\n\n"
 
-    if mouse:
-        message += f"🖱 <b>Мышь:</b> {mouse['brand']} {mouse['model']}\n"
-        message += f"   Характеристики: {mouse['specs'].get('description', '')}\n"
-        message += f"   Цена: {mouse['specs'].get('price', '?')}\n\n"
+    if best.mouse:
+        message += f"🖱 <b>Мышь:</b> {best.mouse.brand} {best.mouse.model}\n"
+        message += f"   Характеристики: {best.mouse.description}\n"
+        message += f"   Цена: {best.mouse.price_text or '?'}\n\n"
+
+    if best.keyboard:
+        message += f"⌨️ <b>Клавиатура:</b> {best.keyboard.brand} {best.keyboard.model}\n"
+        message += f"   Характеристики: {best.keyboard.description}\n"
+        message += f"   Цена: {best.keyboard.price_text or '?'}\n\n"
 
-    if keyboard:
-        message += f"⌨️ <b>Клавиатура:</b> {keyboard['brand']} {keyboard['model']}\n"
-        message += f"   Характеристики: {keyboard['specs'].get('description', '')}\n"
-        message += f"   Цена: {keyboard['specs'].get('price', '?')}\n\n"
+    if best.headphones:
+        message += f"🎧 <b>Наушники:</b> {best.headphones.brand} {best.headphones.model}\n"
+        message += f"   Характеристики: {best.headphones.description}\n"
+        message += f"   Цена: {best.headphones.price_text or '?'}\n\n"
 
-    if headphones:
-        message += f"🎧 <b>Наушники:</b> {headphones['brand']} {headphones['model']}\n"
-        message += f"   Характеристики: {headphones['specs'].get('description', '')}\n"
-        message += f"   Цена: {headphones['specs'].get('price', '?')}\n\n"
+    message += f"💰 <b>Итого:</b> {_setup_price(best)}\n\n"
+
+    if len(setups) > 1:
+        message += "🥈 <b>Другие варианты:</b>\n"
+        for i, setup in enumerate(setups[1:], 2):
+            items = " + ".join(f"{item.brand} {item.model}"
+                               for item in (setup.mouse, setup.keyboard, setup.headphones) if item)
+            message += f"{i}. {items} — {_setup_price(setup)}\n"
+        message += "\n"
 
     # Добавляем профессиональный совет
     advice = GAMING_SETUP_ADVICE.get(genre, GAMING_SETUP_ADVICE['shooter'])
@@ -567,32 +943,117 @@ async def generate_gaming_setup(update: Update, context: ContextTypes.DEFAULT_TY
     message += f"• Наушники: {advice['headphones']}\n\n"
     message += f"😄 <i>{advice['meme']}</i>"
 
-    keyboard = [
-        [InlineKeyboardButton("🔙 В главное меню", callback_data="back_to_categories")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.edit_message_text(message, parse_mode="HTML", reply_markup=MENU_MARKUP)
+
+
+# Таблица маршрутизации callback_data: код действия -> обработчик
+CALLBACK_ROUTES = {
+    callbacks.MENU: show_menu,
+    callbacks.NOOP: ignore_button,
+    callbacks.CATEGORY: handle_category,
+    callbacks.BRAND: handle_brand,
+    callbacks.MODEL: handle_model,
+    callbacks.SIMILAR: show_similar,
+    callbacks.ASK_PREFERENCES: ask_preferences,
+    callbacks.PREFERENCE: handle_preferences,
+    callbacks.RECOMMEND: show_recommendations,
+    callbacks.FILTER: handle_filter,
+    callbacks.FILTER_FACET: handle_filter_facet,
+    callbacks.FILTER_RESULTS: show_filter_results,
+    callbacks.SETUP_START: start_gaming_setup,
+    callbacks.SETUP_GENRE: ask_hand_size,
+    callbacks.SETUP_HAND: ask_switch_type,
+    callbacks.SETUP_SWITCH: ask_budget,
+    callbacks.SETUP_BUDGET: generate_gaming_setup,
+}
 
-    await query.edit_message_text(message, parse_mode="HTML", reply_markup=reply_markup)
+
+async def route_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    action, args = callbacks.decode(update.callback_query.data)
+    handler = CALLBACK_ROUTES.get(action)
+    if handler is None:
+        # Кнопка из старой версии бота или действие, которого больше нет
+        await update.callback_query.answer()
+        await show_stale_button(update.callback_query)
+        return
+    metrics.label(handler.__name__)
+    await handler(update, context, *args)
+
+
+def build_application(token: str = config.BOT_TOKEN, base_url: str = config.BOT_API_BASE_URL,
+                      concurrent_updates: int = config.CONCURRENT_UPDATES) -> Application:
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    # Запросы к Bot API идут через InstrumentedRequest (с очередью — OutboundRequest),
+    # поэтому размер пула задаётся ему, а не builder
+    request_class = OutboundRequest if config.OUTBOUND_QUEUE else metrics.InstrumentedRequest
+    if concurrent_updates > 1:
+        builder = (
+            builder
+            .concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+            .request(request_class(connection_pool_size=config.CONNECTION_POOL_SIZE, pool_timeout=30))
+        )
+    else:
+        builder = builder.request(request_class(connection_pool_size=256))
+    if config.PERSISTENCE_URL:
+        builder = builder.persistence(create_persistence(
+            config.PERSISTENCE_URL,
+            update_interval=config.PERSISTENCE_FLUSH_INTERVAL,
+            ttl=config.USER_STATE_TTL,
+            batch_size=config.PERSISTENCE_BATCH_SIZE
+        ))
+    application = builder.build()
+
+    application.add_handler(CommandHandler("start", metrics.instrument(start)))
+    application.add_handler(CommandHandler("search", metrics.instrument(search)))
+    application.add_handler(InlineQueryHandler(metrics.instrument(inline_search)))
+    application.add_handler(CommandHandler("reload", metrics.instrument(reload_catalog)))
+    application.add_handler(CommandHandler("stats", metrics.instrument(show_stats)))
+    application.add_handler(CallbackQueryHandler(metrics.instrument(route_callback)))
+
+    return application
+
+
+def webhook_options() -> dict:
+    return {
+        'listen': config.WEBHOOK_LISTEN,
+        'port': config.WEBHOOK_PORT,
+        'url_path': config.WEBHOOK_PATH,
+        'webhook_url': f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}" if config.WEBHOOK_URL else None,
+        'secret_token': config.WEBHOOK_SECRET or None,
+        'max_connections': config.WEBHOOK_MAX_CONNECTIONS,
+        'allowed_updates': Update.ALL_TYPES,
+    }
+
+
+def build_snapshot():
+    if config.CATALOG_URL or not config.CATALOG_SNAPSHOT_PATH:
+        raise SystemExit("Снимок собирается из JSON-каталога: задайте CATALOG_SNAPSHOT_PATH и уберите CATALOG_URL")
+    catalog.write_snapshot()
 
 
 def main():
-    application = Application.builder().token("TOKEN").build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(handle_category, pattern=r"^(category_|back_to_categories)"))
-    application.add_handler(CallbackQueryHandler(handle_brand, pattern=r"^(brand_|back_to_brands)"))
-    application.add_handler(CallbackQueryHandler(handle_model, pattern=r"^model_"))
-    application.add_handler(CallbackQueryHandler(ask_preferences, pattern=r"^get_recommendations"))
-    application.add_handler(CallbackQueryHandler(handle_preferences, pattern=r"^pref_"))
-    application.add_handler(CallbackQueryHandler(show_recommendations, pattern=r"^rec_"))
-
-    # Обработчики для генератора киберспортивного сетапа
-    application.add_handler(CallbackQueryHandler(start_gaming_setup, pattern=r"^gaming_setup_start$"))
-    application.add_handler(CallbackQueryHandler(ask_hand_size, pattern=r"^gs_genre_"))
-    application.add_handler(CallbackQueryHandler(ask_switch_type, pattern=r"^gs_hand_"))
-    application.add_handler(CallbackQueryHandler(generate_gaming_setup, pattern=r"^gs_switch_"))
-
-    application.run_polling()
+    parser = argparse.ArgumentParser(description="Telegram-бот подбора техники")
+    parser.add_argument('command', nargs='?', choices=('run', 'build-snapshot'), default='run',
+                        help="build-snapshot — собрать снимок каталога для быстрого старта и выйти")
+    if parser.parse_args().command == 'build-snapshot':
+        build_snapshot()
+        return
+
+    catalog.reload(force=True)
+
+    application = build_application()
+    if config.BOT_MODE == 'webhook':
+        # Встроенный в PTB сервер сразу отвечает Telegram 200 и кладёт апдейт в очередь обработки
+        application.run_webhook(**webhook_options())
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+from types import MappingProxyType
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+SEPARATOR = ':'
+# Параметр ссылки t.me/<бот>?start=...: до 64 символов из [A-Za-z0-9_-]
+START_SEPARATOR = '_'
+
+# Коды действий
+MENU = 'menu'
+CATEGORY = 'c'
+BRAND = 'b'
+MODEL = 'm'
+SIMILAR = 's'
+ASK_PREFERENCES = 'rq'
+PREFERENCE = 'p'
+RECOMMEND = 'r'
+SETUP_START = 'gs'
+SETUP_GENRE = 'g'
+SETUP_HAND = 'h'
+SETUP_SWITCH = 'w'
+SETUP_BUDGET = 'gb'
+FILTER = 'f'
+FILTER_FACET = 'fo'
+FILTER_RESULTS = 'fr'
+# Кнопка без действия (номер страницы между стрелками)
+NOOP = 'x'
+
+# Типы узлов каталога
+NODE_CATEGORY = 'c'
+NODE_BRAND = 'b'
+NODE_MODEL = 'm'
+
+_ID_BYTES = 6
+ID_SPACE = 1 << (_ID_BYTES * 8)
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def to_base36(number: int) -> str:
+    if number == 0:
+        return '0'
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(_DIGITS[remainder])
+    return ''.join(reversed(digits))
+
+
+def encode(action: str, *args) -> str:
+    data = SEPARATOR.join((action,) + tuple(str(arg) for arg in args))
+    if len(data.encode('utf-8')) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data!r}")
+    return data
+
+
+def decode(data: str) -> tuple:
+    action, *args = (data or '').split(SEPARATOR)
+    return action, tuple(args)
+
+
+def encode_paged(action: str, node_id: str, page: int) -> str:
+    # Номер первой страницы не пишется: такие кнопки совпадают с обычными переходами к узлу
+    return encode(action, node_id, to_base36(page)) if page else encode(action, node_id)
+
+
+def decode_page(text: str) -> int:
+    try:
+        return max(int(text, 36), 0) if text else 0
+    except ValueError:
+        return 0
+
+
+def encode_start(action: str, *args) -> str:
+    payload = START_SEPARATOR.join((action,) + tuple(str(arg) for arg in args))
+    if len(payload) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Параметр /start длиннее {MAX_CALLBACK_DATA} символов: {payload!r}")
+    return payload
+
+
+def decode_start(payload: str) -> tuple:
+    action, *args = (payload or '').split(START_SEPARATOR)
+    return action, tuple(args)
+
+
+def node_hash(kind: str, key: tuple) -> int:
+    digest = hashlib.blake2b('\x1f'.join((kind,) + key).encode('utf-8'), digest_size=_ID_BYTES).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class NodeIndex:
+    """Короткие id узлов каталога (категория, бренд, модель) для callback_data.
+
+    id — хэш пути к узлу, поэтому он не меняется между перезагрузками каталога
+    и перезапусками бота, а кнопки удалённых товаров просто не находят узел.
+    """
+
+    def __init__(self, snapshot):
+        previous = snapshot.previous.indexes.get('nodes') if snapshot.previous is not None else None
+        if previous is not None and snapshot.changed is not None:
+            # Точечное обновление не добавляет и не удаляет товары: дерево узлов то же
+            self._ids, self._nodes = previous._ids, previous._nodes
+            return
+        ids = {}
+        nodes = {}
+
+        def assign(kind, key):
+            number = node_hash(kind, key)
+            while number in nodes:
+                # Коллизия 48-битных хэшей: детерминированно берём следующий свободный id
+                logger.warning(f"Коллизия id узлов каталога: {kind} {key}")
+                number = (number + 1) % ID_SPACE
+            token = to_base36(number)
+            nodes[number] = (kind, key)
+            ids[(kind, key)] = token
+
+        for category in snapshot.brands:
+            assign(NODE_CATEGORY, (category,))
+        for category, brand in snapshot.models:
+            assign(NODE_BRAND, (category, brand))
+        for product in snapshot.products:
+            assign(NODE_MODEL, product.key)
+
+        self._ids = MappingProxyType(ids)
+        self._nodes = MappingProxyType(nodes)
+
+    def token(self, kind: str, *key) -> str:
+        return self._ids[(kind, key)]
+
+    def category(self, category: str) -> str:
+        return self._ids[(NODE_CATEGORY, (category,))]
+
+    def brand(self, category: str, brand: str) -> str:
+        return self._ids[(NODE_BRAND, (category, brand))]
+
+    def model(self, category: str, brand: str, model: str) -> str:
+        return self._ids[(NODE_MODEL, (category, brand, model))]
+
+    def resolve(self, token: str, kind: str) -> Optional[tuple]:
+        try:
+            node = self._nodes.get(int(token, 36))
+        except (TypeError, ValueError):
+            return None
+        if node is None or node[0] != kind:
+            return None
+        return node[1]
@@ -0,0 +1,489 @@
+import asyncio
+import enum
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+import snapshot_file
+
+logger = logging.getLogger(__name__)
+
+SPEC_DPI = 'DPI'
+SPEC_POLLING_RATE = 'Частота опроса'
+SPEC_WEIGHT = 'Вес'
+SPEC_SWITCHES = 'Тип переключателей'
+SPEC_SIZE = 'Размер'
+SPEC_HEADPHONE_TYPE = 'Тип'
+SPEC_FREQUENCY_RANGE = 'Частотный диапазон'
+
+_WEIGHT_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(?:г|g)\b', re.IGNORECASE)
+_FREQUENCY_RANGE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*Hz\s*-\s*(\d+(?:\.\d+)?)\s*kHz')
+
+
+class CatalogUnavailable(Exception):
+    """Каталог ещё ни разу не удалось загрузить."""
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class SwitchType(enum.Enum):
+    MECHANICAL = 'mechanical'
+    OPTICAL = 'optical'
+    OTHER = 'other'
+
+
+class MouseSize(enum.Enum):
+    COMPACT = 'small'
+    MEDIUM = 'medium'
+    LARGE = 'large'
+
+
+class HeadphoneType(enum.Enum):
+    ON_EAR = 'Накладные'
+    IN_EAR = 'Вкладыши'
+
+
+# Ключевые слова, по которым тип переключателей относится к ощущению при нажатии
+SWITCH_FEEL_KEYWORDS = {
+    'linear': ('красные', 'линейные'),
+    'tactile': ('коричневые', 'тактильные'),
+    'clicky': ('синие', 'кликающие'),
+}
+
+MOUSE_SIZE_KEYWORDS = {
+    MouseSize.COMPACT: 'компактная',
+    MouseSize.MEDIUM: 'средняя',
+    MouseSize.LARGE: 'большая',
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    category: str
+    brand: str
+    model: str
+    description: str
+    specs: MappingProxyType
+    price_text: str
+    photo_url: str
+    price: Optional[float] = None
+    dpi: Optional[int] = None
+    polling_rate: Optional[int] = None
+    weight: Optional[float] = None
+    switch_type: Optional[SwitchType] = None
+    switch_feels: frozenset = frozenset()
+    mouse_size: Optional[MouseSize] = None
+    headphone_type: Optional[HeadphoneType] = None
+    frequency_range: Optional[tuple] = None
+    # В исходных данных есть описание, характеристики и цена: хватает на карточку
+    complete: bool = False
+
+    @property
+    def key(self) -> tuple:
+        return self.category, self.brand, self.model
+
+
+def _parse_price(value: str) -> float:
+    return float(value.replace('$', ''))
+
+
+def _parse_dpi(value: str) -> int:
+    return int(value.split()[0])
+
+
+def _parse_polling_rate(value: str) -> int:
+    return int(value.replace('Hz', ''))
+
+
+def _parse_weight(value: str) -> float:
+    match = _WEIGHT_RE.search(value)
+    if not match:
+        raise ValueError(value)
+    return float(match.group(1).replace(',', '.'))
+
+
+def _parse_frequency_range(value: str) -> tuple:
+    match = _FREQUENCY_RANGE_RE.search(value)
+    if not match:
+        raise ValueError(value)
+    return float(match.group(1)), float(match.group(2)) * 1000
+
+
+def _parse_switch_type(value: str) -> SwitchType:
+    value = value.lower()
+    if 'механические' in value:
+        return SwitchType.MECHANICAL
+    if 'оптические' in value:
+        return SwitchType.OPTICAL
+    return SwitchType.OTHER
+
+
+def _parse_switch_feels(value: str) -> frozenset:
+    value = value.lower()
+    return frozenset(
+        feel for feel, keywords in SWITCH_FEEL_KEYWORDS.items()
+        if any(keyword in value for keyword in keywords)
+    )
+
+
+def _parse_mouse_size(value: str) -> Optional[MouseSize]:
+    value = value.lower()
+    for size, keyword in MOUSE_SIZE_KEYWORDS.items():
+        if keyword in value:
+            return size
+    return None
+
+
+def normalize_product(category: str, brand: str, model: str, raw, problems: list) -> Product:
+    specs = raw.get('specs', MappingProxyType({}))
+    fields = {}
+
+    def parse(field, parser, value):
+        try:
+            fields[field] = parser(value)
+        except (ValueError, IndexError, AttributeError):
+            problems.append(f"{category}/{brand}/{model}: не удалось разобрать {field} из {value!r}")
+
+    if 'price' in raw:
+        parse('price', _parse_price, raw['price'])
+    if SPEC_DPI in specs:
+        parse('dpi', _parse_dpi, specs[SPEC_DPI])
+    if SPEC_POLLING_RATE in specs:
+        parse('polling_rate', _parse_polling_rate, specs[SPEC_POLLING_RATE])
+    if SPEC_WEIGHT in specs:
+        parse('weight', _parse_weight, specs[SPEC_WEIGHT])
+    if SPEC_FREQUENCY_RANGE in specs:
+        parse('frequency_range', _parse_frequency_range, specs[SPEC_FREQUENCY_RANGE])
+
+    if category == 'keyboards' and SPEC_SWITCHES in specs:
+        fields['switch_type'] = _parse_switch_type(specs[SPEC_SWITCHES])
+        fields['switch_feels'] = _parse_switch_feels(specs[SPEC_SWITCHES])
+    if category == 'mice' and SPEC_SIZE in specs:
+        fields['mouse_size'] = _parse_mouse_size(specs[SPEC_SIZE])
+    if category == 'headphones' and SPEC_HEADPHONE_TYPE in specs:
+        try:
+            fields['headphone_type'] = HeadphoneType(specs[SPEC_HEADPHONE_TYPE])
+        except ValueError:
+            problems.append(f"{category}/{brand}/{model}: неизвестный тип наушников {specs[SPEC_HEADPHONE_TYPE]!r}")
+
+    return Product(
+        category=category,
+        brand=brand,
+        model=model,
+        description=raw.get('description', ''),
+        specs=specs,
+        price_text=raw.get('price', ''),
+        photo_url=raw.get('photo_url', ''),
+        complete='description' in raw and 'specs' in raw and 'price' in raw,
+        **fields
+    )
+
+
+def _group(products, key) -> MappingProxyType:
+    groups = {}
+    for product in products:
+        value = key(product)
+        if value is not None:
+            groups.setdefault(value, []).append(product)
+    return MappingProxyType({value: tuple(items) for value, items in groups.items()})
+
+
+class CatalogRepository:
+    """Каталог глазами обработчиков бота, независимо от хранилища.
+
+    CatalogSnapshot держит весь tech_data.json в памяти, SqlCatalog (catalog_db.py)
+    читает из базы только нужные строки. Обработчики и RenderCache пользуются только
+    этими методами, атрибутами version и indexes.
+    """
+
+    __slots__ = ()
+    # Ключи товаров, изменённых точечным обновлением (refresh.py); None — каталог загружен целиком
+    changed = None
+    # Снимок, из которого получен этот; доступен только построителям индексов
+    previous = None
+
+    def category_version(self, category: str) -> int:
+        """Версия, в которой товары категории менялись последний раз: ключ кэшей, зависящих от одной категории."""
+        return self.version
+
+    def categories(self) -> tuple:
+        raise NotImplementedError
+
+    def brand_names(self, category: str) -> tuple:
+        """Бренды категории в порядке каталога."""
+        raise NotImplementedError
+
+    def model_names(self, category: str, brand: str) -> tuple:
+        raise NotImplementedError
+
+    def product(self, category: str, brand: str, model: str) -> Optional[Product]:
+        raise NotImplementedError
+
+    def iter_products(self):
+        """Все товары по одному, не собирая каталог в памяти целиком."""
+        raise NotImplementedError
+
+    def photo_urls(self, keys: list) -> dict:
+        """{(категория, бренд, модель): photo_url} для тех из keys, что есть в каталоге."""
+        found = {}
+        for key in keys:
+            product = self.product(*key)
+            if product is not None:
+                found[key] = product.photo_url
+        return found
+
+
+class CatalogSnapshot(CatalogRepository):
+    """Неизменяемый снимок tech_data.json вместе с индексами.
+
+    С previous и changed снимок собирается из предыдущего: разобранные товары,
+    кроме изменённых, переиспользуются, а версии нетронутых категорий сохраняются.
+    """
+
+    __slots__ = ('data', 'version', 'mtime', 'loaded_at', 'brands', 'models', 'products', 'product_index',
+                 'by_category', 'by_brand', 'indexes', 'revisions', 'changed', 'previous')
+
+    def __init__(self, data: dict, version: int, mtime: float, index_builders: dict = None,
+                 previous: 'CatalogSnapshot' = None, changed: frozenset = None):
+        self.data = _freeze(data)
+        self.version = version
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.changed = changed
+        self.previous = previous
+        self.brands = MappingProxyType({
+            category: tuple(brands) for category, brands in self.data.items()
+        })
+        self.models = MappingProxyType({
+            (category, brand): tuple(models)
+            for category, brands in self.data.items()
+            for brand, models in brands.items()
+        })
+
+        problems = []
+        known = previous.product_index if previous is not None else {}
+        changed = changed or frozenset()
+
+        def product(category, brand, model, raw):
+            key = (category, brand, model)
+            if key in known and key not in changed:
+                return known[key]
+            return normalize_product(category, brand, model, raw, problems)
+
+        self.products = tuple(
+            product(category, brand, model, raw)
+            for category, brands in self.data.items()
+            for brand, models in brands.items()
+            for model, raw in models.items()
+        )
+        for problem in problems:
+            logger.warning(f"Каталог: {problem}")
+
+        changed_categories = {category for category, _, _ in changed}
+        self.revisions = MappingProxyType({
+            category: previous.revisions.get(category, version)
+            if previous is not None and category not in changed_categories else version
+            for category in self.data
+        })
+
+        self.product_index = MappingProxyType({product.key: product for product in self.products})
+        self.by_category = _group(self.products, lambda product: product.category)
+        self.by_brand = _group(self.products, lambda product: (product.category, product.brand))
+
+        # Производные структуры (матрицы скоринга и т.п.) строятся до подмены снимка
+        self.indexes = MappingProxyType({
+            name: build(self) for name, build in (index_builders or {}).items()
+        })
+        # Ссылка на прошлый снимок держала бы в памяти всю цепочку версий
+        self.previous = None
+
+    def patched(self, updates: dict, version: int, index_builders: dict = None) -> 'CatalogSnapshot':
+        """Новый снимок, в котором у товаров из updates ({ключ: {поле: значение}}) заменены поля исходных данных.
+
+        Копируются только словари на пути к изменённым товарам, остальное делится со старым снимком.
+        """
+        data = dict(self.data)
+        copied = set()
+        for (category, brand, model), fields in updates.items():
+            if category not in copied:
+                data[category] = dict(data[category])
+                copied.add(category)
+            if (category, brand) not in copied:
+                data[category][brand] = dict(data[category][brand])
+                copied.add((category, brand))
+            data[category][brand][model] = {**data[category][brand][model], **fields}
+        return CatalogSnapshot(data, version, self.mtime, index_builders, previous=self, changed=frozenset(updates))
+
+    def restamp(self, version: int, mtime: float):
+        """Версия хранилища для снимка, прочитанного из файла (snapshot_file.py): в файле записана версия сборки."""
+        self.version = version
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.revisions = MappingProxyType(dict.fromkeys(self.data, version))
+
+    def category_version(self, category: str) -> int:
+        return self.revisions.get(category, self.version)
+
+    def categories(self) -> tuple:
+        return tuple(self.brands)
+
+    def brand_names(self, category: str) -> tuple:
+        return self.brands.get(category, ())
+
+    def model_names(self, category: str, brand: str) -> tuple:
+        return self.models.get((category, brand), ())
+
+    def product(self, category: str, brand: str, model: str) -> Optional[Product]:
+        return self.product_index.get((category, brand, model))
+
+    def iter_products(self):
+        return iter(self.products)
+
+
+class CatalogStore:
+    """Держит текущий снимок каталога и подменяет его целиком при изменении файла.
+
+    С snapshot_path снимок сначала ищется в готовом файле (write_snapshot), и JSON
+    разбирается, только если файла нет или он собран из другого содержимого каталога.
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0, index_builders: dict = None,
+                 snapshot_path: str = None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self.index_builders = dict(index_builders or {})
+        self._snapshot = None
+        self._version = 0
+        self._attempted_mtime = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def available(self) -> bool:
+        return self._snapshot is not None
+
+    def add_reload_listener(self, callback):
+        # callback(snapshot) вызывается после каждой успешной подмены снимка
+        self._listeners.append(callback)
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                logger.error(f"Файл каталога недоступен: {e}")
+                return False
+
+            if not force and mtime == self._attempted_mtime:
+                return False
+            self._attempted_mtime = mtime
+
+            try:
+                with open(self.path, 'rb') as file:
+                    source = file.read()
+                snapshot = self._read_prebuilt(source, mtime)
+                if snapshot is None:
+                    data = json.loads(source)
+                    if not isinstance(data, dict):
+                        raise ValueError("ожидался JSON-объект на верхнем уровне")
+                    snapshot = CatalogSnapshot(data, self._version + 1, mtime, self.index_builders)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки данных: {e}")
+                return False
+
+            # Присваивание ссылки атомарно: обработчики видят либо старый, либо новый снимок
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            logger.info(f"Данные успешно загружены из {self.path} (версия {snapshot.version})")
+
+        self._notify_listeners(snapshot)
+        return True
+
+    def _read_prebuilt(self, source: bytes, mtime: float) -> Optional[CatalogSnapshot]:
+        if not self.snapshot_path:
+            return None
+        started = time.perf_counter()
+        try:
+            snapshot = snapshot_file.read(self.snapshot_path, snapshot_file.content_hash(source), self.index_builders)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать снимок каталога {self.snapshot_path}: {e}")
+            return None
+        if snapshot is None:
+            return None
+        snapshot.restamp(self._version + 1, mtime)
+        for name, build in self.index_builders.items():
+            # Строитель, который помнит прошлый индекс, продолжает с прочитанного
+            if hasattr(build, 'adopt'):
+                build.adopt(snapshot.indexes[name])
+        logger.info(f"Каталог прочитан из снимка {self.snapshot_path} за {time.perf_counter() - started:.2f} с")
+        return snapshot
+
+    def write_snapshot(self) -> CatalogSnapshot:
+        """Собирает снимок файла каталога со всеми индексами и сохраняет его в snapshot_path."""
+        with open(self.path, 'rb') as file:
+            source = file.read()
+        snapshot = CatalogSnapshot(json.loads(source), 1, os.stat(self.path).st_mtime, self.index_builders)
+        snapshot_file.write(self.snapshot_path, snapshot, snapshot_file.content_hash(source), self.index_builders)
+        return snapshot
+
+    def apply_updates(self, updates: dict) -> bool:
+        """Точечно меняет поля товаров ({ключ: {поле: значение}}) в текущем снимке, не перечитывая файл.
+
+        Файл каталога не переписывается: при его изменении снимок перезагружается
+        целиком, и обновления нужно применить заново.
+        """
+        with self._lock:
+            previous = self._snapshot
+            if previous is None:
+                return False
+            updates = {key: fields for key, fields in updates.items() if key in previous.product_index}
+            if not updates:
+                return False
+            started = time.perf_counter()
+            try:
+                snapshot = previous.patched(updates, self._version + 1, self.index_builders)
+            except Exception as e:
+                logger.error(f"Ошибка точечного обновления каталога: {e}")
+                return False
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            logger.info(f"Каталог обновлён точечно: изменено товаров {len(updates)} "
+                        f"за {time.perf_counter() - started:.2f} с (версия {snapshot.version})")
+
+        self._notify_listeners(snapshot)
+        return True
+
+    def _notify_listeners(self, snapshot):
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика перезагрузки каталога: {e}")
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise CatalogUnavailable(self.path)
+        return snapshot
+
+    async def watch(self, run_blocking):
+        # Фоновая проверка mtime: чтение и разбор файла выполняются вне event loop
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await run_blocking(self.reload)
+            except Exception as e:
+                logger.error(f"Ошибка проверки каталога: {e}")
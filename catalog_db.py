@@ -0,0 +1,744 @@
+import argparse
+import json
+import logging
+import time
+from types import MappingProxyType
+from typing import Optional
+
+import sqlalchemy as sa
+
+import callbacks
+import config
+from cache import LRUCache
+from catalog import (SWITCH_FEEL_KEYWORDS, CatalogRepository, CatalogStore, HeadphoneType, MouseSize, Product,
+                     SwitchType, _freeze, normalize_product)
+from gaming_setup import (_SIZE_CODES, COMPONENTS, IDEAL_WEIGHT, UNKNOWN_FIT, UNKNOWN_SWITCH, VALUE_WEIGHT,
+                          WEIGHT_TOLERANCE, ComponentFeatures, SetupIndex)
+from render import RenderCache
+from scoring import RECOMMENDATION_WEIGHTS, SWITCH_CLASS_SCORES, score_product
+from search import FIELD_WEIGHTS, normalize, query_variants, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Товаров в одной пачке INSERT при импорте
+IMPORT_BATCH_SIZE = 1000
+# Размер куска файла при потоковом разборе JSON
+READ_CHUNK_SIZE = 1 << 16
+# Товаров за один запрос при обходе всего каталога
+ITER_CHUNK_SIZE = 500
+# Размеры LRU на одну версию каталога: память бота не зависит от числа товаров
+NAME_CACHE_SIZE = 1024
+PRODUCT_CACHE_SIZE = 4096
+NODE_CACHE_SIZE = 8192
+RENDER_CACHE_SIZE = 8192
+# Кандидатов одного слота сетапа на подбор: лучших по оценке и столько же самых дешёвых
+SETUP_CANDIDATES = 200
+
+SCORE_COLUMNS = MappingProxyType({usage: f"score_{usage}" for usage in RECOMMENDATION_WEIGHTS})
+FTS_TABLE = 'products_fts'
+FTS_COLUMNS = ('brand', 'model', 'description', 'specs')
+
+metadata = sa.MetaData()
+
+catalog_meta = sa.Table(
+    'catalog_meta', metadata,
+    sa.Column('key', sa.String, primary_key=True),
+    sa.Column('value', sa.String, nullable=False),
+)
+
+# position во всех таблицах — порядок первого появления в исходном JSON
+categories = sa.Table(
+    'categories', metadata,
+    sa.Column('position', sa.Integer, primary_key=True),
+    sa.Column('category', sa.String, nullable=False, unique=True),
+    sa.Column('node_id', sa.BigInteger, nullable=False, unique=True),
+)
+
+brands = sa.Table(
+    'brands', metadata,
+    sa.Column('position', sa.Integer, primary_key=True),
+    sa.Column('category', sa.String, nullable=False),
+    sa.Column('brand', sa.String, nullable=False),
+    sa.Column('node_id', sa.BigInteger, nullable=False, unique=True),
+    sa.UniqueConstraint('category', 'brand'),
+    sa.Index('ix_brands_category', 'category', 'position', 'brand'),
+)
+
+products = sa.Table(
+    'products', metadata,
+    sa.Column('position', sa.Integer, primary_key=True),
+    sa.Column('category', sa.String, nullable=False),
+    sa.Column('brand', sa.String, nullable=False),
+    sa.Column('model', sa.String, nullable=False),
+    sa.Column('node_id', sa.BigInteger, nullable=False, unique=True),
+    # NULL — поля не было в исходном JSON (карточка такого товара не показывается)
+    sa.Column('description', sa.Text),
+    sa.Column('price_text', sa.String),
+    sa.Column('photo_url', sa.String),
+    sa.Column('has_specs', sa.Boolean, nullable=False),
+    # Разобранные характеристики для выборок по индексам
+    sa.Column('price', sa.Float),
+    sa.Column('dpi', sa.Integer),
+    sa.Column('polling_rate', sa.Integer),
+    sa.Column('weight', sa.Float),
+    sa.Column('switch_type', sa.String),
+    sa.Column('mouse_size', sa.String),
+    sa.Column('headphone_type', sa.String),
+    sa.Column('frequency_low', sa.Float),
+    sa.Column('frequency_high', sa.Float),
+    # Оценка для рекомендаций, уже округлённая, как в ScoringEngine
+    *(sa.Column(column, sa.Float, nullable=False) for column in SCORE_COLUMNS.values()),
+    sa.UniqueConstraint('category', 'brand', 'model'),
+    sa.Index('ix_products_brand', 'category', 'brand', 'position', 'model'),
+    sa.Index('ix_products_price', 'category', 'price'),
+)
+# top-k рекомендаций читает из такого индекса ровно k строк
+for _column in SCORE_COLUMNS.values():
+    sa.Index(f'ix_products_{_column}_category', products.c.category, products.c[_column].desc(), products.c.position)
+    sa.Index(f'ix_products_{_column}', products.c[_column].desc(), products.c.position)
+
+specs = sa.Table(
+    'specs', metadata,
+    sa.Column('product', sa.Integer, sa.ForeignKey('products.position'), primary_key=True),
+    sa.Column('position', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String, nullable=False),
+    # Значение в JSON: в исходных данных встречаются не только строки
+    sa.Column('value', sa.Text, nullable=False),
+    sa.Index('ix_specs_name', 'name'),
+)
+
+switch_feels = sa.Table(
+    'switch_feels', metadata,
+    sa.Column('feel', sa.String, primary_key=True),
+    sa.Column('product', sa.Integer, sa.ForeignKey('products.position'), primary_key=True),
+    sa.Index('ix_switch_feels_product', 'product'),
+)
+
+_NODE_TABLES = {
+    callbacks.NODE_CATEGORY: (categories, ('category',)),
+    callbacks.NODE_BRAND: (brands, ('category', 'brand')),
+    callbacks.NODE_MODEL: (products, ('category', 'brand', 'model')),
+}
+
+
+def create_engine(url: str) -> sa.Engine:
+    engine = sa.create_engine(url)
+    if engine.dialect.name == 'sqlite':
+        # WAL: бот читает предыдущую ревизию, пока импорт пишет новую
+        @sa.event.listens_for(engine, 'connect')
+        def _configure(connection, _):
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            # pysqlite сам открывает транзакцию только перед DML, и DROP TABLE импорта
+            # выполнился бы вне её; транзакциями управляет SQLAlchemy
+            connection.isolation_level = None
+
+        @sa.event.listens_for(engine, 'begin')
+        def _begin(connection):
+            connection.exec_driver_sql("BEGIN")
+    return engine
+
+
+def read_revision(connection) -> Optional[int]:
+    if not sa.inspect(connection).has_table(catalog_meta.name):
+        return None
+    value = connection.execute(sa.select(catalog_meta.c.value).where(catalog_meta.c.key == 'revision')).scalar()
+    return int(value) if value is not None else None
+
+
+class _JsonStream:
+    """Потоковое чтение вложенных JSON-объектов.
+
+    Ключи внешних уровней разбираются вручную, а каждое значение-лист (товар)
+    целиком отдаётся json.JSONDecoder.raw_decode. В памяти — один товар и кусок файла.
+    """
+
+    def __init__(self, file, chunk_size: int = READ_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.offset:] + chunk
+        self.offset = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.offset < len(self.buffer) and self.buffer[self.offset] in ' \t\r\n':
+                self.offset += 1
+            if self.offset < len(self.buffer):
+                return self.buffer[self.offset]
+            if not self._fill():
+                raise ValueError("неожиданный конец JSON")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"ожидался {char!r}, а не {found!r}")
+        self.offset += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.offset)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на границе куска могло прочитаться не полностью
+            if end == len(self.buffer) and isinstance(value, (int, float)) and self._fill():
+                continue
+            self.offset = end
+            return value
+
+    def keys(self):
+        """Ключи объекта по порядку; значение после каждого ключа читает вызывающий."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.offset += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"ключ объекта должен быть строкой, а не {key!r}")
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.offset += 1
+                continue
+            self.expect('}')
+            return
+
+
+def iter_catalog(file):
+    """(категория, бренд, модель, данные товара) из файла формата tech_data.json."""
+    stream = _JsonStream(file)
+    for category in stream.keys():
+        for brand in stream.keys():
+            for model in stream.keys():
+                yield category, brand, model, stream.value()
+
+
+def _text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class _Importer:
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.count = 0
+        self.fts = connection.dialect.name == 'sqlite'
+        # Только категории и бренды: их на порядки меньше, чем товаров
+        self._categories = set()
+        self._brands = set()
+        self._rows = {'categories': [], 'brands': [], 'products': [], 'specs': [], 'switch_feels': [], FTS_TABLE: []}
+
+    def add(self, category: str, brand: str, model: str, raw):
+        if not isinstance(raw, dict):
+            raise ValueError(f"{category}/{brand}/{model}: ожидался объект товара")
+        if category not in self._categories:
+            self._rows['categories'].append({
+                'position': len(self._categories), 'category': category,
+                'node_id': callbacks.node_hash(callbacks.NODE_CATEGORY, (category,)),
+            })
+            self._categories.add(category)
+        if (category, brand) not in self._brands:
+            self._rows['brands'].append({
+                'position': len(self._brands), 'category': category, 'brand': brand,
+                'node_id': callbacks.node_hash(callbacks.NODE_BRAND, (category, brand)),
+            })
+            self._brands.add((category, brand))
+
+        problems = []
+        product = normalize_product(category, brand, model, _freeze(raw), problems)
+        for problem in problems:
+            logger.warning(f"Каталог: {problem}")
+
+        position = self.count
+        self.count += 1
+        self._rows['products'].append({
+            'position': position,
+            'category': category,
+            'brand': brand,
+            'model': model,
+            'node_id': callbacks.node_hash(callbacks.NODE_MODEL, product.key),
+            'description': _text(raw.get('description')),
+            'price_text': _text(raw.get('price')),
+            'photo_url': _text(raw.get('photo_url')),
+            'has_specs': 'specs' in raw,
+            'price': product.price,
+            'dpi': product.dpi,
+            'polling_rate': product.polling_rate,
+            'weight': product.weight,
+            'switch_type': product.switch_type.value if product.switch_type else None,
+            'mouse_size': product.mouse_size.value if product.mouse_size else None,
+            'headphone_type': product.headphone_type.value if product.headphone_type else None,
+            'frequency_low': product.frequency_range[0] if product.frequency_range else None,
+            'frequency_high': product.frequency_range[1] if product.frequency_range else None,
+            **{SCORE_COLUMNS[usage]: round(score_product(product, weight), 2)
+               for usage, weight in RECOMMENDATION_WEIGHTS.items()},
+        })
+        self._rows['specs'].extend(
+            {'product': position, 'position': number, 'name': name, 'value': json.dumps(value, ensure_ascii=False)}
+            for number, (name, value) in enumerate(raw.get('specs', {}).items())
+        )
+        self._rows['switch_feels'].extend({'feel': feel, 'product': position} for feel in product.switch_feels)
+        if self.fts:
+            self._rows[FTS_TABLE].append({
+                'rowid': position,
+                'brand': normalize(brand),
+                'model': normalize(model),
+                'description': normalize(product.description),
+                'specs': normalize(' '.join(str(value) for value in product.specs.values())),
+            })
+        if len(self._rows['products']) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in (categories, brands, products):
+            if self._rows[table.name]:
+                self._insert_unique(table, self._rows[table.name])
+        if self._rows['specs']:
+            self.connection.execute(specs.insert(), self._rows['specs'])
+        if self._rows['switch_feels']:
+            self.connection.execute(switch_feels.insert(), self._rows['switch_feels'])
+        if self._rows[FTS_TABLE]:
+            self.connection.execute(sa.text(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                f"VALUES (:rowid, {', '.join(':' + column for column in FTS_COLUMNS)})"
+            ), self._rows[FTS_TABLE])
+        for rows in self._rows.values():
+            rows.clear()
+
+    def _insert_unique(self, table: sa.Table, rows: list):
+        try:
+            with self.connection.begin_nested():
+                self.connection.execute(table.insert(), rows)
+            return
+        except sa.exc.IntegrityError:
+            pass
+        # Пачка не вставилась: ищем строку с повтором по одной
+        for row in rows:
+            while True:
+                try:
+                    with self.connection.begin_nested():
+                        self.connection.execute(table.insert(), row)
+                    break
+                except sa.exc.IntegrityError:
+                    columns = [column for column in ('category', 'brand', 'model') if column in row]
+                    duplicate = self.connection.execute(sa.select(table.c.position).where(
+                        *(table.c[column] == row[column] for column in columns)
+                    )).first()
+                    if duplicate is not None:
+                        key = '/'.join(row[column] for column in columns)
+                        raise ValueError(f"{key} встречается в каталоге дважды")
+                    # Коллизия 48-битных хэшей: как и NodeIndex, берём следующий свободный id
+                    logger.warning(f"Коллизия id узлов каталога: {table.name} {row['node_id']}")
+                    row['node_id'] = (row['node_id'] + 1) % callbacks.ID_SPACE
+
+
+def import_json(path: str, url: str, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Переносит каталог из JSON в базу, читая файл потоком; возвращает число товаров.
+
+    Всё происходит в одной транзакции: бот до её конца читает предыдущую ревизию,
+    а после видит новую и перезагружает каталог.
+    """
+    started = time.perf_counter()
+    engine = create_engine(url)
+    with open(path, 'r', encoding='utf-8') as file, engine.begin() as connection:
+        revision = read_revision(connection) or 0
+        connection.execute(sa.text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+        metadata.drop_all(connection)
+        metadata.create_all(connection)
+        importer = _Importer(connection, batch_size)
+        if importer.fts:
+            connection.execute(sa.text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, content='', "
+                f"prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+            ))
+
+        for category, brand, model, raw in iter_catalog(file):
+            importer.add(category, brand, model, raw)
+        importer.flush()
+
+        connection.execute(catalog_meta.insert(), [
+            {'key': 'revision', 'value': str(revision + 1)},
+            {'key': 'source', 'value': path},
+            {'key': 'products', 'value': str(importer.count)},
+            {'key': 'imported_at', 'value': str(time.time())},
+        ])
+    engine.dispose()
+    logger.info(f"Импортировано {importer.count} товаров из {path} за {time.perf_counter() - started:.1f} с "
+                f"(ревизия {revision + 1})")
+    return importer.count
+
+
+class SqlCatalog(CatalogRepository):
+    """Каталог в базе: каждый запрос читает по индексам только нужные строки.
+
+    Списки и товары кэшируются в LRU ограниченного размера, поэтому память бота
+    не растёт вместе с каталогом. Объект живёт до смены ревизии импорта.
+    """
+
+    __slots__ = ('engine', 'version', 'revision', 'loaded_at', 'indexes', '_names', '_products')
+
+    def __init__(self, engine: sa.Engine, version: int, revision: int, index_builders: dict = None):
+        self.engine = engine
+        self.version = version
+        self.revision = revision
+        self.loaded_at = time.time()
+        self._names = LRUCache(NAME_CACHE_SIZE)
+        self._products = LRUCache(PRODUCT_CACHE_SIZE)
+        self.indexes = MappingProxyType({
+            name: build(self) for name, build in (index_builders or {}).items()
+        })
+
+    def _names_of(self, key: tuple, statement) -> tuple:
+        def query():
+            with self.engine.connect() as connection:
+                return tuple(connection.execute(statement).scalars())
+        return self._names.get_or_compute(key, query)
+
+    def categories(self) -> tuple:
+        return self._names_of(('categories',), sa.select(categories.c.category).order_by(categories.c.position))
+
+    def brand_names(self, category: str) -> tuple:
+        return self._names_of(('brands', category), sa.select(brands.c.brand)
+                              .where(brands.c.category == category).order_by(brands.c.position))
+
+    def model_names(self, category: str, brand: str) -> tuple:
+        return self._names_of(('models', category, brand), sa.select(products.c.model)
+                              .where(products.c.category == category, products.c.brand == brand)
+                              .order_by(products.c.position))
+
+    def load(self, condition, order_by: tuple = (products.c.position,), limit: int = None,
+             cache: bool = True) -> list:
+        """[(строка products, Product)] по условию; характеристики читаются одним запросом."""
+        with self.engine.connect() as connection:
+            rows = connection.execute(sa.select(products).where(condition).order_by(*order_by).limit(limit)).all()
+            spec_rows = connection.execute(
+                sa.select(specs).where(specs.c.product.in_([row.position for row in rows]))
+                .order_by(specs.c.product, specs.c.position)
+            ).all() if rows else ()
+
+        values = {}
+        for spec in spec_rows:
+            values.setdefault(spec.product, {})[spec.name] = json.loads(spec.value)
+        loaded = []
+        for row in rows:
+            raw = {'specs': values.get(row.position, {})} if row.has_specs else {}
+            for field, column in (('description', 'description'), ('price', 'price_text'), ('photo_url', 'photo_url')):
+                if row._mapping[column] is not None:
+                    raw[field] = row._mapping[column]
+            # Ошибки разбора уже записаны в лог при импорте
+            product = normalize_product(row.category, row.brand, row.model, _freeze(raw), [])
+            if cache:
+                self._products.put(product.key, product)
+            loaded.append((row, product))
+        return loaded
+
+    def product(self, category: str, brand: str, model: str):
+        def query():
+            found = self.load((products.c.category == category) & (products.c.brand == brand)
+                              & (products.c.model == model))
+            return found[0][1] if found else None
+        return self._products.get_or_compute((category, brand, model), query)
+
+    def photo_urls(self, keys: list) -> dict:
+        # Только ключ и ссылка, без характеристик и мимо LRU товаров
+        key_columns = sa.tuple_(products.c.category, products.c.brand, products.c.model)
+        found = {}
+        with self.engine.connect() as connection:
+            for start in range(0, len(keys), ITER_CHUNK_SIZE):
+                rows = connection.execute(
+                    sa.select(products.c.category, products.c.brand, products.c.model, products.c.photo_url)
+                    .where(key_columns.in_(keys[start:start + ITER_CHUNK_SIZE]))
+                )
+                found.update({(row.category, row.brand, row.model): row.photo_url or '' for row in rows})
+        return found
+
+    def iter_products(self):
+        last = -1
+        while True:
+            # Обход по диапазонам ключа не засоряет LRU и не держит курсор открытым между пачками
+            chunk = self.load(products.c.position > last, limit=ITER_CHUNK_SIZE, cache=False)
+            if not chunk:
+                return
+            for _, product in chunk:
+                yield product
+            last = chunk[-1][0].position
+
+
+class SqlRenderCache(RenderCache):
+    """RenderCache каталога в базе: экраны в LRU, а не все до смены ревизии."""
+
+    def __init__(self, catalog: SqlCatalog):
+        super().__init__(catalog, maxsize=RENDER_CACHE_SIZE)
+
+
+class SqlNodeIndex:
+    """NodeIndex поверх таблиц каталога: id узлов посчитаны при импорте тем же хэшем."""
+
+    def __init__(self, catalog: SqlCatalog):
+        self._engine = catalog.engine
+        self._ids = LRUCache(NODE_CACHE_SIZE)
+        self._nodes = LRUCache(NODE_CACHE_SIZE)
+
+    def token(self, kind: str, *key) -> str:
+        def query():
+            table, columns = _NODE_TABLES[kind]
+            with self._engine.connect() as connection:
+                number = connection.execute(sa.select(table.c.node_id).where(
+                    *(table.c[column] == value for column, value in zip(columns, key))
+                )).scalar()
+            if number is None:
+                raise KeyError((kind, key))
+            return callbacks.to_base36(number)
+        return self._ids.get_or_compute((kind, key), query)
+
+    def category(self, category: str) -> str:
+        return self.token(callbacks.NODE_CATEGORY, category)
+
+    def brand(self, category: str, brand: str) -> str:
+        return self.token(callbacks.NODE_BRAND, category, brand)
+
+    def model(self, category: str, brand: str, model: str) -> str:
+        return self.token(callbacks.NODE_MODEL, category, brand, model)
+
+    def resolve(self, token: str, kind: str) -> Optional[tuple]:
+        try:
+            number = int(token, 36)
+        except (TypeError, ValueError):
+            return None
+        if kind not in _NODE_TABLES or not 0 <= number < callbacks.ID_SPACE:
+            return None
+
+        def query():
+            table, columns = _NODE_TABLES[kind]
+            with self._engine.connect() as connection:
+                row = connection.execute(
+                    sa.select(*(table.c[column] for column in columns)).where(table.c.node_id == number)
+                ).first()
+            return tuple(row) if row else None
+        return self._nodes.get_or_compute((kind, number), query)
+
+
+class SqlScoring:
+    """ScoringEngine.top по оценкам, посчитанным при импорте."""
+
+    def __init__(self, catalog: SqlCatalog):
+        self._catalog = catalog
+
+    def top(self, usage: str, category: str = None, k: int = 3) -> list:
+        column = products.c[SCORE_COLUMNS.get(usage, SCORE_COLUMNS['gaming'])]
+        condition = products.c.category == category if category is not None else sa.true()
+        # При равных оценках раньше идёт товар, стоящий раньше в каталоге, как и в ScoringEngine
+        found = self._catalog.load(condition, order_by=(column.desc(), products.c.position), limit=k)
+        return [(product, row._mapping[column.name]) for row, product in found]
+
+
+class SqlSearch:
+    """Поиск по FTS5 SQLite: слова запроса как префиксы вместе с вариантами раскладки и транслитерации.
+
+    В отличие от SearchIndex опечатки не исправляются. Для других СУБД поиск пуст.
+    """
+
+    def __init__(self, catalog: SqlCatalog):
+        self._catalog = catalog
+        with catalog.engine.connect() as connection:
+            self.available = sa.inspect(connection).has_table(FTS_TABLE)
+        if not self.available:
+            logger.warning("В базе каталога нет полнотекстового индекса, поиск отключён")
+
+    def _match(self, expression: str, limit: int) -> list:
+        weights = ', '.join(str(FIELD_WEIGHTS[column]) for column in FTS_COLUMNS)
+        with self._catalog.engine.connect() as connection:
+            return list(connection.execute(sa.text(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :expression "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit"
+            ), {'expression': expression, 'limit': limit}).scalars())
+
+    def search(self, text: str, limit: int = 10) -> list:
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms or not self.available:
+            return []
+        groups = [
+            '(' + ' OR '.join(f'"{variant}"*' for variant, _ in query_variants(term)) + ')'
+            for term in terms
+        ]
+        positions = self._match(' AND '.join(groups), limit)
+        if len(positions) < limit and len(groups) > 1:
+            # Как и SearchIndex, после товаров со всеми словами идут частичные совпадения
+            positions += [position for position in self._match(' OR '.join(groups), limit)
+                          if position not in positions]
+            positions = positions[:limit]
+        found = {row.position: product for row, product in self._catalog.load(products.c.position.in_(positions))}
+        return [found[position] for position in positions if position in found]
+
+
+def _clip(value, low: float, high: float):
+    return sa.case((value < low, low), (value > high, high), else_=value)
+
+
+def _setup_score(component: str, profile: dict, hand_size: Optional[MouseSize], switch_feel: str):
+    """ComponentFeatures.scores выражением SQL: по нему база отбирает кандидатов слота."""
+    c = products.c
+    score = sa.case((c.price.is_(None), 0.0), else_=1 - _clip(c.price / 300.0, 0.0, 1.0)) * VALUE_WEIGHT
+    if component == 'mouse':
+        if hand_size is None:
+            fit = UNKNOWN_FIT
+        else:
+            by_size = sa.case({
+                size.value: min(max(1 - 0.5 * abs(code - _SIZE_CODES[hand_size]), 0.0), 1.0)
+                for size, code in _SIZE_CODES.items()
+            }, value=c.mouse_size)
+            by_weight = _clip(1 - sa.func.abs(c.weight - IDEAL_WEIGHT[hand_size]) / WEIGHT_TOLERANCE, 0.0, 1.0) * 0.8
+            fit = sa.case((c.mouse_size.is_not(None), by_size), (c.weight.is_(None), UNKNOWN_FIT), else_=by_weight)
+        light = sa.case((c.weight.is_(None), UNKNOWN_FIT), else_=_clip((120 - c.weight) / 60.0, 0.0, 1.0))
+        sensor = (sa.case((c.dpi.is_(None), 0.0), else_=_clip(c.dpi * (1 / 16000), 0.0, 1.0) * 0.6)
+                  + sa.case((c.polling_rate.is_(None), 0.0), else_=_clip(c.polling_rate * (1 / 8000), 0.0, 1.0) * 0.4))
+        score += profile['fit'] * fit + profile['light'] * light + profile['sensor'] * sensor
+    elif component == 'keyboard':
+        if switch_feel in SWITCH_FEEL_KEYWORDS:
+            def has_feel(*conditions):
+                return sa.exists().where(switch_feels.c.product == c.position, *conditions)
+            switch = sa.case((has_feel(switch_feels.c.feel == switch_feel), 1.0), (has_feel(), 0.0),
+                             else_=UNKNOWN_SWITCH)
+        else:
+            switch = UNKNOWN_SWITCH
+        speed = sa.case({switch_type.value: value for switch_type, value in SWITCH_CLASS_SCORES.items()},
+                        value=c.switch_type, else_=0.0)
+        score += profile['switch'] * switch + profile['speed'] * speed
+    elif component == 'headphones':
+        detail = sa.case((c.frequency_high.is_(None), 0.0),
+                         else_=0.5 + _clip((c.frequency_high - 20000) / 20000.0, 0.0, 0.5))
+        bass = sa.case((c.frequency_low.is_(None), 0.0), else_=_clip((20 - c.frequency_low) / 10.0, 0.0, 1.0))
+        on_ear = sa.case((c.headphone_type == HeadphoneType.ON_EAR.value, 1.0), else_=0.0)
+        score += profile['detail'] * detail + profile['bass'] * bass + profile['comfort'] * on_ear
+    return score
+
+
+class SqlSetupIndex(SetupIndex):
+    """SetupIndex поверх базы: на ревизию в памяти только самые низкие цены категорий.
+
+    На каждый подбор из базы читаются SETUP_CANDIDATES товаров слота с лучшей оценкой
+    и столько же самых дешёвых из укладывающихся в бюджет. Сетап ищется среди них:
+    на огромной категории с тесным бюджетом он может немного уступать полному перебору.
+    """
+
+    _COLUMNS = (products.c.position, products.c.category, products.c.brand, products.c.model, products.c.price,
+                products.c.dpi, products.c.polling_rate, products.c.weight, products.c.switch_type,
+                products.c.mouse_size, products.c.headphone_type, products.c.frequency_low, products.c.frequency_high)
+
+    def __init__(self, catalog: SqlCatalog):
+        self._snapshot = catalog
+        self._engine = catalog.engine
+        with catalog.engine.connect() as connection:
+            lowest = dict(connection.execute(
+                sa.select(products.c.category, sa.func.min(products.c.price))
+                .where(products.c.category.in_([category for _, category in COMPONENTS]))
+                .group_by(products.c.category)
+            ).all())
+        self._lowest = {
+            component: float('inf') if lowest[category] is None else lowest[category]
+            for component, category in COMPONENTS if category in lowest
+        }
+
+    def _cheapest(self) -> dict:
+        return self._lowest
+
+    def _candidates(self, component: str, profile: dict, hand_size: Optional[MouseSize], switch_feel: str,
+                    price_limit: Optional[float]) -> ComponentFeatures:
+        condition = products.c.category == dict(COMPONENTS)[component]
+        if price_limit is not None:
+            condition &= products.c.price <= price_limit
+        score = _setup_score(component, profile, hand_size, switch_feel)
+        queries = [sa.select(*self._COLUMNS).where(condition)
+                   .order_by(score.desc(), products.c.position).limit(SETUP_CANDIDATES)]
+        if price_limit is not None:
+            # Лучшие по оценке могут не сложиться в бюджет: тогда выручают дешёвые
+            queries.append(sa.select(*self._COLUMNS).where(condition)
+                           .order_by(products.c.price, products.c.position).limit(SETUP_CANDIDATES))
+        with self._engine.connect() as connection:
+            rows = {row.position: row for query in queries for row in connection.execute(query)}
+            feels = {}
+            for position, feel in connection.execute(
+                sa.select(switch_feels.c.product, switch_feels.c.feel).where(switch_feels.c.product.in_(list(rows)))
+            ):
+                feels.setdefault(position, set()).add(feel)
+        # Только разобранные признаки: описание и характеристики для оценки не нужны
+        return ComponentFeatures(Product(
+            category=row.category, brand=row.brand, model=row.model, description='',
+            specs=MappingProxyType({}), price_text='', photo_url='',
+            price=row.price, dpi=row.dpi, polling_rate=row.polling_rate, weight=row.weight,
+            switch_type=SwitchType(row.switch_type) if row.switch_type else None,
+            switch_feels=frozenset(feels.get(row.position, ())),
+            mouse_size=MouseSize(row.mouse_size) if row.mouse_size else None,
+            headphone_type=HeadphoneType(row.headphone_type) if row.headphone_type else None,
+            frequency_range=(row.frequency_low, row.frequency_high) if row.frequency_low is not None else None,
+        ) for row in (rows[position] for position in sorted(rows)))
+
+
+class SqlCatalogStore(CatalogStore):
+    """CatalogStore поверх базы, заполненной import_json: перезагрузка — при смене ревизии импорта."""
+
+    def __init__(self, url: str, check_interval: float = 5.0, index_builders: dict = None):
+        self.engine = create_engine(url)
+        super().__init__(self.engine.url.render_as_string(hide_password=True), check_interval, index_builders)
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            try:
+                with self.engine.connect() as connection:
+                    revision = read_revision(connection)
+            except sa.exc.SQLAlchemyError as e:
+                logger.error(f"База каталога недоступна: {e}")
+                return False
+            if revision is None:
+                logger.error(f"В {self.path} нет каталога: сначала выполните импорт (python catalog_db.py)")
+                return False
+
+            if not force and revision == self._attempted_mtime:
+                return False
+            self._attempted_mtime = revision
+
+            try:
+                snapshot = SqlCatalog(self.engine, self._version + 1, revision, self.index_builders)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки данных: {e}")
+                return False
+
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            logger.info(f"Каталог подключён из {self.path} (ревизия {revision}, версия {snapshot.version})")
+
+        self._notify_listeners(snapshot)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт каталога из JSON в базу для CATALOG_URL")
+    parser.add_argument('source', nargs='?', default=config.TECH_DATA_PATH, help="JSON в формате tech_data.json")
+    parser.add_argument('url', nargs='?', default=config.CATALOG_URL or 'sqlite:///catalog.sqlite3',
+                        help="URL SQLAlchemy базы каталога")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    import_json(args.source, args.url, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
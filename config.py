@@ -0,0 +1,104 @@
+import os
+
+
+def _int_set(value: str) -> frozenset:
+    return frozenset(int(item) for item in value.replace(' ', '').split(',') if item)
+
+
+# Режим запуска: development (по умолчанию) или production
+BOT_ENV = os.environ.get('BOT_ENV', 'development')
+BOT_TOKEN = os.environ.get('BOT_TOKEN', 'TOKEN')
+# Альтернативный адрес Bot API (например, локальный сервер для нагрузочных тестов)
+BOT_API_BASE_URL = os.environ.get('BOT_API_BASE_URL', '')
+
+# Получение апдейтов: polling (по умолчанию, для локальной разработки) или webhook
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', os.environ.get('PORT', '8443')))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+# Публичный адрес, который регистрируется в Telegram, без пути (https://example.com)
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Сколько апдейтов обрабатывать одновременно (1 — строго по очереди)
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', '64' if BOT_ENV == 'production' else '1'))
+# Соединения к Bot API при параллельной обработке. Пул httpx выбирает соединение
+# за O(размер пула), поэтому слишком большой пул съедает CPU
+CONNECTION_POOL_SIZE = int(os.environ.get('CONNECTION_POOL_SIZE', '16'))
+# Потоки для блокирующей работы (чтение каталога, скоринг)
+BLOCKING_WORKERS = int(os.environ.get('BLOCKING_WORKERS', '4'))
+
+# Каталог
+TECH_DATA_PATH = os.environ.get('TECH_DATA_PATH', 'tech_data.json')
+# URL SQLAlchemy базы каталога, заполненной python catalog_db.py (пусто — читать JSON)
+CATALOG_URL = os.environ.get('CATALOG_URL', '')
+# Как часто (в секундах) проверять mtime файла каталога
+CATALOG_CHECK_INTERVAL = float(os.environ.get('CATALOG_CHECK_INTERVAL', '5'))
+# Готовый снимок каталога с индексами (python bot.py build-snapshot): старт без разбора JSON и сборки индексов.
+# Снимок, собранный из другого tech_data.json или другой версией кода, пропускается; пусто — не использовать
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', 'catalog.snapshot')
+# Обновление цен и характеристик со страниц магазинов (поле source_url товара в tech_data.json):
+# период в секундах, 0 — не обновлять. Работает только с каталогом из JSON
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', '3600'))
+# Одновременных запросов к страницам и таймаут одного запроса в секундах
+REFRESH_CONCURRENCY = int(os.environ.get('REFRESH_CONCURRENCY', '8'))
+REFRESH_TIMEOUT = float(os.environ.get('REFRESH_TIMEOUT', '10'))
+# Сколько готовых подборок (рекомендации, сетапы) держать в памяти
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+# Сколько результатов текстового и inline-поиска держать в памяти: почти каждый запрос новый,
+# поэтому они живут в отдельном кэше и не вытесняют подборки
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '256'))
+
+# Кэш file_id фотографий товаров (пустое значение отключает кэш)
+PHOTO_CACHE_PATH = os.environ.get('PHOTO_CACHE_PATH', 'photo_cache.sqlite3')
+# Чат для предварительной загрузки всех фото при старте (0 — не прогревать)
+PHOTO_WARMUP_CHAT_ID = int(os.environ.get('PHOTO_WARMUP_CHAT_ID', '0'))
+PHOTO_WARMUP_DELAY = float(os.environ.get('PHOTO_WARMUP_DELAY', '3'))
+# Чат, куда заранее заливаются фото карточек без file_id (по умолчанию — чат прогрева)
+PHOTO_STAGING_CHAT_ID = int(os.environ.get('PHOTO_STAGING_CHAT_ID', PHOTO_WARMUP_CHAT_ID))
+
+# Отправка сообщений
+SEND_CONCURRENCY = int(os.environ.get('SEND_CONCURRENCY', '20'))
+SEND_CONCURRENCY_PER_CHAT = int(os.environ.get('SEND_CONCURRENCY_PER_CHAT', '3'))
+PHOTO_SEND_TIMEOUT = float(os.environ.get('PHOTO_SEND_TIMEOUT', '5'))
+# Рекомендации одним альбомом (send_media_group) вместо отдельного фото на каждую
+RECOMMENDATIONS_ALBUM = os.environ.get('RECOMMENDATIONS_ALBUM', '1') == '1'
+# Уменьшенные копии фото, которые отправляются файлом (пусто — фото уходят ссылкой)
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR', 'thumbnails')
+THUMBNAIL_CACHE_BYTES = int(os.environ.get('THUMBNAIL_CACHE_BYTES', str(64 * 2 ** 20)))
+THUMBNAIL_MAX_SIDE = int(os.environ.get('THUMBNAIL_MAX_SIDE', '800'))
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', '85'))
+THUMBNAIL_FETCH_TIMEOUT = float(os.environ.get('THUMBNAIL_FETCH_TIMEOUT', '10'))
+
+# Очередь исходящих запросов: правки одного сообщения склеиваются, запросы в чат
+# идут не чаще лимитов Telegram, после 429 выдерживается retry_after
+OUTBOUND_QUEUE = os.environ.get('OUTBOUND_QUEUE', '1') == '1'
+# Запросов в секунду на всех и на один чат (0 — без лимита) и запас на короткий всплеск в чате
+OUTBOUND_GLOBAL_RATE = float(os.environ.get('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.environ.get('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = int(os.environ.get('OUTBOUND_CHAT_BURST', '10'))
+# Повторы после 429; дольше OUTBOUND_MAX_RETRY_AFTER секунд не ждём и отдаём ошибку
+OUTBOUND_MAX_RETRIES = int(os.environ.get('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_MAX_RETRY_AFTER = float(os.environ.get('OUTBOUND_MAX_RETRY_AFTER', '30'))
+# Сколько держать простаивающее соединение с Bot API открытым
+OUTBOUND_KEEPALIVE_EXPIRY = float(os.environ.get('OUTBOUND_KEEPALIVE_EXPIRY', '60'))
+
+# Хранилище состояния пользователей: URL SQLAlchemy (sqlite:///state.sqlite3) или mongodb://...
+# Пустое значение — состояние живёт только в памяти процесса
+PERSISTENCE_URL = os.environ.get('PERSISTENCE_URL', '')
+PERSISTENCE_FLUSH_INTERVAL = float(os.environ.get('PERSISTENCE_FLUSH_INTERVAL', '30'))
+PERSISTENCE_BATCH_SIZE = int(os.environ.get('PERSISTENCE_BATCH_SIZE', '500'))
+# Через сколько секунд без активности незавершённый сценарий считается брошенным
+USER_STATE_TTL = float(os.environ.get('USER_STATE_TTL', str(24 * 60 * 60)))
+
+# Метрики: порт HTTP-эндпоинта /metrics в формате Prometheus (0 — не поднимать)
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+# Доля апдейтов, для которых замеряется разбивка времени по фазам (счётчики ведутся всегда)
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1'))
+# Писать по замеренным апдейтам строку JSON в лог
+METRICS_LOG_UPDATES = os.environ.get('METRICS_LOG_UPDATES', '') == '1'
+
+# Пользователи, которым доступны служебные команды (/reload)
+ADMIN_IDS = _int_set(os.environ.get('ADMIN_IDS', ''))
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import re
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+import config
+import metrics
+from processing import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит одновременных запросов к Bot API и отдельный — на каждый чат
+_global_slots = asyncio.Semaphore(config.SEND_CONCURRENCY)
+_chat_slots = weakref.WeakValueDictionary()
+# Сколько фото Telegram принимает в одном альбоме
+ALBUM_SIZE = range(2, 11)
+# Telegram принимает фото файлом до 10 МБ
+MAX_UPLOAD_BYTES = 10 * 2 ** 20
+USER_AGENT = 'Analitik-bot/1.0 (+photos)'
+# Отказы Bot API из-за самого фото: устаревший file_id или недоступная ссылка
+_FILE_ERROR_RE = re.compile(r'file|photo|http url|web page', re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Card:
+    text: str
+    reply_markup: object = None
+    photo_url: str = ''
+    photo_key: tuple = ()
+
+
+def _slots_for(chat_id: int) -> asyncio.Semaphore:
+    slots = _chat_slots.get(chat_id)
+    if slots is None:
+        slots = asyncio.Semaphore(config.SEND_CONCURRENCY_PER_CHAT)
+        _chat_slots[chat_id] = slots
+    return slots
+
+
+async def _limited(chat_id: int, request, timeout: float = None):
+    # Таймаут считается от получения слотов: ожидание в очереди не превращает карточку в текст.
+    # Очередь за слотами — ожидание Bot API, а не собственное время обработчика
+    chat_slots = _slots_for(chat_id)
+    with metrics.telegram_wait():
+        async with chat_slots, _global_slots:
+            return await asyncio.wait_for(request(), timeout)
+
+
+async def _stage_photo(bot, chat_id: int, photo_cache, card: Card) -> Optional[str]:
+    # Заливаем фото в служебный чат, чтобы получить file_id, не задерживая пользователя
+    file_id = photo_cache.lookup(card.photo_key, card.photo_url)
+    if file_id:
+        return file_id
+
+    staging_chat_id = config.PHOTO_STAGING_CHAT_ID
+    try:
+        # Слоты чата пользователя: чужие подборки не ждут загрузок одного пользователя
+        message = await _limited(chat_id, lambda: bot.send_photo(
+            chat_id=staging_chat_id, photo=card.photo_url, disable_notification=True
+        ), config.PHOTO_SEND_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить фото {card.photo_key}: {e}")
+        metrics.PHOTO_FAILURES.inc('staging')
+        return None
+
+    photo_cache.remember(card.photo_key, card.photo_url, message)
+    try:
+        await message.delete()
+    except Exception as e:
+        logger.warning(f"Не удалось удалить служебное фото {card.photo_key}: {e}")
+    return message.photo[-1].file_id
+
+
+async def _download_photo(client: httpx.AsyncClient, card: Card) -> Optional[bytes]:
+    # Без служебного чата фото скачивает сам бот: медленный хостинг картинок не держит очередь карточек
+    try:
+        response = await asyncio.wait_for(client.get(card.photo_url), config.PHOTO_SEND_TIMEOUT)
+        response.raise_for_status()
+    except Exception as e:
+        logger.error(f"Не удалось скачать фото {card.photo_key}: {e}")
+        metrics.PHOTO_FAILURES.inc('download')
+        return None
+    if len(response.content) > MAX_UPLOAD_BYTES:
+        metrics.PHOTO_FAILURES.inc('too_large')
+        return None
+    return response.content
+
+
+async def _prepare_photos(bot, chat_id: int, cards: list, photo_cache) -> list:
+    """Фото каждой карточки для отправки, подготовленные параллельно: file_id, байты файла или ссылка."""
+    photos = [photo_cache.lookup(card.photo_key, card.photo_url) if photo_cache is not None else None
+              for card in cards]
+    missing = [i for i, card in enumerate(cards) if card.photo_url and not photos[i]]
+    if not missing:
+        return photos
+    if photo_cache is not None and config.PHOTO_STAGING_CHAT_ID:
+        prepared = await asyncio.gather(*(_stage_photo(bot, chat_id, photo_cache, cards[i]) for i in missing))
+    else:
+        async with httpx.AsyncClient(headers={'User-Agent': USER_AGENT}, follow_redirects=True) as client:
+            prepared = await asyncio.gather(*(_download_photo(client, cards[i]) for i in missing))
+    for i, photo in zip(missing, prepared):
+        photos[i] = photo
+    return photos
+
+
+async def _send_photo(bot, chat_id: int, card: Card, photo, photo_cache=None):
+    message = await _limited(chat_id, lambda: bot.send_photo(
+        chat_id=chat_id,
+        photo=photo,
+        caption=card.text,
+        parse_mode='HTML',
+        reply_markup=card.reply_markup
+    ), config.PHOTO_SEND_TIMEOUT)
+    # Файл или ссылка: Telegram сохранил исходное фото, его file_id пригодится следующим карточкам
+    if photo_cache is not None and (isinstance(photo, bytes) or photo == card.photo_url):
+        photo_cache.remember(card.photo_key, card.photo_url, message)
+    return message
+
+
+async def _send_card(bot, chat_id: int, card: Card, photo, photo_cache=None):
+    # Подготовленное фото, затем ссылка, и только если не прошло и то и другое — текст
+    attempts = [photo] if photo else []
+    if card.photo_url and photo != card.photo_url:
+        attempts.append(card.photo_url)
+    for attempt in attempts:
+        try:
+            return await _send_photo(bot, chat_id, card, attempt, photo_cache)
+        except Exception as e:
+            logger.error(f"Ошибка отправки фото: {e}")
+            metrics.PHOTO_FAILURES.inc('timeout' if isinstance(e, asyncio.TimeoutError) else 'error')
+            if photo_cache is not None and isinstance(attempt, str) and attempt != card.photo_url:
+                photo_cache.forget(card.photo_key)
+
+    if card.photo_url:
+        metrics.PHOTO_FALLBACKS.inc()
+    return await _limited(chat_id, lambda: bot.send_message(
+        chat_id=chat_id,
+        text=card.text,
+        parse_mode='HTML',
+        reply_markup=card.reply_markup
+    ))
+
+
+async def send_cards(bot, chat_id: int, cards: list, photo_cache=None) -> list:
+    """Отправляет карточки в порядке ранга, не давая медленной картинке задержать остальные.
+
+    Фото без file_id сначала параллельно готовятся: загружаются в служебный чат,
+    если он задан, иначе скачиваются ботом. Затем карточки уходят по порядку уже
+    по file_id или файлом, и медленный хостинг картинок задерживает ответ не на
+    сумму, а на самую долгую загрузку, но не дольше PHOTO_SEND_TIMEOUT.
+    """
+    photos = await _prepare_photos(bot, chat_id, cards, photo_cache)
+
+    results = []
+    for card, photo in zip(cards, photos):
+        try:
+            results.append(await _send_card(bot, chat_id, card, photo, photo_cache))
+        except Exception as e:
+            logger.error(f"Ошибка отправки карточки: {e}")
+            results.append(e)
+    return results
+
+
+async def _album_photo(card: Card, photo_cache, album_cache, thumbnails) -> tuple:
+    """(фото для InputMediaPhoto, откуда оно): file_id, байты миниатюры или ссылка."""
+    for cache, source in ((photo_cache, 'file_id'), (album_cache, 'album_file_id')):
+        file_id = cache.lookup(card.photo_key, card.photo_url) if cache is not None else None
+        if file_id:
+            return file_id, source
+    if thumbnails is not None:
+        # Миниатюра читается с диска: не в цикле событий
+        data = await run_blocking(thumbnails.get, card.photo_url)
+        if data is not None:
+            return data, 'thumbnail'
+        # Сейчас фото уйдёт ссылкой, а к следующему разу будет готова миниатюра
+        thumbnails.prefetch(card.photo_url)
+    return card.photo_url, 'url'
+
+
+async def send_album(bot, chat_id: int, cards: list, photo_cache=None, thumbnails=None, album_cache=None) -> list:
+    """Отправляет карточки одним альбомом: один запрос к Bot API вместо запроса на каждую.
+
+    Фото уходит по file_id, если Telegram его уже знает, иначе файлом из кэша
+    миниатюр и только при промахе кэша — ссылкой. file_id загруженных миниатюр
+    хранятся в album_cache, а не в photo_cache: карточке товара нужно полное фото.
+    У альбома нет кнопок, поэтому клавиатуру показывает вызывающий. Если альбом
+    не собрать (не у всех карточек есть фото) или Telegram его отклонил, карточки
+    уходят по одной через send_cards; после таймаута — нет, альбом мог дойти, а после
+    429 альбом один раз повторяется через retry_after: карточки по одной — лишние запросы
+    в чат, который и так упёрся в лимит.
+    """
+    if len(cards) not in ALBUM_SIZE or not all(card.photo_url for card in cards):
+        return await send_cards(bot, chat_id, cards, photo_cache)
+
+    photos = await asyncio.gather(*(_album_photo(card, photo_cache, album_cache, thumbnails) for card in cards))
+    media = [InputMediaPhoto(photo, caption=card.text, parse_mode='HTML') for card, (photo, _) in zip(cards, photos)]
+    sources = [source for _, source in photos]
+    for attempt in range(2):
+        try:
+            messages = await _limited(chat_id, lambda: bot.send_media_group(chat_id=chat_id, media=media),
+                                      config.PHOTO_SEND_TIMEOUT)
+            break
+        except (asyncio.TimeoutError, TimedOut) as e:
+            logger.error(f"Таймаут отправки альбома: {e}")
+            metrics.PHOTO_FAILURES.inc('timeout')
+            return []
+        except RetryAfter as e:
+            metrics.PHOTO_FAILURES.inc('flood')
+            if attempt or e.retry_after > config.OUTBOUND_MAX_RETRY_AFTER:
+                logger.error(f"Флуд-контроль Telegram: альбом в чат {chat_id} не отправлен ({e})")
+                return []
+            logger.warning(f"Флуд-контроль Telegram: альбом в чат {chat_id}, повтор через {e.retry_after} с")
+            await asyncio.sleep(e.retry_after)
+            metrics.record_throttle(e.retry_after)
+        except Exception as e:
+            logger.error(f"Ошибка отправки альбома: {e}")
+            metrics.PHOTO_FAILURES.inc('album')
+            if isinstance(e, BadRequest) and _FILE_ERROR_RE.search(e.message):
+                # Какой из file_id не подошёл, Telegram не сообщает: забываем все, что были в альбоме
+                caches = {'file_id': photo_cache, 'album_file_id': album_cache}
+                for card, source in zip(cards, sources):
+                    if caches.get(source) is not None:
+                        caches[source].forget(card.photo_key)
+            return await send_cards(bot, chat_id, cards, photo_cache)
+
+    for card, source, message in zip(cards, sources, messages):
+        metrics.ALBUM_PHOTOS.inc(source)
+        # По ссылке Telegram сохранил исходное фото, а уменьшенное годится только альбомам
+        if source == 'url' and photo_cache is not None:
+            photo_cache.remember(card.photo_key, card.photo_url, message)
+        elif source == 'thumbnail' and album_cache is not None:
+            album_cache.remember(card.photo_key, card.photo_url, message)
+    return list(messages)
@@ -0,0 +1,209 @@
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+import numpy as np
+
+from catalog import MouseSize
+
+SPEC_CONNECTION = 'Подключение'
+SPEC_LIGHTING = 'Подсветка'
+SPEC_SIZE = 'Размер'
+SPEC_SWITCHES = 'Тип переключателей'
+
+_WIRED_RE = re.compile(r'(?<!бес)проводн|usb|3\.5')
+
+
+@dataclass(frozen=True)
+class Option:
+    label: str
+    matches: object  # Product -> bool
+
+
+@dataclass(frozen=True)
+class Facet:
+    # Код фасета и номер варианта попадают в callback_data, поэтому их нельзя переставлять
+    code: str
+    title: str
+    options: tuple
+
+    def __reduce__(self):
+        # Условия вариантов — замыкания, их pickle не сохраняет; фасет пишется ссылкой на константу модуля
+        return next(name for name, value in globals().items() if value is self)
+
+
+def _between(attribute: str, low: float, high: float):
+    def matches(product):
+        value = getattr(product, attribute)
+        return value is not None and low <= value < high
+    return matches
+
+
+def _spec_contains(spec: str, *keywords, pattern=None):
+    def matches(product):
+        value = str(product.specs.get(spec, '')).lower()
+        if not value:
+            return False
+        return any(keyword in value for keyword in keywords) or bool(pattern and pattern.search(value))
+    return matches
+
+
+def _spec_lacks(spec: str, *keywords):
+    def matches(product):
+        value = str(product.specs.get(spec, '')).lower()
+        return bool(value) and not any(keyword in value for keyword in keywords)
+    return matches
+
+
+def _attribute_is(attribute: str, expected):
+    return lambda product: getattr(product, attribute) == expected
+
+
+# Механические переключатели в каталоге часто названы только по серии или цвету
+_mechanical = _spec_contains(SPEC_SWITCHES, 'механич', 'mechanical', 'cherry', 'red', 'brown', 'blue',
+                             'linear', 'tactile', 'clicky', 'gx', 'gl ')
+_not_mechanical = _spec_contains(SPEC_SWITCHES, 'оптич', 'optical', 'мембран', 'ножнич')
+
+PRICE = Facet('p', "💰 Цена", (
+    Option("до $60", _between('price', 0, 60)),
+    Option("$60–100", _between('price', 60, 100)),
+    Option("$100–150", _between('price', 100, 150)),
+    Option("$150–200", _between('price', 150, 200)),
+    Option("от $200", _between('price', 200, float('inf'))),
+))
+
+CONNECTION = Facet('c', "📡 Подключение", (
+    Option("Беспроводное", _spec_contains(SPEC_CONNECTION, 'беспровод', 'bluetooth', 'lightspeed', '2.4ghz')),
+    Option("Проводное", _spec_contains(SPEC_CONNECTION, pattern=_WIRED_RE)),
+    Option("Bluetooth", _spec_contains(SPEC_CONNECTION, 'bluetooth')),
+))
+
+LIGHTING = Facet('l', "🌈 Подсветка", (
+    Option("RGB", _spec_contains(SPEC_LIGHTING, 'rgb')),
+    Option("Без RGB", _spec_lacks(SPEC_LIGHTING, 'rgb')),
+))
+
+KEYBOARD_SIZE = Facet('z', "📐 Размер", (
+    Option("Полноразмерная", _spec_contains(SPEC_SIZE, 'full')),
+    Option("TKL", _spec_contains(SPEC_SIZE, 'tkl', 'tenkeyless')),
+    Option("75%", _spec_contains(SPEC_SIZE, '75%')),
+    Option("65%", _spec_contains(SPEC_SIZE, '65%')),
+    Option("60%", _spec_contains(SPEC_SIZE, '60%')),
+))
+
+MOUSE_SIZE = Facet('z', "📐 Размер", (
+    Option("Компактная", _attribute_is('mouse_size', MouseSize.COMPACT)),
+    Option("Средняя", _attribute_is('mouse_size', MouseSize.MEDIUM)),
+    Option("Большая", _attribute_is('mouse_size', MouseSize.LARGE)),
+))
+
+SWITCHES = Facet('s', "⌨️ Переключатели", (
+    Option("Оптические", _spec_contains(SPEC_SWITCHES, 'оптич', 'optical')),
+    Option("Механические", lambda product: _mechanical(product) and not _not_mechanical(product)),
+    Option("Мембранные", _spec_contains(SPEC_SWITCHES, 'мембран', 'ножнич')),
+))
+
+WEIGHT = Facet('w', "🪶 Вес", (
+    Option("до 60 г", _between('weight', 0, 60)),
+    Option("60–80 г", _between('weight', 60, 80)),
+    Option("80–100 г", _between('weight', 80, 100)),
+    Option("от 100 г", _between('weight', 100, float('inf'))),
+))
+
+CATEGORY_FACETS = {
+    'mice': (PRICE, CONNECTION, MOUSE_SIZE, WEIGHT),
+    'keyboards': (PRICE, SWITCHES, KEYBOARD_SIZE, LIGHTING),
+    'headphones': (PRICE, CONNECTION),
+}
+
+
+def encode_selection(selection: dict) -> str:
+    """{код фасета: номер варианта} -> 'p1c0' для callback_data."""
+    return ''.join(f"{code}{selection[code]}" for code in sorted(selection))
+
+
+def decode_selection(text: str) -> dict:
+    selection = {}
+    for i in range(0, len(text) - 1, 2):
+        code, option = text[i], text[i + 1]
+        if option.isdigit():
+            selection[code] = int(option)
+    return selection
+
+
+def _bitset(mask: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+class CategoryFacets:
+    """Битовые множества товаров одной категории по каждому варианту каждого фасета.
+
+    Множества — целые числа Python: пересечение фильтров — это &, счётчик — bit_count().
+    """
+
+    def __init__(self, products: tuple, facets: tuple):
+        self.products = products
+        self.all = (1 << len(products)) - 1
+        bits = {}
+        for facet in facets:
+            for number, option in enumerate(facet.options):
+                mask = np.fromiter((bool(option.matches(product)) for product in products),
+                                   dtype=bool, count=len(products))
+                if mask.any():
+                    bits[(facet.code, number)] = _bitset(mask)
+        self._bits = MappingProxyType(bits)
+        # Фасет, по которому ни у одного товара нет данных, не показываем
+        self.facets = tuple(facet for facet in facets if any(code == facet.code for code, _ in bits))
+
+    def facet(self, code: str) -> Optional[Facet]:
+        for facet in self.facets:
+            if facet.code == code:
+                return facet
+        return None
+
+    def clean(self, selection: dict) -> dict:
+        """Оставляет только варианты, которые есть в этой категории."""
+        return {code: number for code, number in selection.items() if (code, number) in self._bits}
+
+    def match(self, selection: dict, skip: str = None) -> int:
+        result = self.all
+        for code, number in selection.items():
+            if code != skip:
+                result &= self._bits.get((code, number), 0)
+        return result
+
+    def count(self, selection: dict) -> int:
+        return self.match(selection).bit_count()
+
+    def option_counts(self, selection: dict, code: str) -> list:
+        """[(номер варианта, число товаров)], если выбрать этот вариант вместо текущего в фасете."""
+        base = self.match(selection, skip=code)
+        facet = self.facet(code)
+        return [
+            (number, (base & self._bits[(code, number)]).bit_count())
+            for number in range(len(facet.options)) if (code, number) in self._bits
+        ]
+
+    def first(self, selection: dict, limit: int) -> list:
+        """Первые limit товаров, прошедших фильтр, в порядке каталога."""
+        bits = self.match(selection)
+        found = []
+        while bits and len(found) < limit:
+            lowest = bits & -bits
+            found.append(self.products[lowest.bit_length() - 1])
+            bits ^= lowest
+        return found
+
+
+class FacetIndex:
+    def __init__(self, snapshot):
+        self.categories = MappingProxyType({
+            category: CategoryFacets(snapshot.by_category.get(category, ()), facets)
+            for category, facets in CATEGORY_FACETS.items()
+            if snapshot.by_category.get(category)
+        })
+
+    def get(self, category: str) -> Optional[CategoryFacets]:
+        index = self.categories.get(category)
+        return index if index is not None and index.facets else None
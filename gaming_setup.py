@@ -0,0 +1,256 @@
+import heapq
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+import numpy as np
+
+from catalog import HeadphoneType, MouseSize, SWITCH_FEEL_KEYWORDS
+from scoring import SWITCH_CLASS_SCORES
+
+# Компоненты сетапа в порядке вывода: (имя, категория каталога)
+COMPONENTS = (('mouse', 'mice'), ('keyboard', 'keyboards'), ('headphones', 'headphones'))
+
+# Веса признаков компонентов по жанрам; неизвестный жанр считается шутером
+GENRE_PROFILES = MappingProxyType({
+    'shooter': {'fit': 0.4, 'light': 0.4, 'sensor': 0.2, 'switch': 0.6, 'speed': 0.4,
+                'detail': 0.6, 'bass': 0.1, 'comfort': 0.3},
+    'moba': {'fit': 0.6, 'light': 0.2, 'sensor': 0.2, 'switch': 0.8, 'speed': 0.2,
+             'detail': 0.5, 'bass': 0.1, 'comfort': 0.4},
+    'strategy': {'fit': 0.7, 'light': 0.1, 'sensor': 0.2, 'switch': 0.8, 'speed': 0.2,
+                 'detail': 0.2, 'bass': 0.2, 'comfort': 0.6},
+    'rpg': {'fit': 0.6, 'light': 0.1, 'sensor': 0.3, 'switch': 0.8, 'speed': 0.2,
+            'detail': 0.2, 'bass': 0.6, 'comfort': 0.2},
+})
+# Доля цены в оценке: при прочих равных дешевле — лучше
+VALUE_WEIGHT = 0.1
+
+_SIZE_CODES = {size: code for code, size in enumerate(MouseSize)}
+# Вес мыши (г), удобный для руки, когда размер в характеристиках не указан
+IDEAL_WEIGHT = {MouseSize.COMPACT: 60.0, MouseSize.MEDIUM: 75.0, MouseSize.LARGE: 95.0}
+WEIGHT_TOLERANCE = 50.0
+# Оценка совпадения, когда о товаре ничего не известно
+UNKNOWN_FIT = 0.4
+UNKNOWN_SWITCH = 0.3
+
+
+@dataclass(frozen=True, slots=True)
+class Setup:
+    mouse: Optional[object]
+    keyboard: Optional[object]
+    headphones: Optional[object]
+    score: float
+    # None — у одного из товаров нет цены
+    price: Optional[float]
+
+
+def _known(values: list) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+class ComponentFeatures:
+    """Признаки товаров одной категории, из которых для каждого запроса векторно считается оценка."""
+
+    __slots__ = ('keys', 'price', 'by_price', 'dpi', 'polling_rate', 'weight', 'size_code', 'switch_class',
+                 'feels', 'has_feels', 'freq_low', 'freq_high', 'on_ear')
+
+    def __init__(self, products):
+        products = tuple(products)
+        self.keys = tuple(product.key for product in products)
+        self.price = _known([product.price for product in products])
+        # Товары с ценой по возрастанию цены: порядок нужен для отсева при заданном бюджете
+        priced = np.flatnonzero(~np.isnan(self.price))
+        self.by_price = priced[np.argsort(self.price[priced], kind='stable')]
+        self.dpi = _known([product.dpi for product in products])
+        self.polling_rate = _known([product.polling_rate for product in products])
+        self.weight = _known([product.weight for product in products])
+        self.size_code = np.array([_SIZE_CODES.get(product.mouse_size, -1) for product in products], dtype=np.int8)
+        self.switch_class = np.array([SWITCH_CLASS_SCORES.get(product.switch_type, 0.0) for product in products])
+        self.feels = {
+            feel: np.array([feel in product.switch_feels for product in products], dtype=bool)
+            for feel in SWITCH_FEEL_KEYWORDS
+        }
+        self.has_feels = np.array([bool(product.switch_feels) for product in products], dtype=bool)
+        ranges = [product.frequency_range or (None, None) for product in products]
+        self.freq_low = _known([low for low, _ in ranges])
+        self.freq_high = _known([high for _, high in ranges])
+        self.on_ear = np.array([product.headphone_type is HeadphoneType.ON_EAR for product in products], dtype=bool)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scores(self, component: str, profile: dict, hand_size: Optional[MouseSize], switch_feel: str) -> np.ndarray:
+        value = np.where(np.isnan(self.price), 0.0, 1 - np.minimum(self.price / 300, 1))
+        score = value * VALUE_WEIGHT
+
+        if component == 'mouse':
+            if hand_size is None:
+                fit = np.full(len(self), UNKNOWN_FIT)
+            else:
+                # Размер из характеристик точнее веса; соседний размер подходит наполовину
+                by_size = np.clip(1 - 0.5 * np.abs(self.size_code - _SIZE_CODES[hand_size]), 0, 1)
+                by_weight = np.clip(1 - np.abs(self.weight - IDEAL_WEIGHT[hand_size]) / WEIGHT_TOLERANCE, 0, 1) * 0.8
+                fit = np.where(self.size_code >= 0, by_size,
+                               np.where(np.isnan(self.weight), UNKNOWN_FIT, by_weight))
+            light = np.where(np.isnan(self.weight), UNKNOWN_FIT, np.clip((120 - self.weight) / 60, 0, 1))
+            sensor = (np.where(np.isnan(self.dpi), 0.0, np.minimum(self.dpi / 16000, 1) * 0.6)
+                      + np.where(np.isnan(self.polling_rate), 0.0, np.minimum(self.polling_rate / 8000, 1) * 0.4))
+            score += profile['fit'] * fit + profile['light'] * light + profile['sensor'] * sensor
+        elif component == 'keyboard':
+            wanted = self.feels.get(switch_feel)
+            if wanted is None:
+                switch = np.full(len(self), UNKNOWN_SWITCH)
+            else:
+                switch = np.where(wanted, 1.0, np.where(self.has_feels, 0.0, UNKNOWN_SWITCH))
+            score += profile['switch'] * switch + profile['speed'] * self.switch_class
+        elif component == 'headphones':
+            detail = np.where(np.isnan(self.freq_high), 0.0, 0.5 + np.clip((self.freq_high - 20000) / 20000, 0, 0.5))
+            bass = np.where(np.isnan(self.freq_low), 0.0, np.clip((20 - self.freq_low) / 10, 0, 1))
+            score += profile['detail'] * detail + profile['bass'] * bass + profile['comfort'] * self.on_ear
+        return score
+
+
+def _layers(order: np.ndarray, score: np.ndarray, k: int) -> np.ndarray:
+    """Товары из первых k слоёв Парето по (цена, оценка); order упорядочен по цене.
+
+    У товара вне этих слоёв есть не меньше k товаров дешевле и лучше, поэтому
+    ни в один из k лучших сетапов он не попадёт.
+    """
+    kept = []
+    remaining = order
+    for _ in range(k):
+        if not len(remaining):
+            break
+        values = score[remaining]
+        best_before = np.concatenate(([-np.inf], np.maximum.accumulate(values)[:-1]))
+        frontier = values > best_before
+        kept.append(remaining[frontier])
+        remaining = remaining[~frontier]
+    return np.concatenate(kept) if kept else order[:0]
+
+
+def _search(options: list, budget: float, k: int) -> list:
+    """k лучших сочетаний по одному варианту на компонент с суммарной ценой не выше budget.
+
+    options — по компоненту список (оценка, цена, номер товара) по убыванию оценки.
+    Перебор в глубину с отсечением по верхней границе: оценка выбранного плюс лучшие
+    оценки оставшихся компонентов. Раз варианты идут по убыванию оценки, первый
+    не прошедший границу вариант обрывает весь остаток списка.
+    """
+    count = len(options)
+    best_rest = [0.0] * (count + 1)
+    cheapest_rest = [0.0] * (count + 1)
+    for i in range(count - 1, -1, -1):
+        best_rest[i] = best_rest[i + 1] + options[i][0][0]
+        cheapest_rest[i] = cheapest_rest[i + 1] + min(price for _, price, _ in options[i])
+
+    found = []  # куча (оценка, -порядковый номер, номера товаров) размером до k
+    sequence = 0
+
+    def visit(i: int, score: float, spent: float, chosen: tuple):
+        nonlocal sequence
+        if i == count:
+            # При равной оценке остаётся сочетание, найденное раньше (с более высокими первыми компонентами)
+            entry = (score, -sequence, chosen)
+            sequence += 1
+            if len(found) < k:
+                heapq.heappush(found, entry)
+            elif score > found[0][0]:
+                heapq.heapreplace(found, entry)
+            return
+        for option_score, price, index in options[i]:
+            if len(found) == k and score + option_score + best_rest[i + 1] <= found[0][0]:
+                break
+            if spent + price + cheapest_rest[i + 1] > budget:
+                continue
+            visit(i + 1, score + option_score, spent + price, chosen + (index,))
+
+    visit(0, 0.0, 0.0, ())
+    return [(score, chosen) for score, _, chosen in sorted(found, reverse=True)]
+
+
+class SetupIndex:
+    """Подбор киберспортивного сетапа: лучшее сочетание мыши, клавиатуры и наушников в рамках бюджета.
+
+    Оценка каждого компонента учитывает жанр, размер руки и тип переключателей и
+    считается векторно по всей категории. Полный перебор сочетаний не нужен:
+    в поиск попадают только товары, которые могут войти в k лучших сетапов.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self.components = {
+            component: ComponentFeatures(products)
+            for component, products in self._products(snapshot).items()
+        }
+
+    def _products(self, snapshot) -> dict:
+        return {component: snapshot.by_category.get(category, ()) for component, category in COMPONENTS}
+
+    def _cheapest(self) -> dict:
+        """{компонент: самая низкая цена в категории} для непустых категорий; inf — цен нет."""
+        return {
+            component: features.price[features.by_price[0]] if len(features.by_price) else np.inf
+            for component, features in self.components.items() if len(features)
+        }
+
+    def _candidates(self, component: str, profile: dict, hand_size: Optional[MouseSize], switch_feel: str,
+                    price_limit: Optional[float]) -> ComponentFeatures:
+        """Товары компонента, среди которых ищутся сетапы; в памяти это вся категория."""
+        return self.components[component]
+
+    def _options(self, features: ComponentFeatures, score: np.ndarray, budget: Optional[float],
+                 other_cheapest: float, k: int) -> list:
+        if budget is None:
+            # Без бюджета k лучших сетапов собираются из k лучших товаров каждого компонента
+            if len(score) > k:
+                threshold = np.partition(score, len(score) - k)[len(score) - k]
+                chosen = np.flatnonzero(score >= threshold)
+            else:
+                chosen = np.arange(len(score))
+            chosen = chosen[np.lexsort((chosen, -score[chosen]))][:k]
+            prices = np.nan_to_num(features.price[chosen])
+        else:
+            affordable = features.by_price[features.price[features.by_price] <= budget - other_cheapest]
+            chosen = _layers(affordable, score, k)
+            chosen = chosen[np.lexsort((chosen, -score[chosen]))]
+            prices = features.price[chosen]
+        return list(zip(score[chosen].tolist(), prices.tolist(), chosen.tolist()))
+
+    def solve(self, genre: str, hand_size: str, switch_feel: str, budget: float = None, k: int = 3) -> list:
+        """До k сетапов по убыванию оценки; компонент без подходящих товаров пропускается."""
+        profile = GENRE_PROFILES.get(genre, GENRE_PROFILES['shooter'])
+        try:
+            hand = MouseSize(hand_size)
+        except ValueError:
+            hand = None
+
+        cheapest = self._cheapest()
+        present = list(cheapest)
+        if budget is not None:
+            # Компонент без цен не укладывается ни в какой бюджет
+            present = [component for component in present if np.isfinite(cheapest[component])]
+            total_cheapest = sum(cheapest[component] for component in present)
+
+        options = []
+        candidates = []
+        for component in present:
+            other_cheapest = total_cheapest - cheapest[component] if budget is not None else 0.0
+            features = self._candidates(component, profile, hand, switch_feel,
+                                        None if budget is None else budget - other_cheapest)
+            score = features.scores(component, profile, hand, switch_feel)
+            options.append(self._options(features, score, budget, other_cheapest, k))
+            candidates.append((component, features))
+        if not options or not all(options):
+            return []
+
+        setups = []
+        for score, chosen in _search(options, np.inf if budget is None else budget, k):
+            items = {}
+            price = 0.0
+            for (component, features), index in zip(candidates, chosen):
+                items[component] = self._snapshot.product(*features.keys[index])
+                price = None if price is None or np.isnan(features.price[index]) else price + float(features.price[index])
+            setups.append(Setup(items.get('mouse'), items.get('keyboard'), items.get('headphones'),
+                                round(score, 4), price))
+        return setups
@@ -0,0 +1,313 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from bisect import bisect_left
+
+from telegram.request import HTTPXRequest
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+READ_TIMEOUT = 5
+
+# Все метрики обновляются из потока цикла событий (время пула потоков замеряет
+# ожидающая корутина), поэтому блокировки не нужны. Исключение — счётчики обновления
+# цен: их пишет один поток прохода, а все метки заводятся заранее (refresh.py).
+_registry = {}
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        _registry[name] = self
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label_values -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._children = {}
+        _registry[name] = self
+
+    def observe(self, value: float, *label_values):
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._children[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        child[0][bisect_left(self.buckets, value)] += 1
+        child[1] += value
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, (counts, total) in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Collected:
+    """Значения, которые считываются в момент запроса /metrics: размер очереди, счётчики кэшей."""
+
+    def __init__(self, name: str, help_text: str, kind: str, labels: tuple, collect):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect  # () -> {значения меток: число}
+
+    def expose(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.warning(f"Не удалось собрать метрику {self.name}: {e}")
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for label_values, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+def collect(name: str, help_text: str, kind: str, labels: tuple, function):
+    # Повторная регистрация под тем же именем заменяет прежнюю (например, при пересборке Application)
+    _registry[name] = Collected(name, help_text, kind, labels, function)
+
+
+def render() -> str:
+    return '\n'.join(line for metric in list(_registry.values()) for line in metric.expose()) + '\n'
+
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds',
+    "Время обработки апдейта: total, telegram (Bot API), scoring (пул потоков), "
+    "queued (ожидание пула потоков), catalog (остальное)",
+    ('handler', 'phase')
+)
+UPDATES = Counter('bot_updates_total', "Обработанные апдейты", ('handler', 'outcome'))
+API_SECONDS = Histogram('bot_api_request_seconds', "Длительность запросов к Bot API", ('method',))
+API_ERRORS = Counter('bot_api_errors_total', "Запросы к Bot API с ошибкой или без ответа", ('method',))
+PHOTO_FAILURES = Counter('bot_photo_failures_total', "Неудачные отправки фото", ('reason',))
+PHOTO_FALLBACKS = Counter('bot_photo_fallbacks_total', "Карточки, отправленные текстом вместо фото")
+ALBUM_PHOTOS = Counter('bot_album_photos_total', "Фото в альбомах рекомендаций по источнику", ('source',))
+API_CALLS_SAVED = Counter('bot_api_calls_saved_total', "Правки сообщений, которые не пришлось отправлять", ('reason',))
+API_RETRIES = Counter('bot_api_retries_total', "Повторы запросов к Bot API после 429", ('method',))
+API_THROTTLE_SECONDS = Histogram('bot_api_throttle_seconds', "Ожидание лимита запросов перед вызовом Bot API")
+REFRESH_PAGES = Counter('bot_catalog_refresh_pages_total', "Запросы страниц товаров при обновлении цен", ('result',))
+REFRESH_PRODUCTS = Counter('bot_catalog_refresh_products_total', "Товары, изменённые обновлением цен")
+
+_in_flight = 0
+collect('bot_updates_in_progress', "Апдейты в обработке", 'gauge', (), lambda: {(): _in_flight})
+
+
+class UpdateTiming:
+    __slots__ = ('handler', 'started', 'telegram', 'scoring', 'queued', 'api_calls', '_api_depth', '_api_started')
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.telegram = 0.0
+        self.scoring = 0.0
+        self.queued = 0.0
+        self.api_calls = 0
+        self._api_depth = 0
+        self._api_started = 0.0
+
+    def api_started(self, call: bool = True):
+        # Параллельные запросы (рассылка карточек) считаем по времени, а не суммой длительностей
+        if not self._api_depth:
+            self._api_started = time.perf_counter()
+        self._api_depth += 1
+        self.api_calls += call
+
+    def api_finished(self):
+        self._api_depth -= 1
+        if not self._api_depth:
+            self.telegram += time.perf_counter() - self._api_started
+
+
+_current = contextvars.ContextVar('update_timing', default=None)
+# Имя обработчика живёт отдельно от разбивки времени: счётчик апдейтов ведётся и для апдейтов вне выборки
+_handler = contextvars.ContextVar('update_handler', default=None)
+
+
+def label(handler: str):
+    """Уточняет имя обработчика текущего апдейта (например, после маршрутизации callback_data)."""
+    holder = _handler.get()
+    if holder is not None:
+        holder[0] = handler
+
+
+def record_blocking(seconds: float, queued: float = 0.0):
+    timing = _current.get()
+    if timing is not None:
+        timing.scoring += seconds
+        timing.queued += queued
+
+
+def record_throttle(seconds: float):
+    # Ожидание лимита — часть времени, которое апдейт провёл в Telegram
+    API_THROTTLE_SECONDS.observe(seconds)
+    timing = _current.get()
+    if timing is not None:
+        timing.telegram += seconds
+
+
+@contextlib.contextmanager
+def telegram_wait():
+    """Ожидание очереди к Bot API: время апдейта в Telegram, хотя сам запрос шлёт другая задача."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    timing.api_started(call=False)
+    try:
+        yield
+    finally:
+        timing.api_finished()
+
+
+def _finish(timing: UpdateTiming, update, context, outcome: str):
+    total = time.perf_counter() - timing.started
+    catalog = max(total - timing.telegram - timing.scoring - timing.queued, 0.0)
+    HANDLER_SECONDS.observe(total, timing.handler, 'total')
+    HANDLER_SECONDS.observe(timing.telegram, timing.handler, 'telegram')
+    HANDLER_SECONDS.observe(timing.scoring, timing.handler, 'scoring')
+    HANDLER_SECONDS.observe(timing.queued, timing.handler, 'queued')
+    HANDLER_SECONDS.observe(catalog, timing.handler, 'catalog')
+
+    if config.METRICS_LOG_UPDATES:
+        logger.info(json.dumps({
+            'update_id': getattr(update, 'update_id', None),
+            'handler': timing.handler,
+            'outcome': outcome,
+            'total_ms': round(total * 1000, 2),
+            'telegram_ms': round(timing.telegram * 1000, 2),
+            'scoring_ms': round(timing.scoring * 1000, 2),
+            'queued_ms': round(timing.queued * 1000, 2),
+            'catalog_ms': round(catalog * 1000, 2),
+            'api_calls': timing.api_calls,
+            'queue_depth': context.application.update_queue.qsize(),
+        }, ensure_ascii=False))
+
+
+def instrument(handler, name: str = None):
+    """Оборачивает обработчик PTB: счётчик апдейтов и, для доли METRICS_SAMPLE_RATE апдейтов, разбивка времени."""
+    name = name or handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args):
+        global _in_flight
+        sampled = config.METRICS_SAMPLE_RATE >= 1 or random.random() < config.METRICS_SAMPLE_RATE
+        timing = UpdateTiming(name) if sampled else None
+        holder = [name]
+        token = _current.set(timing)
+        handler_token = _handler.set(holder)
+        _in_flight += 1
+        outcome = 'error'
+        try:
+            result = await handler(update, context, *args)
+            outcome = 'ok'
+            return result
+        finally:
+            _in_flight -= 1
+            _current.reset(token)
+            _handler.reset(handler_token)
+            UPDATES.inc(holder[0], outcome)
+            if timing is not None:
+                timing.handler = holder[0]
+                _finish(timing, update, context, outcome)
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет каждый вызов Bot API по имени метода."""
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        timing = _current.get()
+        if timing is not None:
+            timing.api_started()
+        started = time.perf_counter()
+        code = None
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            return code, payload
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, api_method)
+            if code is None or code >= 400:
+                API_ERRORS.inc(api_method)
+            if timing is not None:
+                timing.api_finished()
+
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        while (await asyncio.wait_for(reader.readline(), READ_TIMEOUT)).strip():
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+            status, body = '200 OK', render().encode()
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str, port: int) -> asyncio.AbstractServer:
+    """HTTP-эндпоинт /metrics в формате Prometheus на том же цикле событий, что и бот."""
+    server = await asyncio.start_server(_serve, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
+
+import httpx
+
+import config
+import metrics
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Правки сообщения: ждущую отправки правку можно заменить более новой правкой того же сообщения
+EDIT_METHODS = frozenset({'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'editMessageMedia'})
+# Ответ на правку, которую заменила более новая или которая повторяет отправленную:
+# PTB вернёт из edit_message_text True, как для inline-сообщений
+DEFERRED_RESPONSE = json.dumps({'ok': True, 'result': True}).encode()
+NOT_MODIFIED = 'message is not modified'
+# Чаты, для которых помнится лимит, и правки, содержимое которых помнится для отсева повторов
+CHAT_BUCKETS = 10_000
+SENT_EDITS = 10_000
+SHUTDOWN_TIMEOUT = 5
+
+
+class TokenBucket:
+    """Лимит запросов: rate в секунду с запасом capacity на всплеск и паузой после 429."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд ждать, пока он станет действительным."""
+        now = time.monotonic()
+        wait = max(self.blocked_until - now, 0.0)
+        if not self.rate:
+            return wait
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        # Токены уходят в минус: следующие запросы встают в очередь за уже ждущими
+        return max(wait, -self.tokens / self.rate)
+
+    def blocked_for(self) -> float:
+        return max(self.blocked_until - time.monotonic(), 0.0)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _EditSlot:
+    __slots__ = ('pending', 'task')
+
+    def __init__(self, job: tuple, future: asyncio.Future):
+        self.pending = (job, future)
+        self.task = None
+
+
+def _resolve(future: asyncio.Future, result: tuple = (200, DEFERRED_RESPONSE)):
+    # Вызвавший правку обработчик мог быть отменён
+    if not future.done():
+        future.set_result(result)
+
+
+def _error(payload: bytes) -> dict:
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return {}
+
+
+class OutboundRequest(metrics.InstrumentedRequest):
+    """Очередь исходящих запросов к Bot API поверх одного пула соединений.
+
+    - ответы на нажатия и inline-запросы (без chat_id) уходят сразу;
+    - правки сообщения идут по очереди: пока предыдущая правка того же сообщения
+      в пути, новая ждёт, и из ждущих отправляется только последняя, а заменённой
+      сразу отвечается True; правка, совпадающая с уже отправленной, не отправляется
+      вовсе; остальные получают настоящий ответ Telegram, в том числе ошибку;
+    - остальные запросы в чат ждут его поставленных правок, чтобы сохранить порядок;
+    - всё, что идёт в чат, проходит через общий лимит и лимит чата, а после 429
+      чат выдерживает retry_after и запрос повторяется.
+    """
+
+    def __init__(self, connection_pool_size: int = 1, **kwargs):
+        # Долгий keep-alive: между редкими апдейтами не приходится заново открывать TLS
+        kwargs.setdefault('httpx_kwargs', {'limits': httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=connection_pool_size,
+            keepalive_expiry=config.OUTBOUND_KEEPALIVE_EXPIRY
+        )})
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self._global = TokenBucket(config.OUTBOUND_GLOBAL_RATE, max(config.OUTBOUND_GLOBAL_RATE, 1))
+        self._buckets = LRUCache(CHAT_BUCKETS)
+        self._sent = LRUCache(SENT_EDITS)
+        self._edits = {}  # chat_id -> {сообщение: _EditSlot}
+        metrics.collect('bot_api_pending_edits', "Правки сообщений в очереди", 'gauge', (),
+                        lambda: {(): sum(len(slots) for slots in self._edits.values())})
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        return self._buckets.get_or_compute(
+            chat_id, lambda: TokenBucket(config.OUTBOUND_CHAT_RATE, config.OUTBOUND_CHAT_BURST)
+        )
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        parameters = request_data.parameters if request_data is not None else {}
+        chat_id = parameters.get('chat_id')
+        job = (url, method, request_data, args, kwargs)
+
+        if url.rsplit('/', 1)[-1] in EDIT_METHODS:
+            message = parameters.get('message_id') or parameters.get('inline_message_id')
+            if message is not None:
+                with metrics.telegram_wait():
+                    return await self._enqueue_edit(chat_id, message, job)
+        if chat_id is None:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+        slots = self._edits.get(chat_id)
+        if slots:
+            # shield: отмена запроса не должна обрывать чужие правки
+            with metrics.telegram_wait():
+                await asyncio.gather(*(asyncio.shield(slot.task) for slot in list(slots.values())))
+        return await self._send(chat_id, job)
+
+    async def _acquire(self, chat_id):
+        buckets = (self._global, self._bucket(chat_id)) if chat_id is not None else (self._global,)
+        wait = max([bucket.reserve() for bucket in buckets])
+        waited = 0.0
+        while wait > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+            # Пока ждали, чат мог получить 429 с новым retry_after
+            wait = max(bucket.blocked_for() for bucket in buckets)
+        if waited:
+            metrics.record_throttle(waited)
+
+    async def _send(self, chat_id, job: tuple, acquired: bool = False) -> tuple:
+        url, method, request_data, args, kwargs = job
+        api_method = url.rsplit('/', 1)[-1]
+        for attempt in range(config.OUTBOUND_MAX_RETRIES + 1):
+            if attempt or not acquired:
+                await self._acquire(chat_id)
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            if code != 429:
+                return code, payload
+
+            retry_after = _error(payload).get('parameters', {}).get('retry_after', 1)
+            (self._bucket(chat_id) if chat_id is not None else self._global).block(retry_after)
+            if attempt == config.OUTBOUND_MAX_RETRIES or retry_after > config.OUTBOUND_MAX_RETRY_AFTER:
+                return code, payload
+            logger.warning(f"Флуд-контроль Telegram: {api_method} в чат {chat_id}, повтор через {retry_after} с")
+            metrics.API_RETRIES.inc(api_method)
+        return code, payload
+
+    def _enqueue_edit(self, chat_id, message, job: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        slots = self._edits.setdefault(chat_id, {})
+        slot = slots.get(message)
+        if slot is not None:
+            if slot.pending is not None:
+                metrics.API_CALLS_SAVED.inc('coalesced')
+                _resolve(slot.pending[1])
+            slot.pending = (job, future)
+            return future
+        slot = slots[message] = _EditSlot(job, future)
+        # Пустой контекст: ожидание правки засчитывает сам обработчик, а не задача очереди
+        slot.task = asyncio.get_running_loop().create_task(
+            self._run_edits(chat_id, message, slot), context=contextvars.Context()
+        )
+        return future
+
+    async def _run_edits(self, chat_id, message, slot: _EditSlot):
+        key = (chat_id, message)
+        future = None
+        try:
+            while slot.pending is not None:
+                if self._sent.get(key) != hash(slot.pending[0][2].json_payload):
+                    # Правку берём только после ожидания лимита: за это время её могла сменить более новая
+                    await self._acquire(chat_id)
+                (job, future), slot.pending = slot.pending, None
+                content = hash(job[2].json_payload)
+                if self._sent.get(key) == content:
+                    metrics.API_CALLS_SAVED.inc('duplicate')
+                    _resolve(future)
+                    continue
+                try:
+                    code, payload = await self._send(chat_id, job, acquired=True)
+                except Exception as e:
+                    # Ошибку сети разбирает обработчик, поставивший правку
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                description = _error(payload).get('description', '') if code != 200 else ''
+                if code == 200 or NOT_MODIFIED in description:
+                    self._sent.put(key, content)
+                _resolve(future, (code, payload))
+        finally:
+            # Очередь отменена (например, при остановке): ждущие обработчики не должны зависнуть
+            for waiting in (future, slot.pending and slot.pending[1]):
+                if waiting is not None:
+                    waiting.cancel()
+            slots = self._edits.get(chat_id)
+            if slots is not None and slots.get(message) is slot:
+                del slots[message]
+                if not slots:
+                    del self._edits[chat_id]
+
+    async def shutdown(self) -> None:
+        tasks = [slot.task for slots in self._edits.values() for slot in slots.values()]
+        if tasks:
+            # Отложенные правки уходят до закрытия соединений
+            _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+            if pending:
+                logger.warning(f"При остановке не отправлено правок сообщений: {len(pending)}")
+        await super().shutdown()
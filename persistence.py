@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+import pymongo
+import sqlalchemy as sa
+from telegram.ext import BasePersistence, PersistenceInput
+
+from processing import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед записью: PTB сообщает об изменённых пользователях пачкой, собираем её целиком
+_FLUSH_DELAY = 0.05
+# Код ошибки MongoDB: индекс с тем же ключом уже есть с другими параметрами
+INDEX_OPTIONS_CONFLICT = 85
+
+
+class BufferedUserPersistence(BasePersistence):
+    """Сохраняет только context.user_data, копя изменения и записывая их пачками.
+
+    PTB вызывает update_user_data раз в update_interval секунд для всех изменившихся
+    пользователей и flush() при остановке. Записи старше ttl считаются брошенными
+    сценариями: они не загружаются и удаляются из хранилища вместе с очередной записью.
+    Перед каждым апдейтом состояние пользователя перечитывается, если его успела
+    изменить другая реплика.
+    """
+
+    def __init__(self, update_interval: float, ttl: float, batch_size: int = 500):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._pending = {}
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+        # Время последней известной этой реплике записи каждого пользователя
+        self._versions = {}
+        self._expired_at = time.monotonic()
+
+    # Реализуется бэкендом; методы блокирующие и вызываются в пуле потоков.
+    # _load возвращает {user_id: (data, updated_at)}, с user_id — только для этого пользователя
+    def _load(self, cutoff: float, user_id: int = None) -> dict:
+        raise NotImplementedError
+
+    def _write(self, batch: dict, now: float) -> None:
+        raise NotImplementedError
+
+    def _expire(self, cutoff: float) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        pass
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl
+
+    async def get_user_data(self) -> dict:
+        users = await run_blocking(self._load, self._cutoff())
+        logger.info(f"Восстановлено состояние {len(users)} пользователей")
+        self._versions = {user_id: updated_at for user_id, (_, updated_at) in users.items()}
+        return {user_id: data for user_id, (data, _) in users.items()}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        # None в буфере означает удаление; пустое состояние хранить незачем
+        self._pending[user_id] = json.loads(json.dumps(data)) if data else None
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending[user_id] = None
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._pending:
+            # Несохранённые изменения этой реплики новее того, что лежит в хранилище
+            return
+        cutoff = self._cutoff()
+        stored = (await run_blocking(self._load, cutoff, user_id)).get(user_id)
+        version = self._versions.get(user_id)
+        if stored is None:
+            if version is not None and version < cutoff:
+                # Сценарий брошен дольше ttl назад: забываем его и в памяти
+                self._versions.pop(user_id, None)
+                user_data.clear()
+            return
+        data, updated_at = stored
+        if version is None or updated_at > version:
+            self._versions[user_id] = updated_at
+            user_data.clear()
+            user_data.update(data)
+
+    def _schedule_flush(self):
+        if len(self._pending) >= self.batch_size:
+            self._flush_task = asyncio.create_task(self._write_pending())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_write())
+
+    async def _delayed_write(self):
+        await asyncio.sleep(_FLUSH_DELAY)
+        await self._write_pending()
+
+    async def _write_pending(self):
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            now = time.time()
+            try:
+                await run_blocking(self._write, batch, now)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить состояние {len(batch)} пользователей: {e}")
+                # Вернём в буфер то, что не перезаписано более свежими изменениями
+                for user_id, data in batch.items():
+                    self._pending.setdefault(user_id, data)
+                return
+            for user_id, data in batch.items():
+                if data is None:
+                    self._versions.pop(user_id, None)
+                else:
+                    self._versions[user_id] = now
+            # Брошенные сценарии удаляем не чаще раза за интервал записи, а не только при остановке
+            if time.monotonic() - self._expired_at >= self.update_interval:
+                await self._expire_stale()
+
+    async def _expire_stale(self):
+        self._expired_at = time.monotonic()
+        try:
+            await run_blocking(self._expire, self._cutoff())
+        except Exception as e:
+            logger.error(f"Не удалось удалить устаревшие состояния: {e}")
+
+    async def flush(self) -> None:
+        await self._write_pending()
+        await self._expire_stale()
+        await run_blocking(self._close)
+
+    # Остальные виды данных бот не хранит
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+
+class SQLUserPersistence(BufferedUserPersistence):
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self._engine = sa.create_engine(url)
+        metadata = sa.MetaData()
+        self._table = sa.Table(
+            'user_state', metadata,
+            sa.Column('user_id', sa.BigInteger, primary_key=True, autoincrement=False),
+            sa.Column('data', sa.Text, nullable=False),
+            sa.Column('updated_at', sa.Float, nullable=False, index=True),
+        )
+        metadata.create_all(self._engine)
+
+    def _load(self, cutoff: float, user_id: int = None) -> dict:
+        table = self._table
+        query = sa.select(table.c.user_id, table.c.data, table.c.updated_at).where(table.c.updated_at >= cutoff)
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        with self._engine.connect() as connection:
+            return {user_id: (json.loads(data), updated_at) for user_id, data, updated_at in connection.execute(query)}
+
+    def _write(self, batch: dict, now: float) -> None:
+        table = self._table
+        with self._engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.user_id.in_(list(batch))))
+            rows = [
+                {'user_id': user_id, 'data': json.dumps(data, ensure_ascii=False), 'updated_at': now}
+                for user_id, data in batch.items() if data is not None
+            ]
+            if rows:
+                connection.execute(table.insert(), rows)
+
+    def _expire(self, cutoff: float) -> None:
+        with self._engine.begin() as connection:
+            connection.execute(self._table.delete().where(self._table.c.updated_at < cutoff))
+
+    def _close(self) -> None:
+        self._engine.dispose()
+
+
+class MongoUserPersistence(BufferedUserPersistence):
+    def __init__(self, url: str, collection=None, **kwargs):
+        super().__init__(**kwargs)
+        if collection is None:
+            self._client = pymongo.MongoClient(url)
+            collection = self._client.get_default_database('analitik_bot')['user_state']
+        else:
+            self._client = None
+        self._collection = collection
+        self._ensure_ttl_index()
+
+    def _ensure_ttl_index(self):
+        # MongoDB сам удаляет документы, которые не обновлялись дольше ttl
+        seconds = int(self.ttl)
+        try:
+            self._collection.create_index('updated_at', expireAfterSeconds=seconds)
+        except pymongo.errors.OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # USER_STATE_TTL изменился: меняем срок у существующего индекса, не пересоздавая его
+            self._collection.database.command({
+                'collMod': self._collection.name,
+                'index': {'keyPattern': {'updated_at': 1}, 'expireAfterSeconds': seconds},
+            })
+            logger.info(f"Срок хранения состояний в MongoDB изменён на {seconds} с")
+
+    def _load(self, cutoff: float, user_id: int = None) -> dict:
+        query = {'updated_at': {'$gte': _as_datetime(cutoff)}}
+        if user_id is not None:
+            query['_id'] = user_id
+        return {
+            document['_id']: (document['data'], _as_timestamp(document['updated_at']))
+            for document in self._collection.find(query)
+        }
+
+    def _write(self, batch: dict, now: float) -> None:
+        updated_at = _as_datetime(now)
+        operations = [
+            pymongo.DeleteOne({'_id': user_id}) if data is None
+            else pymongo.UpdateOne({'_id': user_id}, {'$set': {'data': data, 'updated_at': updated_at}}, upsert=True)
+            for user_id, data in batch.items()
+        ]
+        self._collection.bulk_write(operations, ordered=False)
+
+    def _expire(self, cutoff: float) -> None:
+        self._collection.delete_many({'updated_at': {'$lt': _as_datetime(cutoff)}})
+
+    def _close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+
+
+def _as_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def _as_timestamp(value: datetime) -> float:
+    # Клиент без tz_aware возвращает время UTC без часового пояса
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def create_persistence(url: str, update_interval: float, ttl: float, batch_size: int) -> BufferedUserPersistence:
+    options = {'update_interval': update_interval, 'ttl': ttl, 'batch_size': batch_size}
+    if url.startswith(('mongodb://', 'mongodb+srv://')):
+        return MongoUserPersistence(url, **options)
+    return SQLUserPersistence(url, **options)
@@ -0,0 +1,110 @@
+import logging
+import sqlite3
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def photo_key(category: str, brand: str, model: str) -> tuple:
+    # Части ключа хранятся отдельными столбцами: в названиях бывает '/'
+    return category, brand, model
+
+
+class PhotoCache:
+    """file_id загруженных в Telegram фотографий товаров, переживающий перезапуск.
+
+    Запись действительна, пока photo_url товара в каталоге не изменился. Кэши
+    разных копий фото (например, миниатюр для альбомов) живут в своих таблицах
+    одного файла.
+    """
+
+    def __init__(self, path: str, table: str = 'photos'):
+        self.path = path
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+        if 'key' in columns:
+            # Прежний формат со склеенным ключом: file_id просто загрузятся заново
+            logger.info(f"Кэш фото: таблица {table} в старом формате пересоздаётся")
+            self._connection.execute(f"DROP TABLE {table}")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " category TEXT NOT NULL,"
+            " brand TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " photo_url TEXT NOT NULL,"
+            " file_id TEXT NOT NULL,"
+            " PRIMARY KEY (category, brand, model)"
+            ")"
+        )
+        self._connection.commit()
+        self._entries = {
+            (category, brand, model): (photo_url, file_id)
+            for category, brand, model, photo_url, file_id in self._connection.execute(
+                f"SELECT category, brand, model, photo_url, file_id FROM {table}"
+            )
+        }
+        logger.info(f"Кэш фото: загружено {len(self._entries)} file_id из {path} ({table})")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key: tuple, photo_url: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry and entry[0] == photo_url:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def remember(self, key: tuple, photo_url: str, message) -> None:
+        if not message or not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._entries.get(key) == (photo_url, file_id):
+            return
+        with self._lock:
+            self._entries[key] = (photo_url, file_id)
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (category, brand, model, photo_url, file_id)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*key, photo_url, file_id)
+            )
+            self._connection.commit()
+
+    def forget(self, key: tuple) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE category = ? AND brand = ? AND model = ?", key
+                )
+                self._connection.commit()
+
+    def prune(self, snapshot) -> int:
+        # Убираем записи товаров, которых нет в каталоге или у которых сменилась ссылка на фото.
+        # Каталог спрашиваем только о закэшированных ключах, а не обходим целиком
+        with self._lock:
+            keys = list(self._entries)
+        current = snapshot.photo_urls(keys)
+        # Перезагрузка идёт в рабочем потоке, а remember и forget меняют записи из event loop
+        with self._lock:
+            stale = [key for key in keys if key in self._entries and self._entries[key][0] != current.get(key)]
+            for key in stale:
+                self._entries.pop(key, None)
+            self._connection.executemany(
+                f"DELETE FROM {self.table} WHERE category = ? AND brand = ? AND model = ?", stale
+            )
+            self._connection.commit()
+        if stale:
+            logger.info(f"Кэш фото ({self.table}): удалено {len(stale)} устаревших записей")
+        return len(stale)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
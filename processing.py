@@ -0,0 +1,75 @@
+import asyncio
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import config
+import metrics
+
+# Пул для блокирующей работы: чтение каталога с диска, построение индексов, скоринг
+_executor = ThreadPoolExecutor(max_workers=config.BLOCKING_WORKERS, thread_name_prefix='blocking')
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    worked = 0.0
+
+    def timed():
+        nonlocal worked
+        begun = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            worked = time.perf_counter() - begun
+    try:
+        return await loop.run_in_executor(_executor, timed)
+    finally:
+        # Очередь за свободным потоком и возврат в занятый цикл событий — не работа этого апдейта
+        metrics.record_blocking(worked, time.perf_counter() - started - worked)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов разных пользователей.
+
+    Апдейты одного пользователя выполняются строго по очереди, чтобы быстрые
+    повторные нажатия не гонялись за context.user_data. Очередь пользователя
+    стоит перед общим лимитом: слот занимает только его первый апдейт, поэтому
+    серия нажатий одного пользователя не забирает слоты у остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = weakref.WeakValueDictionary()
+
+    def _lock_for(self, update: object) -> Optional[asyncio.Lock]:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            return None
+        lock = self._user_locks.get(user.id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user.id] = lock
+        return lock
+
+    async def process_update(self, update: object, coroutine) -> None:
+        lock = self._lock_for(update)
+        if lock is None:
+            await super().process_update(update, coroutine)
+            return
+        # asyncio.Lock будит ожидающих по порядку прихода: апдейты пользователя идут в том же порядке
+        async with lock:
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
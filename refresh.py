@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Optional
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Поле товара в tech_data.json с адресом страницы в магазине
+SOURCE_URL_FIELD = 'source_url'
+USER_AGENT = 'Analitik-bot/1.0 (+price refresh)'
+# Строки таблицы характеристик, если на странице нет микроразметки schema.org
+SPEC_ROWS_SELECTOR = 'table.specs tr'
+# Цены в каталоге в долларах: цена в другой валюте не применяется
+CATALOG_CURRENCY = 'USD'
+# Исходы запроса страницы: метка счётчика metrics.REFRESH_PAGES
+PAGE_RESULTS = ('fetched', 'not_modified', 'error')
+
+_AMOUNT_RE = re.compile(r'\d[\d\s.,]*')
+
+
+@dataclass(frozen=True, slots=True)
+class PageData:
+    price: Optional[float] = None
+    specs: dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True, slots=True)
+class PageState:
+    """Разобранная страница и валидаторы ответа для условного запроса."""
+
+    etag: str
+    last_modified: str
+    data: PageData
+
+
+def parse_amount(text: str) -> float:
+    """Число из цены вида "$1,299.99", "1 299,99 ₽" или "199"."""
+    match = _AMOUNT_RE.search(text)
+    if match is None:
+        raise ValueError(f"нет числа в {text!r}")
+    amount = re.sub(r'\s', '', match.group()).rstrip('.,')
+    if ',' in amount and '.' in amount:
+        amount = amount.replace(',', '')
+    elif re.fullmatch(r'\d+,\d{1,2}', amount):
+        amount = amount.replace(',', '.')
+    else:
+        amount = amount.replace(',', '')
+    return float(amount)
+
+
+def format_price(value: float) -> str:
+    return f"${value:.0f}" if value == int(value) else f"${value:.2f}"
+
+
+def _text(element) -> str:
+    if element is None:
+        return ''
+    return (element.get('content') or element.get_text(' ', strip=True)).strip()
+
+
+def _json_ld_offers(soup: BeautifulSoup):
+    """Предложения (offers) товаров из блоков JSON-LD."""
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            stack = [json.loads(script.string or '')]
+        except ValueError:
+            continue
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(item)
+            elif isinstance(item, dict):
+                if item.get('@type') == 'Product':
+                    offers = item.get('offers', [])
+                    yield from offers if isinstance(offers, list) else [offers]
+                stack.extend(item.get('@graph', []))
+
+
+def _price(soup: BeautifulSoup) -> Optional[float]:
+    element = soup.find(attrs={'itemprop': 'price'})
+    if element is not None:
+        amount, currency = _text(element), _text(soup.find(attrs={'itemprop': 'priceCurrency'}))
+    else:
+        offer = next((offer for offer in _json_ld_offers(soup) if isinstance(offer, dict) and 'price' in offer), None)
+        if offer is None:
+            return None
+        amount, currency = str(offer['price']), str(offer.get('priceCurrency', ''))
+    if currency and currency.upper() != CATALOG_CURRENCY:
+        return None
+    try:
+        return parse_amount(amount)
+    except ValueError:
+        return None
+
+
+def _specs(soup: BeautifulSoup) -> dict:
+    specs = {}
+    for prop in soup.find_all(attrs={'itemprop': 'additionalProperty'}):
+        name, value = _text(prop.find(attrs={'itemprop': 'name'})), _text(prop.find(attrs={'itemprop': 'value'}))
+        if name and value:
+            specs[name] = value
+    for row in soup.select(SPEC_ROWS_SELECTOR):
+        cells = row.find_all(['th', 'td'])
+        if len(cells) >= 2:
+            name, value = cells[0].get_text(' ', strip=True), cells[1].get_text(' ', strip=True)
+            if name and value:
+                specs.setdefault(name, value)
+    return specs
+
+
+def parse_page(html) -> PageData:
+    """Цена и характеристики со страницы товара: микроразметка schema.org, JSON-LD или таблица характеристик."""
+    soup = BeautifulSoup(html, 'html.parser')
+    return PageData(_price(soup), _specs(soup))
+
+
+def product_updates(product, data: PageData) -> dict:
+    """Поля исходных данных товара, которые нужно заменить, чтобы он совпал со страницей."""
+    fields = {}
+    if data.price is not None and product.price != data.price:
+        fields['price'] = format_price(data.price)
+    # Незнакомые характеристики магазина в карточку не попадают: обновляются только уже известные
+    specs = {name: data.specs.get(name, value) for name, value in product.specs.items()}
+    if specs != dict(product.specs):
+        fields['specs'] = specs
+    return fields
+
+
+class PriceRefresher:
+    """Фоновое обновление цен и характеристик каталога со страниц товаров.
+
+    Страницы запрашиваются параллельно через общий ограниченный пул соединений,
+    с If-None-Match/If-Modified-Since: неизменившаяся страница стоит ответа 304
+    без тела. Отличия от каталога применяются точечно через CatalogStore.apply_updates.
+    Разобранные страницы запоминаются, поэтому после перезагрузки файла каталога
+    reapply возвращает обновления сразу, не дожидаясь следующего прохода.
+    """
+
+    def __init__(self, store, concurrency: int = None, timeout: float = None):
+        self.store = store
+        self.concurrency = concurrency or config.REFRESH_CONCURRENCY
+        self.timeout = timeout or config.REFRESH_TIMEOUT
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        # pool_block: больше concurrency соединений к одному магазину не открывается
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._pages = {}  # url -> PageState
+        # Проход пишет счётчики из своего потока: метки заводятся здесь, в цикле событий,
+        # чтобы render не застал вставку новой метки во время обхода словаря
+        for result in PAGE_RESULTS:
+            metrics.REFRESH_PAGES.inc(result, amount=0)
+        metrics.REFRESH_PRODUCTS.inc(amount=0)
+
+    @staticmethod
+    def sources(snapshot) -> dict:
+        """{url: [ключи товаров]} для товаров, у которых указана страница."""
+        sources = {}
+        for category, brands in snapshot.data.items():
+            for brand, models in brands.items():
+                for model, raw in models.items():
+                    url = raw.get(SOURCE_URL_FIELD)
+                    if url:
+                        sources.setdefault(url, []).append((category, brand, model))
+        return sources
+
+    def fetch(self, url: str) -> tuple:
+        """(исход из PAGE_RESULTS, PageState); вызывается из потоков пула."""
+        known = self._pages.get(url)
+        headers = {}
+        if known is not None:
+            if known.etag:
+                headers['If-None-Match'] = known.etag
+            if known.last_modified:
+                headers['If-Modified-Since'] = known.last_modified
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and known is not None:
+            return 'not_modified', known
+        response.raise_for_status()
+        state = PageState(response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''),
+                          parse_page(response.content))
+        self._pages[url] = state
+        return 'fetched', state
+
+    @staticmethod
+    def updates(snapshot, sources: dict, pages: dict) -> dict:
+        """{ключ товара: поля} для товаров, которые расходятся со своими страницами."""
+        updates = {}
+        for url, state in pages.items():
+            for key in sources.get(url, ()):
+                product = snapshot.product(*key)
+                fields = product_updates(product, state.data) if product is not None else None
+                if fields:
+                    updates[key] = fields
+        return updates
+
+    def run(self) -> int:
+        """Один проход по страницам; возвращает число изменённых товаров."""
+        snapshot = self.store.get()
+        sources = self.sources(snapshot)
+        for url in set(self._pages) - set(sources):
+            del self._pages[url]
+        if not sources:
+            return 0
+
+        started = time.perf_counter()
+        pages = {}
+        results = Counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='refresh') as executor:
+            futures = {executor.submit(self.fetch, url): url for url in sources}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    result, pages[url] = future.result()
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить страницу {url}: {e}")
+                    result = 'error'
+                    # Страница временно недоступна: держимся последней удачной версии
+                    if url in self._pages:
+                        pages[url] = self._pages[url]
+                results[result] += 1
+        for result, count in results.items():
+            metrics.REFRESH_PAGES.inc(result, amount=count)
+
+        updates = self.updates(snapshot, sources, pages)
+        changed = len(updates) if updates and self.store.apply_updates(updates) else 0
+        metrics.REFRESH_PRODUCTS.inc(amount=changed)
+        logger.info(f"Обновление цен: страниц {len(sources)}, изменено товаров {changed} "
+                    f"за {time.perf_counter() - started:.1f} с")
+        return changed
+
+    def reapply(self, snapshot) -> int:
+        """Обработчик перезагрузки каталога: применяет к новому файлу запомненные страницы."""
+        # Снимок от точечного обновления уже содержит обновления
+        if snapshot.changed is not None or not self._pages:
+            return 0
+        updates = self.updates(snapshot, self.sources(snapshot), dict(self._pages))
+        changed = len(updates) if updates and self.store.apply_updates(updates) else 0
+        if changed:
+            logger.info(f"Обновление цен: после перезагрузки каталога применено заново к {changed} товарам")
+        return changed
+
+    async def watch(self, interval: float):
+        while True:
+            try:
+                # Проход занимает поток надолго, поэтому не в пуле run_blocking с обработчиками
+                await asyncio.to_thread(self.run)
+            except Exception as e:
+                logger.error(f"Ошибка обновления цен: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,242 @@
+from typing import Optional
+
+from telegram import (InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle,
+                      InputTextMessageContent)
+
+import callbacks
+from cache import LRUCache
+
+CATEGORY_LABELS = {
+    "keyboards": "⌨️ Клавиатуры",
+    "mice": "🖱 Мышки",
+    "headphones": "🎧 Наушники"
+}
+
+# Кнопок товаров или брендов на одной странице списка
+PAGE_SIZE = 8
+# Экраны, показывающие данные одного товара: (вид, категория, бренд, модель, ...)
+PRODUCT_SCREENS = frozenset({'product_card', 'product_button', 'inline_result', 'view_button'})
+_MISSING = object()
+
+
+class RenderCache:
+    """Готовые подписи и клавиатуры экранов каталога для одного снимка.
+
+    Каждый экран строится при первом запросе и дальше отдаётся тем же объектом;
+    объекты telegram неизменяемы, поэтому их можно делить между пользователями.
+    Кэш живёт столько же, сколько снимок, и уходит вместе с ним при перезагрузке.
+    После точечного обновления товаров экраны, которых оно не касается, переходят
+    в новый кэш: id узлов не меняются, пока не меняется состав каталога.
+    С maxsize экраны хранятся в LRU этого размера, а не все до смены снимка.
+    """
+
+    def __init__(self, snapshot, maxsize: int = None):
+        # Индексы снимка ещё строятся, поэтому NodeIndex берём при первом обращении
+        self._snapshot = snapshot
+        self._rendered = {} if maxsize is None else LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        previous = snapshot.previous.indexes.get('render') if snapshot.previous is not None else None
+        if previous is not None and snapshot.changed is not None and maxsize is None:
+            categories = {category for category, _, _ in snapshot.changed}
+            self._rendered = {
+                key: value for key, value in previous._rendered.items()
+                if not (key[0] in PRODUCT_SCREENS and key[1:4] in snapshot.changed
+                        or key[0] == 'similar_list' and key[1] in categories)
+            }
+
+    def _memo(self, key: tuple, build):
+        value = self._rendered.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        # Гонка двух потоков безвредна: оба построят одинаковое, сохранится первое
+        return self._rendered.setdefault(key, build())
+
+    @property
+    def _nodes(self):
+        return self._snapshot.indexes['nodes']
+
+    def main_menu(self) -> InlineKeyboardMarkup:
+        return self._memo(('main_menu',), self._build_main_menu)
+
+    def _build_main_menu(self) -> InlineKeyboardMarkup:
+        nodes = self._nodes
+        categories = self._snapshot.categories()
+        keyboard = [
+            [InlineKeyboardButton(label, callback_data=callbacks.encode(callbacks.CATEGORY, nodes.category(category)))]
+            for category, label in CATEGORY_LABELS.items()
+            if category in categories
+        ]
+        keyboard += [
+            [InlineKeyboardButton("🌟 Получить рекомендации", callback_data=callbacks.ASK_PREFERENCES)],
+            [InlineKeyboardButton("🎮 Собрать киберспортивный сетап", callback_data=callbacks.SETUP_START)]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+
+    def recommendation_categories(self) -> InlineKeyboardMarkup:
+        return self._memo(('recommendation_categories',), self._build_recommendation_categories)
+
+    def _build_recommendation_categories(self) -> InlineKeyboardMarkup:
+        nodes = self._nodes
+        categories = self._snapshot.categories()
+        keyboard = [
+            [InlineKeyboardButton(label, callback_data=callbacks.encode(callbacks.RECOMMEND, nodes.category(category)))]
+            for category, label in CATEGORY_LABELS.items()
+            if category in categories
+        ]
+        keyboard.append([InlineKeyboardButton("❌ Пропустить", callback_data=callbacks.RECOMMEND)])
+        return InlineKeyboardMarkup(keyboard)
+
+    def _page_slice(self, items: tuple, page: int) -> tuple:
+        """(номер страницы, элементы страницы, всего страниц); номер за пределами списка прижимается к краю."""
+        pages = max((len(items) + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+        page = min(max(page, 0), pages - 1)
+        return page, items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE], pages
+
+    def _page_of(self, kind: str, items_key: tuple, items: tuple, item: str) -> int:
+        positions = self._memo(('positions', kind) + items_key,
+                               lambda: {value: position for position, value in enumerate(items)})
+        return positions.get(item, 0) // PAGE_SIZE
+
+    @staticmethod
+    def _navigation(page: int, pages: int, action: str, node_id: str) -> list:
+        row = []
+        if page > 0:
+            row.append(InlineKeyboardButton("◀️", callback_data=callbacks.encode_paged(action, node_id, page - 1)))
+        row.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=callbacks.NOOP))
+        if page < pages - 1:
+            row.append(InlineKeyboardButton("▶️", callback_data=callbacks.encode_paged(action, node_id, page + 1)))
+        return row
+
+    def brand_page(self, category: str, brand: str) -> int:
+        """Страница списка брендов, на которой стоит бренд: туда ведёт кнопка «Назад» из списка моделей."""
+        return self._page_of('brands', (category,), self._snapshot.brand_names(category), brand)
+
+    def model_page(self, category: str, brand: str, model: str) -> int:
+        return self._page_of('models', (category, brand), self._snapshot.model_names(category, brand), model)
+
+    def brand_list(self, category: str, page: int = 0) -> tuple:
+        """(текст, клавиатура) страницы списка брендов категории."""
+        brands = self._snapshot.brand_names(category)
+        page, _, _ = self._page_slice(brands, page)
+        return self._memo(('brand_list', category, page), lambda: self._build_brand_list(category, page))
+
+    def _build_brand_list(self, category: str, page: int) -> tuple:
+        nodes = self._nodes
+        category_id = nodes.category(category)
+        page, brands, pages = self._page_slice(self._snapshot.brand_names(category), page)
+        buttons = [
+            [InlineKeyboardButton(brand, callback_data=callbacks.encode(callbacks.BRAND, nodes.brand(category, brand)))]
+            for brand in brands
+        ]
+        if pages > 1:
+            buttons.append(self._navigation(page, pages, callbacks.CATEGORY, category_id))
+        facets = self._snapshot.indexes.get('facets')
+        if facets and facets.get(category):
+            buttons.append([InlineKeyboardButton("🎛 Подобрать по параметрам", callback_data=callbacks.encode(
+                callbacks.FILTER, category_id, ''))])
+        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.MENU)])
+        return "🏷 Выберите бренд:", InlineKeyboardMarkup(buttons)
+
+    def model_list(self, category: str, brand: str, page: int = 0) -> Optional[tuple]:
+        """(текст, клавиатура) страницы списка моделей бренда или None, если моделей нет."""
+        models = self._snapshot.model_names(category, brand)
+        if not models:
+            return None
+        page, _, _ = self._page_slice(models, page)
+        return self._memo(('model_list', category, brand, page),
+                          lambda: self._build_model_list(category, brand, page))
+
+    def _build_model_list(self, category: str, brand: str, page: int) -> tuple:
+        nodes = self._nodes
+        page, models, pages = self._page_slice(self._snapshot.model_names(category, brand), page)
+        buttons = [
+            [InlineKeyboardButton(model, callback_data=callbacks.encode(callbacks.MODEL, nodes.model(category, brand, model)))]
+            for model in models
+        ]
+        if pages > 1:
+            buttons.append(self._navigation(page, pages, callbacks.BRAND, nodes.brand(category, brand)))
+        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.encode_paged(
+            callbacks.CATEGORY, nodes.category(category), self.brand_page(category, brand)))])
+        return f"📋 Модели {brand}:", InlineKeyboardMarkup(buttons)
+
+    def product_card(self, category: str, brand: str, model: str) -> Optional[tuple]:
+        """(подпись, клавиатура) карточки товара или None, если данных о товаре не хватает."""
+        return self._memo(('product_card', category, brand, model),
+                          lambda: self._build_product_card(category, brand, model))
+
+    def _build_product_card(self, category: str, brand: str, model: str) -> Optional[tuple]:
+        product = self._snapshot.product(category, brand, model)
+        if product is None or not product.complete:
+            return None
+
+        specs = "\n".join([f"• {key}: {value}" for key, value in product.specs.items()])
+        caption = (
+            f"🔹 <b>{model}</b> ({brand})\n\n"
+            f"📝 <b>Описание:</b> {product.description}\n\n"
+            f"⚙️ <b>Характеристики:</b>\n{specs}\n\n"
+            f"💰 <b>Цена:</b> {product.price_text}"
+        )
+
+        nodes = self._nodes
+        keyboard = [
+            [InlineKeyboardButton("🔙 Назад", callback_data=callbacks.encode_paged(
+                callbacks.BRAND, nodes.brand(category, brand), self.model_page(category, brand, model)))]
+        ]
+        if 'similar' in self._snapshot.indexes:
+            keyboard.append([InlineKeyboardButton("🌟 Похожие товары", callback_data=callbacks.encode(
+                callbacks.SIMILAR, nodes.model(category, brand, model)))])
+        return caption, InlineKeyboardMarkup(keyboard)
+
+    def product_button(self, category: str, brand: str, model: str) -> InlineKeyboardButton:
+        return self._memo(('product_button', category, brand, model), lambda: InlineKeyboardButton(
+            f"{brand} {model}", callback_data=callbacks.encode(callbacks.MODEL, self._nodes.model(category, brand, model))
+        ))
+
+    def inline_result(self, category: str, brand: str, model: str, bot_username: str) -> Optional[InlineQueryResultArticle]:
+        """Карточка товара для inline-режима со ссылкой, открывающей её в личке с ботом."""
+        return self._memo(('inline_result', category, brand, model, bot_username),
+                          lambda: self._build_inline_result(category, brand, model, bot_username))
+
+    def _build_inline_result(self, category: str, brand: str, model: str, bot_username: str):
+        card = self.product_card(category, brand, model)
+        if card is None:
+            return None
+        caption, _ = card
+        product = self._snapshot.product(category, brand, model)
+        token = self._nodes.model(category, brand, model)
+        link = f"https://t.me/{bot_username}?start={callbacks.encode_start(callbacks.MODEL, token)}"
+        return InlineQueryResultArticle(
+            id=token,
+            title=f"{brand} {model}",
+            description=f"{CATEGORY_LABELS.get(category, category)} · {product.price_text or '?'}",
+            input_message_content=InputTextMessageContent(caption, parse_mode='HTML'),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Открыть в боте", url=link)]]),
+            thumbnail_url=product.photo_url or None
+        )
+
+    def similar_list(self, category: str, brand: str, model: str) -> Optional[tuple]:
+        """(текст, клавиатура) со списком похожих товаров или None, если их нет."""
+        return self._memo(('similar_list', category, brand, model),
+                          lambda: self._build_similar_list(category, brand, model))
+
+    def _build_similar_list(self, category: str, brand: str, model: str) -> Optional[tuple]:
+        index = self._snapshot.indexes.get('similar')
+        similar = index.similar(category, brand, model) if index else ()
+        if not similar:
+            return None
+        lines = [f"🌟 Похоже на {brand} {model}:\n"]
+        lines += [
+            f"{i}. {product.brand} {product.model} — {product.price_text or '?'}"
+            for i, product in enumerate(similar, 1)
+        ]
+        buttons = [[self.product_button(*product.key)] for product in similar]
+        return "\n".join(lines), InlineKeyboardMarkup(buttons)
+
+    def view_button(self, category: str, brand: str, model: str) -> InlineKeyboardMarkup:
+        return self._memo(('view_button', category, brand, model), lambda: InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔍 Посмотреть", callback_data=callbacks.encode(
+                callbacks.MODEL, self._nodes.model(category, brand, model)))]
+        ]))
@@ -0,0 +1,129 @@
+import numpy as np
+
+from catalog import CatalogSnapshot, HeadphoneType, Product, SwitchType
+
+RECOMMENDATION_WEIGHTS = {
+    'gaming': {'price': 0.3, 'specs': 0.7},
+    'work': {'price': 0.5, 'ergonomics': 0.5},
+    'budget': {'price': 0.8, 'value': 0.2}
+}
+
+# Столбцы матрицы признаков
+PRICE, DPI, POLLING_RATE, SWITCH_CLASS, FREQUENCY_RANGE, ON_EAR = range(6)
+
+# Две сотые: расхождение np.round с round() по каждому из двух концов сравнения
+ROUNDING_BAND = 0.02 + 1e-9
+
+SWITCH_CLASS_SCORES = {
+    SwitchType.MECHANICAL: 0.5,
+    SwitchType.OPTICAL: 0.7,
+}
+
+
+def profile_weight(usage: str) -> dict:
+    return RECOMMENDATION_WEIGHTS.get(usage, RECOMMENDATION_WEIGHTS['gaming'])
+
+
+def score_product(product: Product, weight: dict) -> float:
+    # Поштучный эталон, с которым сверяется векторный расчёт
+    score = 0
+
+    if product.price is not None:
+        score += (1 - min(product.price / 300, 1)) * weight['price']
+
+    specs_score = 0
+    if product.category == 'mice':
+        if product.dpi is not None:
+            specs_score += min(product.dpi / 16000, 1) * 0.4
+        if product.polling_rate is not None:
+            specs_score += product.polling_rate / 8000 * 0.3
+    elif product.category == 'keyboards':
+        specs_score += SWITCH_CLASS_SCORES.get(product.switch_type, 0)
+    elif product.category == 'headphones':
+        if product.frequency_range is not None:
+            specs_score += 0.4
+        if product.headphone_type is HeadphoneType.ON_EAR:
+            specs_score += 0.3
+
+    return score + specs_score * weight.get('specs', 0)
+
+
+def _feature_row(product: Product) -> tuple:
+    return (
+        np.nan if product.price is None else product.price,
+        np.nan if product.dpi is None else product.dpi,
+        np.nan if product.polling_rate is None else product.polling_rate,
+        SWITCH_CLASS_SCORES.get(product.switch_type, 0.0),
+        0.0 if product.frequency_range is None else 1.0,
+        1.0 if product.headphone_type is HeadphoneType.ON_EAR else 0.0,
+    )
+
+
+class CategoryFeatures:
+    __slots__ = ('products', 'matrix', 'price_score', 'specs_score')
+
+    def __init__(self, category: str, products: tuple):
+        self.products = products
+        self.matrix = np.array([_feature_row(product) for product in products], dtype=np.float64).reshape(-1, 6)
+
+        price = self.matrix[:, PRICE]
+        self.price_score = np.where(np.isnan(price), 0.0, 1 - np.minimum(price / 300, 1))
+
+        # Порядок сложения совпадает с score_product, чтобы результаты были побитово равны
+        if category == 'mice':
+            dpi = self.matrix[:, DPI]
+            polling = self.matrix[:, POLLING_RATE]
+            self.specs_score = (np.where(np.isnan(dpi), 0.0, np.minimum(dpi / 16000, 1) * 0.4)
+                                + np.where(np.isnan(polling), 0.0, polling / 8000 * 0.3))
+        elif category == 'keyboards':
+            self.specs_score = self.matrix[:, SWITCH_CLASS].copy()
+        elif category == 'headphones':
+            self.specs_score = self.matrix[:, FREQUENCY_RANGE] * 0.4 + self.matrix[:, ON_EAR] * 0.3
+        else:
+            self.specs_score = np.zeros(len(products))
+
+    @classmethod
+    def concat(cls, parts: list) -> 'CategoryFeatures':
+        features = cls.__new__(cls)
+        features.products = tuple(product for part in parts for product in part.products)
+        features.matrix = np.concatenate([part.matrix for part in parts]) if parts else np.empty((0, 6))
+        features.price_score = np.concatenate([part.price_score for part in parts]) if parts else np.empty(0)
+        features.specs_score = np.concatenate([part.specs_score for part in parts]) if parts else np.empty(0)
+        return features
+
+    def scores(self, weight: dict) -> np.ndarray:
+        return self.price_score * weight['price'] + self.specs_score * weight.get('specs', 0)
+
+
+class ScoringEngine:
+    """Матрицы признаков по категориям и векторный top-k для get_recommendations."""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.categories = {
+            category: CategoryFeatures(category, products)
+            for category, products in snapshot.by_category.items()
+        }
+        # None — рекомендации по всем категориям сразу, в порядке каталога
+        self.categories[None] = CategoryFeatures.concat(list(self.categories.values()))
+
+    def top(self, usage: str, category: str = None, k: int = 3) -> list:
+        features = self.categories.get(category)
+        if features is None or not features.products:
+            return []
+
+        scores = features.scores(profile_weight(usage))
+
+        # Частичный отбор вместо полной сортировки. np.round может разойтись с round()
+        # на одну сотую у значений вида x.xx5, поэтому берём полосу с запасом
+        # и точно округляем только её.
+        if len(scores) > k:
+            rounded = np.round(scores, 2)
+            threshold = np.partition(rounded, len(rounded) - k)[len(rounded) - k]
+            candidates = np.flatnonzero(rounded >= threshold - ROUNDING_BAND)
+        else:
+            candidates = np.arange(len(scores))
+        exact = np.array([round(float(score), 2) for score in scores[candidates]])
+
+        # При равных оценках выигрывает товар, стоящий в каталоге раньше (как у стабильного sorted)
+        order = np.lexsort((candidates, -exact))[:k]
+        return [(features.products[candidates[i]], float(exact[i])) for i in order]
@@ -0,0 +1,247 @@
+import bisect
+import re
+from collections import defaultdict
+from types import MappingProxyType
+
+import numpy as np
+
+# Вес поля, в котором найдено слово: совпадение в названии модели важнее, чем в описании
+FIELD_WEIGHTS = {
+    'model': 3.0,
+    'brand': 2.0,
+    'specs': 1.5,
+    'description': 1.0,
+}
+
+# Качество совпадения слова запроса со словом каталога
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+TYPO_MATCH = 0.6
+# Вариант запроса в другой раскладке или транслитерации чуть менее надёжен, чем исходный
+VARIANT_PENALTY = 0.9
+
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 50
+MAX_FUZZY_CANDIDATES = 50
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e',
+    'ю': 'yu', 'я': 'ya',
+}
+# Набор в неправильной раскладке: «кфяук» -> «razer», «vsirf» -> «мышка»
+_LAYOUT_RU = 'йцукенгшщзхъфывапролджэячсмитьбю'
+_LAYOUT_EN = "qwertyuiop[]asdfghjkl;'zxcvbnm,."
+_RU_TO_EN = str.maketrans(_LAYOUT_RU, _LAYOUT_EN)
+_EN_TO_RU = str.maketrans(_LAYOUT_EN, _LAYOUT_RU)
+
+
+def normalize(text: str) -> str:
+    return str(text).lower().replace('ё', 'е')
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _has_cyrillic(token: str) -> bool:
+    return any('а' <= char <= 'я' for char in token)
+
+
+def query_variants(token: str) -> list:
+    """Слово запроса и его варианты в другой раскладке и латинской транслитерации."""
+    variants = [(token, 1.0)]
+    if _has_cyrillic(token):
+        variants.append((''.join(_TRANSLIT.get(char, char) for char in token), VARIANT_PENALTY))
+        variants.append((token.translate(_RU_TO_EN), VARIANT_PENALTY))
+    else:
+        swapped = token.translate(_EN_TO_RU)
+        if swapped != token:
+            variants.append((swapped, VARIANT_PENALTY))
+    return [(variant, penalty) for variant, penalty in variants if _TOKEN_RE.fullmatch(variant)]
+
+
+def trigrams(token: str) -> set:
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(token: str) -> int:
+    return 1 if len(token) < 8 else 2
+
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна, если оно не больше limit, иначе limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class SearchIndex:
+    """Полнотекстовый поиск по каталогу: обратный индекс слов и триграммный индекс словаря.
+
+    Для каждого слова хранится массив товаров и вес лучшего поля, где оно встретилось.
+    Слова запроса сопоставляются со словарём точно, по префиксу и с опечатками
+    (кандидаты по общим триграммам, затем проверка расстоянием Левенштейна),
+    а оценки товаров складываются векторно.
+    """
+
+    def __init__(self, snapshot):
+        self.products = snapshot.products
+        if self._reuse(snapshot):
+            return
+        field_tokens = {}
+
+        def tokens_of(field, text):
+            tokens = field_tokens.get((field, text))
+            if tokens is None:
+                tokens = field_tokens[(field, text)] = dict.fromkeys(tokenize(text), FIELD_WEIGHTS[field])
+            return tokens
+
+        # Плоские списки пар (товар, слово) собираются без поштучных append, группировка — в numpy
+        flat_tokens = []
+        flat_weights = []
+        counts = []
+        for product in self.products:
+            # Поля идут по возрастанию веса, так что у слова остаётся вес лучшего поля
+            product_tokens = dict(tokens_of('description', product.description))
+            for value in product.specs.values():
+                product_tokens.update(tokens_of('specs', value))
+            product_tokens.update(tokens_of('brand', product.brand))
+            product_tokens.update(tokens_of('model', product.model))
+            flat_tokens.extend(product_tokens)
+            flat_weights.extend(product_tokens.values())
+            counts.append(len(product_tokens))
+
+        self.vocabulary = tuple(sorted(set(flat_tokens)))
+        self._token_ids = {token: token_id for token_id, token in enumerate(self.vocabulary)}
+        token_ids = np.fromiter(map(self._token_ids.__getitem__, flat_tokens), dtype=np.int32, count=len(flat_tokens))
+        order = np.argsort(token_ids, kind='stable')
+        all_positions = np.repeat(np.arange(len(self.products), dtype=np.int32), counts)[order]
+        frequencies = np.bincount(token_ids, minlength=len(self.vocabulary))
+        idf = np.log1p(max(len(self.products), 1) / np.maximum(frequencies, 1)).astype(np.float32)
+        all_weights = np.array(flat_weights, dtype=np.float32)[order] * np.repeat(idf, frequencies)
+        # Списки слов лежат подряд в двух общих массивах: слово token_id — отрезок bounds[token_id]:bounds[token_id + 1]
+        self._bounds = np.concatenate(([0], np.cumsum(frequencies)))
+        self._positions = all_positions
+        self._weights = all_weights
+
+        # Числа (номера моделей, DPI) ищем только точно и по префиксу
+        by_trigram = defaultdict(list)
+        for token_id, token in enumerate(self.vocabulary):
+            if len(token) >= MIN_FUZZY_LENGTH and not token.isdigit():
+                for trigram in trigrams(token):
+                    by_trigram[trigram].append(token_id)
+        self._by_trigram = MappingProxyType({
+            trigram: np.array(token_ids, dtype=np.int32) for trigram, token_ids in by_trigram.items()
+        })
+
+    def _prefix_matches(self, token: str) -> list:
+        start = bisect.bisect_left(self.vocabulary, token)
+        matches = []
+        for token_id in range(start, min(start + MAX_PREFIX_EXPANSIONS, len(self.vocabulary))):
+            if not self.vocabulary[token_id].startswith(token):
+                break
+            if self.vocabulary[token_id] != token:
+                matches.append(token_id)
+        return matches
+
+    def _fuzzy_matches(self, token: str, limit: int) -> list:
+        token_trigrams = trigrams(token)
+        lists = [self._by_trigram[trigram] for trigram in token_trigrams if trigram in self._by_trigram]
+        if not lists:
+            return []
+        # Каждая опечатка портит не больше трёх триграмм
+        required = max(1, len(token_trigrams) - 3 * limit)
+        token_ids, shared = np.unique(np.concatenate(lists), return_counts=True)
+        keep = shared >= required
+        token_ids, shared = token_ids[keep], shared[keep]
+        if len(token_ids) > MAX_FUZZY_CANDIDATES:
+            best = np.argpartition(-shared, MAX_FUZZY_CANDIDATES - 1)[:MAX_FUZZY_CANDIDATES]
+            token_ids = token_ids[best]
+        return [
+            token_id for token_id in token_ids.tolist()
+            if bounded_distance(token, self.vocabulary[token_id], limit) <= limit
+        ]
+
+    def _term_matches(self, term: str) -> dict:
+        """token_id -> качество совпадения для одного слова запроса."""
+        matches = {}
+
+        def offer(token_id, quality):
+            if matches.get(token_id, 0.0) < quality:
+                matches[token_id] = quality
+
+        for variant, penalty in query_variants(term):
+            token_id = self._token_ids.get(variant)
+            if token_id is not None:
+                offer(token_id, EXACT_MATCH * penalty)
+            if len(variant) >= MIN_PREFIX_LENGTH:
+                for token_id in self._prefix_matches(variant):
+                    offer(token_id, PREFIX_MATCH * penalty)
+            if len(variant) >= MIN_FUZZY_LENGTH and not variant.isdigit():
+                # Транслитерация сама по себе неточна («логитек» -> logitek), даём ей лишнюю опечатку
+                limit = max_typos(variant) + (penalty < 1.0)
+                for token_id in self._fuzzy_matches(variant, limit):
+                    offer(token_id, TYPO_MATCH * penalty)
+        return matches
+
+    def _reuse(self, snapshot) -> bool:
+        """После точечного обновления, не тронувшего тексты товаров, словарь берётся у прошлого индекса.
+
+        Порядок товаров при этом не меняется, поэтому позиции в списках слов остаются верными.
+        """
+        previous = snapshot.previous.indexes.get('search') if snapshot.previous is not None else None
+        if previous is None or snapshot.changed is None:
+            return False
+        for key in snapshot.changed:
+            old, new = snapshot.previous.product(*key), snapshot.product(*key)
+            if old.description != new.description or old.specs != new.specs:
+                return False
+        self.vocabulary = previous.vocabulary
+        self._token_ids = previous._token_ids
+        self._bounds = previous._bounds
+        self._positions = previous._positions
+        self._weights = previous._weights
+        self._by_trigram = previous._by_trigram
+        return True
+
+    def search(self, text: str, limit: int = 10) -> list:
+        """Товары по убыванию качества совпадения: сначала те, где нашлись все слова запроса."""
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms or not self.products:
+            return []
+
+        total = np.zeros(len(self.products), dtype=np.float32)
+        matched = np.zeros(len(self.products), dtype=np.int32)
+        for term in terms:
+            # Для слова запроса берём лучшее из его совпадений в товаре, а не сумму
+            term_scores = np.zeros(len(self.products), dtype=np.float32)
+            for token_id, quality in self._term_matches(term).items():
+                start, end = self._bounds[token_id], self._bounds[token_id + 1]
+                positions = self._positions[start:end]
+                term_scores[positions] = np.maximum(term_scores[positions], self._weights[start:end] * quality)
+            total += term_scores
+            matched += term_scores > 0
+
+        candidates = np.flatnonzero(matched)
+        if not len(candidates):
+            return []
+        rank = matched[candidates].astype(np.float64) * (total.max() + 1) + total[candidates]
+        if len(candidates) > limit:
+            best = np.argpartition(-rank, limit - 1)[:limit]
+            candidates, rank = candidates[best], rank[best]
+        order = np.lexsort((candidates, -rank))
+        return [self.products[position] for position in candidates[order].tolist()]
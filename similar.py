@@ -0,0 +1,246 @@
+import logging
+import math
+import time
+from types import MappingProxyType
+from typing import Optional
+
+import numpy as np
+
+from catalog import HeadphoneType, SwitchType
+from facets import CONNECTION
+
+logger = logging.getLogger(__name__)
+
+# Сколько похожих товаров хранить и показывать
+SIMILAR_COUNT = 5
+# Строк матрицы расстояний за один проход: ограничивает память при больших категориях
+BATCH_ROWS = 256
+# Сколько товаров по обе стороны от пачки сравнивать сразу, до уточнения радиуса поиска
+SEARCH_WINDOW = 512
+
+_WIRELESS, _WIRED, _BLUETOOTH = (option.matches for option in CONNECTION.options)
+
+
+def _log_scale(value, low: float, high: float) -> Optional[float]:
+    if value is None or value <= 0:
+        return None
+    return (math.log(value) - math.log(low)) / (math.log(high) - math.log(low))
+
+
+def _flag(value: bool) -> float:
+    return 1.0 if value else 0.0
+
+
+# Признак: (название, функция Product -> число или None, значение по умолчанию, вес).
+# Масштабы фиксированные, а не по текущему каталогу: вектор товара не зависит от соседей,
+# поэтому при перезагрузке достаточно пересчитать только затронутые строки.
+COMMON_FEATURES = (
+    ('price', lambda product: _log_scale(product.price, 30, 400), 0.6, 1.0),
+)
+
+CATEGORY_FEATURES = {
+    'mice': COMMON_FEATURES + (
+        ('dpi', lambda product: product.dpi and product.dpi / 30000, 0.6, 0.7),
+        ('polling_rate', lambda product: _log_scale(product.polling_rate, 125, 8000), 0.5, 0.5),
+        ('weight', lambda product: product.weight and product.weight / 150, 0.6, 1.0),
+        ('wireless', lambda product: _flag(_WIRELESS(product)), 0.0, 0.8),
+        ('bluetooth', lambda product: _flag(_BLUETOOTH(product)), 0.0, 0.4),
+    ),
+    'keyboards': COMMON_FEATURES + (
+        ('mechanical', lambda product: _flag(product.switch_type == SwitchType.MECHANICAL), 0.0, 0.7),
+        ('optical', lambda product: _flag(product.switch_type == SwitchType.OPTICAL), 0.0, 0.7),
+        ('other_switch', lambda product: _flag(product.switch_type == SwitchType.OTHER), 0.0, 0.7),
+        ('wireless', lambda product: _flag(_WIRELESS(product)), 0.0, 0.8),
+    ),
+    'headphones': COMMON_FEATURES + (
+        ('on_ear', lambda product: _flag(product.headphone_type == HeadphoneType.ON_EAR), 1.0, 1.0),
+        ('wireless', lambda product: _flag(_WIRELESS(product)), 0.0, 0.8),
+        ('bluetooth', lambda product: _flag(_BLUETOOTH(product)), 0.0, 0.4),
+    ),
+}
+
+
+def feature_matrix(products: tuple, features: tuple) -> np.ndarray:
+    matrix = np.empty((len(products), len(features)), dtype=np.float32)
+    for column, (_, extract, default, weight) in enumerate(features):
+        values = [extract(product) for product in products]
+        matrix[:, column] = [(default if value is None else value) * weight for value in values]
+    return matrix
+
+
+def _squared_distances(features: np.ndarray, norms: np.ndarray, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    distances = norms[rows, None] + norms[None, columns] - 2 * features[rows] @ features[columns].T
+    np.maximum(distances, 0, out=distances)
+    return distances
+
+
+def _top_k(distances: np.ndarray, candidates: np.ndarray, k: int) -> tuple:
+    """Для каждой строки — k ближайших из candidates (индексы в матрице признаков) и расстояния до них."""
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    part_distances = np.take_along_axis(distances, part, axis=1)
+    order = np.argsort(part_distances, axis=1, kind='stable')
+    part = np.take_along_axis(part, order, axis=1)
+    candidates = np.broadcast_to(candidates, distances.shape) if candidates.ndim == 1 else candidates
+    return np.take_along_axis(candidates, part, axis=1), np.take_along_axis(part_distances, order, axis=1)
+
+
+def _principal_axis(features: np.ndarray) -> np.ndarray:
+    if len(features) < 2:
+        return np.eye(features.shape[1], 1, dtype=np.float32)[:, 0]
+    _, vectors = np.linalg.eigh(np.cov(features, rowvar=False).reshape(features.shape[1], -1))
+    return vectors[:, -1].astype(np.float32)
+
+
+class CategoryNeighbours:
+    __slots__ = ('products', 'positions', 'features', 'neighbours', 'recomputed')
+
+    def __init__(self, products: tuple, features: np.ndarray, k: int, previous: 'CategoryNeighbours' = None):
+        self.products = products
+        self.positions = MappingProxyType({product.key: row for row, product in enumerate(products)})
+        self.features = features
+        self.neighbours = np.full((len(products), min(k, max(len(products) - 1, 0))), -1, dtype=np.int32)
+        self.recomputed = 0
+        if not len(products) or not self.neighbours.shape[1]:
+            return
+
+        norms = np.einsum('ij,ij->i', features, features)
+        recompute = np.ones(len(products), dtype=bool)
+        if previous is not None and previous.neighbours.shape[1] == self.neighbours.shape[1]:
+            recompute = self._reuse(previous, norms)
+        self._compute(np.flatnonzero(recompute), norms)
+        self.recomputed = int(recompute.sum())
+
+    def _reuse(self, previous: 'CategoryNeighbours', norms: np.ndarray) -> np.ndarray:
+        """Переносит соседей из предыдущего индекса; возвращает маску строк, которые надо считать заново."""
+        old_rows = np.fromiter((previous.positions.get(product.key, -1) for product in self.products),
+                               dtype=np.int64, count=len(self.products))
+        known = old_rows >= 0
+        known[known] = (previous.features[old_rows[known]] == self.features[known]).all(axis=1)
+        changed = np.flatnonzero(~known)
+
+        old_to_new = np.full(len(previous.products) + 1, -1, dtype=np.int64)
+        old_to_new[old_rows[known]] = np.flatnonzero(known)
+        # -1 в старом списке соседей (недобор в маленькой категории) тоже указывает на «нет соседа»
+        mapped = old_to_new[previous.neighbours[old_rows[known]]]
+        keep = np.flatnonzero(known)[(mapped >= 0).all(axis=1)]
+        mapped = mapped[(mapped >= 0).all(axis=1)]
+
+        # Если сосед исчез или изменился, следующий по близости неизвестен: такие строки считаем целиком.
+        # Остальным достаточно сравнить старых соседей с новыми и изменёнными товарами.
+        k = self.neighbours.shape[1]
+        for start in range(0, len(keep), BATCH_ROWS):
+            rows = keep[start:start + BATCH_ROWS]
+            old = mapped[start:start + BATCH_ROWS]
+            if not len(changed):
+                self.neighbours[rows] = old
+                continue
+            old_distances = (norms[rows, None] + norms[old]
+                             - 2 * np.einsum('ij,ikj->ik', self.features[rows], self.features[old]))
+            new_distances = _squared_distances(self.features, norms, rows, changed)
+            new_distances[rows[:, None] == changed[None, :]] = np.inf
+            candidates = np.concatenate([old, np.broadcast_to(changed, (len(rows), len(changed)))], axis=1)
+            distances = np.concatenate([np.maximum(old_distances, 0), new_distances], axis=1)
+            self.neighbours[rows], _ = _top_k(distances, candidates, k)
+
+        recompute = np.ones(len(self.products), dtype=bool)
+        recompute[keep] = False
+        return recompute
+
+    def _compute(self, rows: np.ndarray, norms: np.ndarray):
+        """Точные k ближайших для строк rows.
+
+        Строки сортируются по проекции на главную компоненту признаков. Пачка соседних строк
+        сначала сравнивается с окном вокруг себя; разница проекций не больше расстояния,
+        поэтому товары, чья проекция дальше текущего k-го расстояния, заведомо не ближе,
+        и окно расширяется только до границы по проекции, а не до всей категории.
+        """
+        k = self.neighbours.shape[1]
+        projection = self.features @ _principal_axis(self.features)
+        order = np.argsort(projection, kind='stable')
+        keys = projection[order]
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        ranks = np.sort(rank[rows])
+        pending = []
+        for start in range(0, len(ranks), BATCH_ROWS):
+            batch_ranks = ranks[start:start + BATCH_ROWS]
+            low = max(int(batch_ranks[0]) - SEARCH_WINDOW, 0)
+            high = min(int(batch_ranks[-1]) + SEARCH_WINDOW + 1, len(order))
+            batch = order[batch_ranks]
+            neighbours, radius = self._nearest(batch, order[low:high], norms, k)
+            self.neighbours[batch] = neighbours
+            # Строка готова, если всё за пределами окна дальше её k-го соседа уже по одной проекции
+            done = ((low == 0) | (keys[batch_ranks] - radius > keys[max(low - 1, 0)])) & \
+                   ((high == len(order)) | (keys[batch_ranks] + radius < keys[min(high, len(order) - 1)]))
+            pending.append(np.stack([batch_ranks[~done], radius[~done]], axis=1))
+
+        # Оставшиеся строки ищем заново каждую в своём диапазоне проекций
+        pending = np.concatenate(pending) if pending else np.empty((0, 2))
+        lows = np.searchsorted(keys, keys[pending[:, 0].astype(np.int64)] - pending[:, 1], side='left')
+        highs = np.searchsorted(keys, keys[pending[:, 0].astype(np.int64)] + pending[:, 1], side='right')
+        for start in range(0, len(pending), BATCH_ROWS):
+            batch = order[pending[start:start + BATCH_ROWS, 0].astype(np.int64)]
+            low, high = int(lows[start:start + BATCH_ROWS].min()), int(highs[start:start + BATCH_ROWS].max())
+            self.neighbours[batch], _ = self._nearest(batch, order[low:high], norms, k)
+
+    def _nearest(self, batch: np.ndarray, candidates: np.ndarray, norms: np.ndarray, k: int) -> tuple:
+        """k ближайших среди candidates и радиус до k-го из них для каждой строки пачки."""
+        distances = _squared_distances(self.features, norms, batch, candidates)
+        distances[batch[:, None] == candidates[None, :]] = np.inf
+        neighbours, nearest = _top_k(distances, candidates, k)
+        # В окне может не набраться k соседей: тогда радиус бесконечен и строка уходит в повторный поиск
+        return neighbours, np.sqrt(nearest[:, -1])
+
+
+class SimilarityIndex:
+    """k ближайших товаров той же категории для каждого товара, посчитанные при загрузке каталога.
+
+    Нажатие «Похожие товары» — поиск строки по ключу и чтение готового списка.
+    С previous переиспользует соседей товаров, которые не изменились.
+    """
+
+    def __init__(self, snapshot, previous: 'SimilarityIndex' = None, k: int = SIMILAR_COUNT):
+        started = time.perf_counter()
+        self.categories = {}
+        for category, features in CATEGORY_FEATURES.items():
+            products = snapshot.by_category.get(category, ())
+            if not products:
+                continue
+            previous_category = previous.categories.get(category) if previous else None
+            self.categories[category] = CategoryNeighbours(
+                products, feature_matrix(products, features), k, previous_category
+            )
+        self.categories = MappingProxyType(self.categories)
+        self.recomputed = sum(category.recomputed for category in self.categories.values())
+        logger.info(
+            f"Индекс похожих товаров: пересчитано {self.recomputed} из {len(snapshot.products)} "
+            f"за {time.perf_counter() - started:.2f} с"
+        )
+
+    def similar(self, category: str, brand: str, model: str) -> tuple:
+        neighbours = self.categories.get(category)
+        row = neighbours.positions.get((category, brand, model)) if neighbours else None
+        if row is None:
+            return ()
+        return tuple(neighbours.products[other] for other in neighbours.neighbours[row] if other >= 0)
+
+
+class IncrementalSimilarity:
+    """Строитель индекса для CatalogStore: помнит прошлый индекс и при перезагрузке пересчитывает только изменения."""
+
+    def __init__(self, k: int = SIMILAR_COUNT):
+        self.k = k
+        self._previous = None
+
+    def __call__(self, snapshot) -> SimilarityIndex:
+        index = SimilarityIndex(snapshot, self._previous, self.k)
+        self._previous = index
+        return index
+
+    def adopt(self, index: SimilarityIndex):
+        """Индекс, прочитанный из готового снимка каталога, становится прошлым для следующей перезагрузки."""
+        self._previous = index
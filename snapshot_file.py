@@ -0,0 +1,157 @@
+import copyreg
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from types import MappingProxyType
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ANLTSNAP'
+# Меняется при любом изменении раскладки файла
+FORMAT_VERSION = 1
+# Начала массивов выровнены: numpy читает их прямо из отображения файла
+ALIGNMENT = 64
+# Массивы меньше этого проще держать внутри pickle, чем отдельными участками файла
+MIN_MAPPED_BYTES = 4096
+# Магия и длина JSON-заголовка
+_PREFIX = struct.Struct('<8sQ')
+
+
+def _mapping_proxy(items: dict) -> MappingProxyType:
+    return MappingProxyType(items)
+
+
+class _Pickler(pickle.Pickler):
+    # MappingProxyType pickle не сохраняет: пишем словарь и оборачиваем его заново при чтении
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[MappingProxyType] = lambda proxy: (_mapping_proxy, (proxy.copy(),))
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def content_hash(source: bytes) -> str:
+    """Хэш содержимого tech_data.json, из которого собран снимок."""
+    return hashlib.sha256(source).hexdigest()
+
+
+def code_version(index_builders: dict) -> str:
+    """Хэш исходников модулей, чьи объекты лежат в снимке, и версий Python и numpy.
+
+    Снимок хранит объекты классов этих модулей: после изменения кода он считается
+    устаревшим, а не читается в новые классы.
+    """
+    modules = {'catalog', __name__} | {build.__module__ for build in index_builders.values()}
+    digest = hashlib.sha256(f"python {sys.version_info[:2]} numpy {np.__version__}".encode())
+    for name in sorted(modules):
+        with open(sys.modules[name].__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def write(path: str, snapshot, source_hash: str, index_builders: dict):
+    """Сохраняет снимок каталога вместе с индексами в файл для быстрого старта.
+
+    Объекты пишутся pickle (протокол 5), а крупные массивы numpy — отдельными
+    выровненными участками после него. Файл заменяется атомарно: процессы,
+    которые уже отобразили старый файл, дочитывают его без помех.
+    """
+    started = time.perf_counter()
+    arrays = []
+
+    def out_of_band(buffer):
+        # Истинное значение оставляет буфер внутри pickle
+        if buffer.raw().nbytes < MIN_MAPPED_BYTES:
+            return True
+        arrays.append(buffer)
+        return False
+
+    body = io.BytesIO()
+    _Pickler(body, protocol=5, buffer_callback=out_of_band).dump(snapshot)
+    objects = body.getbuffer()
+
+    sections = [(0, len(objects))]
+    offset = _align(len(objects))
+    for buffer in arrays:
+        sections.append((offset, buffer.raw().nbytes))
+        offset = _align(offset + buffer.raw().nbytes)
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'source': source_hash,
+        'code': code_version(index_builders),
+        'indexes': sorted(index_builders),
+        'products': len(snapshot.products),
+        'built_at': time.time(),
+        'sections': sections,
+    }).encode()
+    start = _align(_PREFIX.size + len(header))
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(_PREFIX.pack(MAGIC, len(header)))
+        file.write(header)
+        for (section_offset, _), data in zip(sections, [objects] + [buffer.raw() for buffer in arrays]):
+            file.seek(start + section_offset)
+            file.write(data)
+    os.replace(temporary, path)
+    logger.info(f"Снимок каталога записан в {path}: товаров {len(snapshot.products)}, "
+                f"{(start + offset) / 2 ** 20:.1f} МБ, массивов {len(arrays)} за {time.perf_counter() - started:.2f} с")
+
+
+def _stale_reason(header: dict, source_hash: str, index_builders: dict) -> Optional[str]:
+    if header.get('format') != FORMAT_VERSION:
+        return f"формат {header.get('format')}, ожидался {FORMAT_VERSION}"
+    if header.get('source') != source_hash:
+        return "собран из другой версии файла каталога"
+    if header.get('indexes') != sorted(index_builders):
+        return f"индексы {header.get('indexes')}, нужны {sorted(index_builders)}"
+    if header.get('code') != code_version(index_builders):
+        return "собран другой версией кода"
+    return None
+
+
+def read(path: str, source_hash: str, index_builders: dict):
+    """Снимок каталога из файла или None, если файла нет или он собран не из этого каталога и кода.
+
+    Файл отображается в память: массивы numpy индексов смотрят прямо в отображение
+    без копирования и только для чтения, а страницы подгружаются по мере обращения.
+    Отображение закрывается, когда снимок и его массивы больше никому не нужны.
+    """
+    try:
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        logger.info(f"Снимка каталога {path} нет: загрузка из JSON")
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Снимок каталога {path} недоступен: {e}")
+        return None
+
+    view = memoryview(mapped)
+    reason = None
+    if len(view) < _PREFIX.size or _PREFIX.unpack_from(view)[0] != MAGIC:
+        reason = "не файл снимка каталога"
+    else:
+        header_size = _PREFIX.unpack_from(view)[1]
+        header = json.loads(bytes(view[_PREFIX.size:_PREFIX.size + header_size]))
+        reason = _stale_reason(header, source_hash, index_builders)
+    if reason is not None:
+        logger.warning(f"Снимок каталога {path} пропущен: {reason}")
+        view.release()
+        mapped.close()
+        return None
+
+    start = _align(_PREFIX.size + header_size)
+    sections = [view[start + offset:start + offset + size] for offset, size in header['sections']]
+    return pickle.loads(sections[0], buffers=sections[1:])
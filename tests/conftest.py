@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from benchmarks.synthetic import generate_catalog
+from callbacks import NodeIndex
+from catalog import CatalogSnapshot
+from catalog_db import SqlCatalogStore, SqlNodeIndex, SqlRenderCache, import_json
+from render import RenderCache
+
+CATALOG_SIZE = 12
+
+
+@pytest.fixture
+def catalog_data():
+    return generate_catalog(CATALOG_SIZE)
+
+
+@pytest.fixture
+def json_catalog(catalog_data):
+    return CatalogSnapshot(catalog_data, 1, 0.0, {'nodes': NodeIndex, 'render': RenderCache})
+
+
+@pytest.fixture
+def sql_catalog(catalog_data, tmp_path):
+    path = tmp_path / 'tech_data.json'
+    path.write_text(json.dumps(catalog_data, ensure_ascii=False), encoding='utf-8')
+    url = f"sqlite:///{tmp_path / 'catalog.sqlite3'}"
+    import_json(str(path), url)
+    store = SqlCatalogStore(url, index_builders={'nodes': SqlNodeIndex, 'render': SqlRenderCache})
+    assert store.reload()
+    yield store.get()
+    store.engine.dispose()
+
+
+@pytest.fixture(params=['json_catalog', 'sql_catalog'])
+def catalog(request):
+    """Один и тот же каталог в памяти и в SQLite."""
+    return request.getfixturevalue(request.param)
@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+import config
+import delivery
+from delivery import Card
+
+PHOTO_DELAY = 0.3
+
+
+class FakeBot:
+    """Записывает вызовы; send_photo ведёт себя по правилам из photo_behaviour."""
+
+    def __init__(self, photo_behaviour=None, album_behaviour=None):
+        self.calls = []
+        self.photo_behaviour = photo_behaviour or (lambda chat_id, photo: None)
+        self.album_behaviour = album_behaviour or (lambda media: None)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.calls.append(('photo', chat_id, photo if isinstance(photo, str) else bytes, kwargs.get('caption')))
+        result = self.photo_behaviour(chat_id, photo)
+        if asyncio.iscoroutine(result):
+            await result
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"id-{len(self.calls)}")], delete=_noop)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        self.calls.append(('album', chat_id, [item.media if isinstance(item.media, str) else bytes for item in media],
+                           None))
+        result = self.album_behaviour(media)
+        if asyncio.iscoroutine(result):
+            await result
+        return [SimpleNamespace(photo=[SimpleNamespace(file_id=f"album-{i}")]) for i in range(len(media))]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('text', chat_id, None, text))
+        return SimpleNamespace(photo=None)
+
+
+async def _noop():
+    pass
+
+
+class MemoryPhotoCache:
+    def __init__(self):
+        self.entries = {}
+
+    def lookup(self, key, photo_url):
+        entry = self.entries.get(key)
+        return entry[1] if entry and entry[0] == photo_url else None
+
+    def remember(self, key, photo_url, message):
+        self.entries[key] = (photo_url, message.photo[-1].file_id)
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+
+@pytest.fixture
+def slow_photos():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(PHOTO_DELAY)
+            body = b'jpeg' + self.path.encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield lambda path: f"http://127.0.0.1:{server.server_address[1]}{path}"
+    server.shutdown()
+    server.server_close()
+
+
+def cards(url) -> list:
+    return [Card(text=f"#{i}", photo_url=url(f"/{i}.jpg"), photo_key=f"mice/b/{i}") for i in range(3)]
+
+
+def test_photos_are_downloaded_concurrently_and_sent_in_rank_order(monkeypatch, slow_photos):
+    monkeypatch.setattr(config, 'PHOTO_STAGING_CHAT_ID', 0)
+    bot, cache = FakeBot(), MemoryPhotoCache()
+    started = time.perf_counter()
+    asyncio.run(delivery.send_cards(bot, 101, cards(slow_photos), cache))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < PHOTO_DELAY * 2, elapsed
+    assert [(kind, photo, caption) for kind, _, photo, caption in bot.calls] == [
+        ('photo', bytes, '#0'), ('photo', bytes, '#1'), ('photo', bytes, '#2')
+    ]
+    assert set(cache.entries) == {'mice/b/0', 'mice/b/1', 'mice/b/2'}
+
+
+def test_staging_failure_falls_back_to_photo_url_before_text(monkeypatch):
+    staging_chat = -100
+    monkeypatch.setattr(config, 'PHOTO_STAGING_CHAT_ID', staging_chat)
+
+    def behaviour(chat_id, photo):
+        if chat_id == staging_chat:
+            raise RuntimeError("staging chat unavailable")
+
+    bot = FakeBot(behaviour)
+    card = Card(text="#0", photo_url='https://shop/0.jpg', photo_key='mice/b/0')
+    asyncio.run(delivery.send_cards(bot, 102, [card], MemoryPhotoCache()))
+    assert bot.calls[-1] == ('photo', 102, 'https://shop/0.jpg', '#0')
+    assert not any(kind == 'text' for kind, *_ in bot.calls)
+
+
+def test_timeout_does_not_include_waiting_for_a_slot(monkeypatch):
+    monkeypatch.setattr(config, 'SEND_CONCURRENCY_PER_CHAT', 1)
+    monkeypatch.setattr(config, 'PHOTO_SEND_TIMEOUT', 0.2)
+
+    async def slow(chat_id, photo):
+        await asyncio.sleep(0.15)
+
+    cache = MemoryPhotoCache()
+    for i in range(3):
+        cache.entries[f'mice/b/{i}'] = (f'https://shop/{i}.jpg', f'file-{i}')
+
+    async def run():
+        bot = FakeBot(slow)
+        # Одна карточка на вызов: с одним слотом на чат вторая и третья ждут дольше таймаута
+        await asyncio.gather(*(
+            delivery.send_cards(bot, 103, [Card(text=f"#{i}", photo_url=f'https://shop/{i}.jpg',
+                                                photo_key=f'mice/b/{i}')], cache)
+            for i in range(3)
+        ))
+        return bot.calls
+
+    calls = asyncio.run(run())
+    assert sorted(photo for _, _, photo, _ in calls) == ['file-0', 'file-1', 'file-2']
+
+
+class FakeThumbnails:
+    """Миниатюры для ссылок из ready; запоминает потоки, в которых их читали."""
+
+    def __init__(self, ready=()):
+        self.ready = set(ready)
+        self.threads = []
+
+    def get(self, url):
+        self.threads.append(threading.current_thread())
+        return b'thumbnail' if url in self.ready else None
+
+    def prefetch(self, url):
+        pass
+
+
+def album_cards() -> list:
+    return [Card(text=f"#{i}", photo_url=f'https://shop/{i}.jpg', photo_key=f'mice/b/{i}') for i in range(3)]
+
+
+def test_album_reads_thumbnails_off_the_loop_and_keeps_their_file_ids_apart():
+    bot, photos, album_photos = FakeBot(), MemoryPhotoCache(), MemoryPhotoCache()
+    thumbnails = FakeThumbnails({'https://shop/1.jpg', 'https://shop/2.jpg'})
+    photos.entries['mice/b/2'] = ('https://shop/2.jpg', 'full-2')
+    asyncio.run(delivery.send_album(bot, 104, album_cards(), photos, thumbnails, album_photos))
+
+    assert bot.calls == [('album', 104, ['https://shop/0.jpg', bytes, 'full-2'], None)]
+    assert thumbnails.threads and threading.main_thread() not in thumbnails.threads
+    # Уменьшенная копия не должна попасть в кэш полноразмерных фото карточек
+    assert photos.entries == {'mice/b/0': ('https://shop/0.jpg', 'album-0'),
+                              'mice/b/2': ('https://shop/2.jpg', 'full-2')}
+    assert album_photos.entries == {'mice/b/1': ('https://shop/1.jpg', 'album-1')}
+
+    bot = FakeBot()
+    asyncio.run(delivery.send_album(bot, 104, album_cards(), photos, thumbnails, album_photos))
+    assert bot.calls == [('album', 104, ['album-0', 'album-1', 'full-2'], None)]
+
+
+def test_album_timeout_is_not_sent_again(monkeypatch):
+    monkeypatch.setattr(config, 'PHOTO_SEND_TIMEOUT', 0.05)
+    photos = MemoryPhotoCache()
+    photos.entries['mice/b/0'] = ('https://shop/0.jpg', 'file-0')
+    bot = FakeBot(album_behaviour=lambda media: asyncio.sleep(0.2))
+    assert asyncio.run(delivery.send_album(bot, 105, album_cards(), photos)) == []
+
+    assert [kind for kind, *_ in bot.calls] == ['album']
+    assert 'mice/b/0' in photos.entries
+
+
+@pytest.mark.parametrize('error, forgotten', [
+    (BadRequest("Wrong file identifier/http url specified"), True),
+    (BadRequest("Message caption is too long"), False),
+])
+def test_album_error_forgets_file_ids_only_when_about_the_file(monkeypatch, error, forgotten):
+    # Фото без file_id при отправке по одной заливаются в служебный чат, а не скачиваются
+    monkeypatch.setattr(config, 'PHOTO_STAGING_CHAT_ID', -100)
+    photos, album_photos = MemoryPhotoCache(), MemoryPhotoCache()
+    photos.entries['mice/b/0'] = ('https://shop/0.jpg', 'file-0')
+    album_photos.entries['mice/b/1'] = ('https://shop/1.jpg', 'album-1')
+
+    def reject(media):
+        raise error
+
+    bot = FakeBot(album_behaviour=reject)
+    asyncio.run(delivery.send_album(bot, 106, album_cards(), photos, None, album_photos))
+
+    assert [kind for kind, *_ in bot.calls][0] == 'album'
+    sent = [caption for kind, chat_id, _, caption in bot.calls if kind == 'photo' and chat_id == 106]
+    assert sent == ['#0', '#1', '#2']
+    assert ('mice/b/0' not in photos.entries or photos.entries['mice/b/0'][1] != 'file-0') == forgotten
+    assert ('mice/b/1' not in album_photos.entries) == forgotten
+
+
+@pytest.mark.parametrize('retry_after, failures, sent', [
+    (0, 1, True),
+    (0, 2, False),
+    (3600, 1, False),
+])
+def test_album_flood_control_is_waited_out_instead_of_sending_cards(monkeypatch, retry_after, failures, sent):
+    photos = MemoryPhotoCache()
+    attempts = []
+
+    def throttle(media):
+        attempts.append(media)
+        if len(attempts) <= failures:
+            raise RetryAfter(retry_after)
+
+    bot = FakeBot(album_behaviour=throttle)
+    messages = asyncio.run(delivery.send_album(bot, 107, album_cards(), photos))
+
+    # Карточки по одной в чат, упёршийся в лимит, не отправляются
+    assert {kind for kind, *_ in bot.calls} == {'album'}
+    assert len(attempts) == (2 if retry_after <= config.OUTBOUND_MAX_RETRY_AFTER else 1)
+    assert bool(messages) == sent
@@ -0,0 +1,47 @@
+import pytest
+
+import catalog_db
+from benchmarks.synthetic import generate_catalog
+from catalog import MouseSize
+from catalog_db import SqlSetupIndex
+from gaming_setup import GENRE_PROFILES, SetupIndex
+
+QUERIES = [(genre, size.value, feel, budget) for genre in GENRE_PROFILES for size in MouseSize
+           for feel in ('linear', 'tactile', 'clicky') for budget in (None, 150, 300, 600)]
+
+
+@pytest.fixture
+def catalog_data():
+    return generate_catalog(300)
+
+
+def keys(setups):
+    return [(setup.mouse.key, setup.keyboard.key, setup.headphones.key, setup.score, setup.price)
+            for setup in setups]
+
+
+def test_sql_setups_match_json(json_catalog, sql_catalog):
+    json_index, sql_index = SetupIndex(json_catalog), SqlSetupIndex(sql_catalog)
+    for query in QUERIES:
+        assert keys(sql_index.solve(*query)) == keys(json_index.solve(*query)), query
+
+
+def test_sql_setup_reads_bounded_candidates(json_catalog, sql_catalog, monkeypatch):
+    monkeypatch.setattr(catalog_db, 'SETUP_CANDIDATES', 5)
+    json_index, sql_index = SetupIndex(json_catalog), SqlSetupIndex(sql_catalog)
+    read = []
+    candidates = SqlSetupIndex._candidates
+
+    def recorded(self, *args):
+        read.append(candidates(self, *args))
+        return read[-1]
+
+    monkeypatch.setattr(SqlSetupIndex, '_candidates', recorded)
+
+    for query in QUERIES:
+        found = sql_index.solve(*query)
+        # Без бюджета k лучших сетапов складываются из лучших товаров слота
+        if query[-1] is None:
+            assert keys(found) == keys(json_index.solve(*query)), query
+    assert read and all(len(features) <= 10 for features in read)
+    assert not hasattr(sql_index, 'components')
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import delivery
+import metrics
+
+
+def fake_context():
+    return SimpleNamespace(application=SimpleNamespace(update_queue=asyncio.Queue()))
+
+
+async def route_callback(update, context):
+    metrics.label('show_recommendations')
+
+
+@pytest.mark.parametrize('sample_rate', [0.0, 1.0])
+def test_routed_handler_is_counted_under_its_label_whether_sampled_or_not(monkeypatch, sample_rate):
+    monkeypatch.setattr(config, 'METRICS_SAMPLE_RATE', sample_rate)
+    monkeypatch.setattr(config, 'METRICS_LOG_UPDATES', False)
+    handler = metrics.instrument(route_callback)
+    routed = metrics.UPDATES.value('show_recommendations', 'ok')
+    unrouted = metrics.UPDATES.value('route_callback', 'ok')
+
+    asyncio.run(handler(None, None))
+
+    assert metrics.UPDATES.value('show_recommendations', 'ok') - routed == 1
+    assert metrics.UPDATES.value('route_callback', 'ok') == unrouted
+
+
+def test_queue_waits_are_not_counted_as_handler_time(monkeypatch, caplog):
+    monkeypatch.setattr(config, 'METRICS_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(config, 'METRICS_LOG_UPDATES', True)
+    monkeypatch.setattr(delivery, '_global_slots', asyncio.Semaphore(1))
+
+    async def busy_slot():
+        await delivery._limited(1, lambda: asyncio.sleep(0.1))
+
+    async def send_card(update, context):
+        # Слот рассылки занят другим апдейтом: ожидание — время в Telegram, а не обработчика
+        await delivery._limited(2, lambda: asyncio.sleep(0))
+
+    async def run():
+        other = asyncio.create_task(busy_slot())
+        await asyncio.sleep(0)
+        with caplog.at_level(logging.INFO, logger='metrics'):
+            await metrics.instrument(send_card)(None, fake_context())
+        await other
+
+    asyncio.run(run())
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record['telegram_ms'] >= 90
+    assert record['total_ms'] - record['telegram_ms'] < 20
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+import config
+import metrics
+from benchmarks.fake_bot_api import FakeBotApi
+from outbound import OutboundRequest
+
+CHAT_ID = 42
+
+
+@pytest.fixture(autouse=True)
+def no_local_limits(monkeypatch):
+    # Частоту ограничивает заглушка, как настоящий Telegram
+    monkeypatch.setattr(config, 'OUTBOUND_CHAT_RATE', 0)
+    monkeypatch.setattr(config, 'OUTBOUND_GLOBAL_RATE', 0)
+
+
+async def run_with_bot(scenario, **api_options):
+    api = await FakeBotApi(**api_options).start()
+    bot = Bot('123:fake', base_url=api.base_url, request=OutboundRequest(connection_pool_size=8))
+    await bot.initialize()
+    try:
+        return api, await scenario(api, bot)
+    finally:
+        await bot.shutdown()
+        await api.stop()
+
+
+def edited_texts(api: FakeBotApi) -> list:
+    return [params['text'] for method, params in api.requests if method == 'editMessageText']
+
+
+def test_edit_errors_reach_the_caller_and_duplicates_are_not_sent():
+    async def scenario(api, bot):
+        message = await bot.send_message(CHAT_ID, 'menu')
+        with pytest.raises(BadRequest, match='not modified'):
+            await bot.edit_message_text('menu', CHAT_ID, message.message_id)
+        edited = await bot.edit_message_text('cards', CHAT_ID, message.message_id)
+        repeated = await bot.edit_message_text('cards', CHAT_ID, message.message_id)
+        return edited, repeated
+
+    api, (edited, repeated) = asyncio.run(run_with_bot(scenario, check_modified=True))
+    assert isinstance(edited, Message) and edited.text == 'cards'
+    # Повтор уже отправленной правки не доходит до Telegram
+    assert repeated is True
+    assert edited_texts(api) == ['menu', 'cards']
+
+
+def test_pending_edit_is_replaced_by_a_newer_one():
+    async def scenario(api, bot):
+        message = await bot.send_message(CHAT_ID, 'menu')
+        saved = metrics.API_CALLS_SAVED.value('coalesced')
+        first = asyncio.create_task(bot.edit_message_text('first', CHAT_ID, message.message_id))
+        # Пока первая правка в пути, приходят ещё две
+        await api.wait_for_calls('editMessageText', 1)
+        results = await asyncio.gather(first, *(
+            bot.edit_message_text(text, CHAT_ID, message.message_id) for text in ('second', 'third')
+        ))
+        return results, metrics.API_CALLS_SAVED.value('coalesced') - saved
+
+    api, (results, coalesced) = asyncio.run(run_with_bot(scenario, latency=0.05))
+    first, second, third = results
+    assert first.text == 'first' and third.text == 'third'
+    # Заменённая правка не отправляется, а её обработчик сразу получает True
+    assert second is True
+    assert coalesced == 1
+    assert edited_texts(api) == ['first', 'third']
+
+
+def test_flood_control_is_waited_out_and_retried():
+    async def scenario(api, bot):
+        retries = metrics.API_RETRIES.value('sendMessage')
+        started = time.monotonic()
+        messages = [await bot.send_message(CHAT_ID, text) for text in ('one', 'two')]
+        return messages, metrics.API_RETRIES.value('sendMessage') - retries, time.monotonic() - started
+
+    api, (messages, retries, elapsed) = asyncio.run(run_with_bot(scenario, chat_rate=1, chat_burst=1))
+    assert [message.text for message in messages] == ['one', 'two']
+    assert api.calls['flood'] == 1 and retries == 1
+    # Повтор уходит не раньше retry_after из ответа 429
+    assert elapsed >= 1
@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+import mongomock
+import pymongo
+import pytest
+
+from persistence import INDEX_OPTIONS_CONFLICT, MongoUserPersistence, SQLUserPersistence
+
+TTL = 3600
+
+
+@pytest.fixture(params=['sql', 'mongo'])
+def make_persistence(request, tmp_path):
+    url = f"sqlite:///{tmp_path / 'state.sqlite3'}"
+    collection = mongomock.MongoClient(tz_aware=True).db.user_state
+
+    def make(batch_size: int = 500):
+        if request.param == 'sql':
+            return SQLUserPersistence(url, update_interval=60, ttl=TTL, batch_size=batch_size)
+        return MongoUserPersistence('', collection=collection, update_interval=60, ttl=TTL, batch_size=batch_size)
+    return make
+
+
+def count_writes(persistence) -> list:
+    batches = []
+    write = persistence._write
+
+    def recording(batch, now):
+        batches.append(dict(batch))
+        write(batch, now)
+    persistence._write = recording
+    return batches
+
+
+def test_changes_are_written_in_batches(make_persistence):
+    async def run():
+        persistence = make_persistence(batch_size=3)
+        batches = count_writes(persistence)
+        for user_id in (1, 2, 3):
+            await persistence.update_user_data(user_id, {'step': user_id})
+        # Полная пачка пишется сразу, не дожидаясь паузы
+        await asyncio.sleep(0.01)
+        assert batches == [{1: {'step': 1}, 2: {'step': 2}, 3: {'step': 3}}]
+
+        await persistence.update_user_data(4, {'step': 4})
+        await persistence.update_user_data(5, {'step': 5})
+        await asyncio.sleep(0.2)
+        assert batches[1:] == [{4: {'step': 4}, 5: {'step': 5}}]
+        await persistence.flush()
+        return await make_persistence().get_user_data()
+
+    assert asyncio.run(run()) == {user_id: {'step': user_id} for user_id in range(1, 6)}
+
+
+def test_flush_on_shutdown_writes_pending_changes(make_persistence):
+    async def run():
+        persistence = make_persistence()
+        await persistence.update_user_data(7, {'gaming_setup': {'genre': 'shooter'}})
+        await persistence.flush()
+        return await make_persistence().get_user_data()
+
+    assert asyncio.run(run()) == {7: {'gaming_setup': {'genre': 'shooter'}}}
+
+
+def test_stale_states_are_skipped_and_expired(make_persistence):
+    async def run():
+        persistence = make_persistence()
+        persistence._write({1: {'old': True}}, time.time() - TTL - 10)
+        persistence._write({2: {'old': False}}, time.time())
+        loaded = await persistence.get_user_data()
+        await persistence.flush()
+        # Запись старше ttl удалена из хранилища, а не только пропущена при загрузке
+        persistence = make_persistence()
+        remaining = {user_id: data for user_id, (data, _) in persistence._load(0).items()}
+        await persistence.flush()
+        return loaded, remaining
+
+    loaded, remaining = asyncio.run(run())
+    assert loaded == {2: {'old': False}}
+    assert remaining == {2: {'old': False}}
+
+
+def test_refresh_picks_up_state_written_by_another_replica(make_persistence):
+    async def run():
+        first, second = make_persistence(), make_persistence()
+        await first.get_user_data()
+        user_data = {}
+        await first.refresh_user_data(1, user_data)
+        assert user_data == {}
+
+        await second.update_user_data(1, {'step': 'budget'})
+        await second._write_pending()
+        await first.refresh_user_data(1, user_data)
+        assert user_data == {'step': 'budget'}
+
+        # Несохранённое изменение этой реплики не перетирается её же старой записью
+        user_data['step'] = 'genre'
+        await first.refresh_user_data(1, user_data)
+        assert user_data == {'step': 'genre'}
+        await first.update_user_data(1, dict(user_data))
+        await first.refresh_user_data(1, user_data)
+        assert user_data == {'step': 'genre'}
+        await first.flush()
+        await second.flush()
+
+    asyncio.run(run())
+
+
+def test_stale_states_expire_on_the_write_interval(make_persistence):
+    async def run():
+        persistence = make_persistence()
+        persistence._expired_at -= persistence.update_interval
+        persistence._write({1: {'old': True}}, time.time() - TTL - 10)
+        await persistence.update_user_data(2, {'step': 2})
+        await persistence._write_pending()
+        # Брошенное состояние удалено без остановки бота
+        stored = set(persistence._load(0))
+
+        persistence._versions[3] = time.time() - TTL - 10
+        user_data = {'step': 'abandoned'}
+        await persistence.refresh_user_data(3, user_data)
+        await persistence.flush()
+        return stored, user_data
+
+    stored, user_data = asyncio.run(run())
+    assert stored == {2}
+    assert user_data == {}
+
+
+def test_dropped_and_emptied_states_are_deleted(make_persistence):
+    async def run():
+        persistence = make_persistence()
+        for user_id in (1, 2, 3):
+            await persistence.update_user_data(user_id, {'step': user_id})
+        await persistence.flush()
+        persistence = make_persistence()
+        await persistence.drop_user_data(1)
+        await persistence.update_user_data(2, {})
+        await persistence.flush()
+        return await make_persistence().get_user_data()
+
+    assert asyncio.run(run()) == {3: {'step': 3}}
+
+
+def test_failed_batch_is_requeued_without_overwriting_newer_changes(make_persistence):
+    async def run():
+        persistence = make_persistence()
+        write = persistence._write
+
+        def failing(batch, now):
+            # Пока пачка пишется, пользователь 1 успел измениться ещё раз
+            persistence._pending[1] = {'step': 'newer'}
+            raise ConnectionError("database is down")
+        persistence._write = failing
+        await persistence.update_user_data(1, {'step': 'older'})
+        await persistence.update_user_data(2, {'step': 2})
+        await persistence._write_pending()
+        pending = dict(persistence._pending)
+
+        persistence._write = write
+        await persistence.flush()
+        return pending, await make_persistence().get_user_data()
+
+    pending, stored = asyncio.run(run())
+    assert pending == {1: {'step': 'newer'}, 2: {'step': 2}}
+    assert stored == {1: {'step': 'newer'}, 2: {'step': 2}}
+
+
+def test_changed_ttl_updates_the_mongo_index_in_place():
+    collection = mongomock.MongoClient(tz_aware=True).db.user_state
+    collection.create_index('updated_at', expireAfterSeconds=60)
+    commands = []
+    create_index = collection.create_index
+
+    def conflicting(*args, **kwargs):
+        # mongomock не ставит код ошибки, который возвращает сервер MongoDB
+        try:
+            return create_index(*args, **kwargs)
+        except pymongo.errors.OperationFailure as e:
+            raise pymongo.errors.OperationFailure(str(e), code=INDEX_OPTIONS_CONFLICT)
+    collection.create_index = conflicting
+    collection.database.command = commands.append
+
+    MongoUserPersistence('', collection=collection, update_interval=60, ttl=TTL)
+    assert commands == [{'collMod': 'user_state',
+                         'index': {'keyPattern': {'updated_at': 1}, 'expireAfterSeconds': TTL}}]
@@ -0,0 +1,56 @@
+import sqlite3
+from types import SimpleNamespace
+
+from catalog import CatalogSnapshot
+from photo_cache import PhotoCache, photo_key
+
+
+def sent(file_id):
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+def test_prune_drops_changed_and_removed_products(catalog, tmp_path, monkeypatch):
+    kept, changed = list(catalog.iter_products())[:2]
+    cache = PhotoCache(str(tmp_path / 'photos.sqlite3'))
+    cache.remember(photo_key(*kept.key), kept.photo_url, sent('kept'))
+    cache.remember(photo_key(*changed.key), 'https://example.com/old.jpg', sent('changed'))
+    cache.remember(photo_key('mice', 'Нет такого', 'Модель'), 'https://example.com/gone.jpg', sent('gone'))
+    # Каталог не обходится целиком: спрашиваем только о закэшированных ключах
+    monkeypatch.setattr(type(catalog), 'iter_products', lambda self: iter(()))
+
+    assert cache.prune(catalog) == 2
+    assert len(cache) == 1
+    assert cache.lookup(photo_key(*kept.key), kept.photo_url) == 'kept'
+    cache.close()
+
+    reopened = PhotoCache(str(tmp_path / 'photos.sqlite3'))
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_prune_keeps_products_with_slash_in_names(tmp_path):
+    data = {'mice': {'A/B': {'Model 1/2': {'description': 'x', 'price': '$10', 'photo_url': 'https://shop/1.jpg'}}}}
+    snapshot = CatalogSnapshot(data, 1, 0.0)
+    key = photo_key('mice', 'A/B', 'Model 1/2')
+    cache = PhotoCache(str(tmp_path / 'photos.sqlite3'))
+    cache.remember(key, 'https://shop/1.jpg', sent('slash'))
+
+    assert cache.prune(snapshot) == 0
+    cache.close()
+    reopened = PhotoCache(str(tmp_path / 'photos.sqlite3'))
+    assert reopened.lookup(key, 'https://shop/1.jpg') == 'slash'
+    reopened.close()
+
+
+def test_old_joined_key_table_is_recreated(tmp_path):
+    path = str(tmp_path / 'photos.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE photos (key TEXT PRIMARY KEY, photo_url TEXT NOT NULL, file_id TEXT NOT NULL)")
+    connection.execute("INSERT INTO photos VALUES ('mice/a/b', 'https://shop/1.jpg', 'old')")
+    connection.commit()
+    connection.close()
+
+    cache = PhotoCache(path)
+    assert len(cache) == 0
+    cache.remember(photo_key('mice', 'a', 'b'), 'https://shop/1.jpg', sent('new'))
+    cache.close()
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from processing import PerUserUpdateProcessor
+
+HANDLER_SECONDS = 0.1
+
+
+def message_update(update_id: int, user_id: int) -> Update:
+    return Update(update_id, message=Message(
+        update_id, datetime.now(), Chat(user_id, Chat.PRIVATE), from_user=User(user_id, 'user', False), text='/start'
+    ))
+
+
+def test_one_users_burst_does_not_take_slots_from_others():
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        order = []
+        finished = {}
+
+        async def handle(update: Update):
+            await asyncio.sleep(HANDLER_SECONDS)
+            order.append(update.update_id)
+            finished[update.update_id] = time.perf_counter()
+
+        started = time.perf_counter()
+        burst = [message_update(i, user_id=1) for i in range(8)]
+        tasks = [asyncio.create_task(processor.process_update(update, handle(update))) for update in burst]
+        await asyncio.sleep(0)
+        other = message_update(100, user_id=2)
+        tasks.append(asyncio.create_task(processor.process_update(other, handle(other))))
+        await asyncio.gather(*tasks)
+        return order, finished[100] - started
+
+    order, other_seconds = asyncio.run(run())
+    assert other_seconds < HANDLER_SECONDS * 2, other_seconds
+    assert [update_id for update_id in order if update_id < 100] == list(range(8))
+
+
+def test_updates_without_user_run_concurrently():
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            processor.process_update(Update(i), asyncio.sleep(HANDLER_SECONDS)) for i in range(4)
+        ))
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < HANDLER_SECONDS * 2
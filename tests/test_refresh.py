@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+import pytest
+
+import metrics
+from benchmarks.refresh import ServerPages, ShopServer
+from callbacks import NodeIndex
+from catalog import CatalogStore
+from refresh import PriceRefresher
+from render import RenderCache
+
+
+@pytest.fixture
+def shop(tmp_path):
+    with open('tech_data.json', 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    pages = ServerPages(ShopServer(), data)
+    pages.path = str(tmp_path / 'tech_data.json')
+    with open(pages.path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+    yield pages
+    pages.server.close()
+
+
+@pytest.fixture
+def store(shop):
+    store = CatalogStore(shop.path, index_builders={'nodes': NodeIndex, 'render': RenderCache})
+    assert store.reload()
+    return store
+
+
+@pytest.fixture
+def refresher(store):
+    refresher = PriceRefresher(store, concurrency=4, timeout=5)
+    yield refresher
+    refresher.close()
+
+
+def test_unchanged_pages_answer_not_modified(shop, store, refresher):
+    before = store.get()
+    assert refresher.run() == 0
+    assert shop.server.take_statuses() == {200: len(shop.products)}
+
+    not_modified = metrics.REFRESH_PAGES.value('not_modified')
+    assert refresher.run() == 0
+    assert shop.server.take_statuses() == {304: len(shop.products)}
+    assert metrics.REFRESH_PAGES.value('not_modified') - not_modified == len(shop.products)
+    assert store.get() is before
+
+
+def test_changed_pages_patch_only_their_products(shop, store, refresher):
+    refresher.run()
+    shop.server.take_statuses()
+    before = store.get()
+    mouse, keyboard, other_keyboard = shop.first('mice'), shop.first('keyboards'), shop.last('keyboards')
+    shop.set_price(keyboard, '111.50')
+    shop.set_spec(other_keyboard, 'Обновлено магазином')
+    shop.set_price(shop.foreign, '9990')
+
+    assert refresher.run() == 2
+    assert shop.server.take_statuses() == {200: 3, 304: len(shop.products) - 3}
+    after = store.get()
+    assert after.product(*keyboard).price == 111.5 and after.product(*keyboard).price_text == '$111.50'
+    assert after.product(*other_keyboard).specs[shop.spec_names[other_keyboard]] == 'Обновлено магазином'
+    assert after.product(*shop.foreign) is before.product(*shop.foreign)
+    assert after.product(*mouse) is before.product(*mouse)
+    assert after.category_version('mice') == before.category_version('mice')
+
+
+def test_unavailable_page_keeps_last_version(shop, store, refresher):
+    refresher.run()
+    mouse = shop.first('mice')
+    price = store.get().product(*mouse).price
+    errors = metrics.REFRESH_PAGES.value('error')
+    shop.server.broken.add(shop.paths[mouse])
+    shop.set_price(mouse, '1')
+
+    assert refresher.run() == 0
+    assert store.get().product(*mouse).price == price
+    assert metrics.REFRESH_PAGES.value('error') - errors == 1
+
+
+def test_reload_reapplies_cached_pages(shop, store, refresher):
+    store.add_reload_listener(refresher.reapply)
+    refresher.run()
+    keyboard = shop.first('keyboards')
+    shop.set_price(keyboard, '111.50')
+    assert refresher.run() == 1
+    shop.server.take_statuses()
+
+    os.utime(shop.path, (time.time() + 10, time.time() + 10))
+    assert store.reload()
+    assert store.get().product(*keyboard).price == 111.5
+    assert shop.server.take_statuses() == {}
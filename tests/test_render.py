@@ -0,0 +1,34 @@
+import catalog_db
+from cache import LRUCache
+from catalog_db import SqlRenderCache
+
+
+def test_lru_setdefault_keeps_first_value_and_bound():
+    cache = LRUCache(2)
+    assert cache.setdefault('a', 1) == 1
+    assert cache.setdefault('a', 2) == 1
+    cache.setdefault('b', 2)
+    cache.setdefault('a', 3)
+    cache.setdefault('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is None and cache.get('a') == 1
+
+
+def test_sql_render_cache_is_bounded(sql_catalog, monkeypatch):
+    monkeypatch.setattr(catalog_db, 'RENDER_CACHE_SIZE', 2)
+    render = SqlRenderCache(sql_catalog)
+    keys = [product.key for product in sql_catalog.iter_products()][:3]
+    cards = [render.product_card(*key) for key in keys]
+
+    assert len(render._rendered) == 2
+    assert render.product_card(*keys[-1]) is cards[-1]
+    assert render.product_card(*keys[0]) is not cards[0]
+
+
+def test_json_render_cache_keeps_every_screen(json_catalog):
+    render = json_catalog.indexes['render']
+    cards = [render.product_card(*product.key) for product in json_catalog.products]
+    misses = render.misses
+
+    assert [render.product_card(*product.key) for product in json_catalog.products] == cards
+    assert render.misses == misses
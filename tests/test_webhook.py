@@ -0,0 +1,121 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+
+import bot
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.webhook_replay import FIXTURE, PATH, SECRET, free_port
+
+
+async def replay(updates: list) -> tuple:
+    api = await FakeBotApi().start()
+    application = bot.build_application(token='123:fake', base_url=api.base_url)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/{PATH}"
+    await application.initialize()
+    await application.updater.start_webhook(
+        listen='127.0.0.1', port=port, url_path=PATH, webhook_url=url, secret_token=SECRET, max_connections=10
+    )
+    await application.start()
+    try:
+        async with httpx.AsyncClient() as client:
+            rejected = await client.post(url, json=updates[0], headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+            missing = await client.post(url, json=updates[0])
+            # Отклонённый апдейт не должен дойти до обработчиков
+            await asyncio.sleep(0.2)
+            calls_after_rejection = dict(api.calls)
+
+            statuses = []
+            for update in updates:
+                response = await client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+                statuses.append(response.status_code)
+
+        callbacks = sum(1 for update in updates if 'callback_query' in update)
+        await api.wait_for_calls('answerCallbackQuery', callbacks, timeout=10)
+        await api.wait_for_calls('sendMessage', 2, timeout=10)
+        await api.wait_for_calls('answerInlineQuery', 1, timeout=10)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await api.stop()
+    return (rejected.status_code, missing.status_code), calls_after_rejection, statuses, api.requests
+
+
+def texts(requests: list, method: str) -> list:
+    return [params.get('text') or params.get('caption', '') for name, params in requests if name == method]
+
+
+def test_webhook_replay_answers_recorded_updates():
+    assert bot.catalog.reload(force=True)
+    with open(FIXTURE, 'r', encoding='utf-8') as file:
+        updates = json.load(file)
+
+    rejections, calls_after_rejection, statuses, requests = asyncio.run(replay(updates))
+
+    assert rejections == (403, 403)
+    assert set(calls_after_rejection) <= {'getMe', 'setWebhook'}
+    assert statuses == [200] * len(updates)
+
+    sent = texts(requests, 'sendMessage')
+    assert sent[0] == "🖥 Выберите тип периферии:"
+    assert sent[1].startswith("🔎 Найдено по запросу «разер вайпер»")
+    search_markup = next(params['reply_markup'] for name, params in requests
+                         if name == 'sendMessage' and params['text'] == sent[1])
+    assert "Razer Viper V2 Pro" in json.loads(search_markup)['inline_keyboard'][0][0]['text']
+
+    edited = texts(requests, 'editMessageText')
+    assert "🏷 Выберите бренд:" in edited
+    assert "📋 Модели Razer:" in edited
+    assert "✅ Вот лучшие варианты для вас:" in edited
+    assert "больше не доступен" in edited[-1]
+
+    assert any('Viper V2 Pro' in caption for caption in texts(requests, 'sendPhoto'))
+    album = next(params for name, params in requests if name == 'sendMediaGroup')
+    assert len(json.loads(album['media'])) == 3
+
+    inline = json.loads(next(params['results'] for name, params in requests if name == 'answerInlineQuery'))
+    assert inline and all('Logitech' in result['title'] for result in inline[:1])
+
+
+def test_search_results_do_not_evict_cached_selections():
+    assert bot.catalog.reload(force=True)
+    snapshot = bot.catalog.get()
+    bot.results_cache.clear()
+    bot.search_cache.clear()
+    bot.results_cache.put(('recommendations', 'kept'), ['cached'])
+    misses = bot.search_cache.misses
+
+    async def run():
+        for query in range(bot.config.RESULT_CACHE_SIZE + 1):
+            await bot.find_products(snapshot, f"query {query}", 5)
+    asyncio.run(run())
+
+    assert bot.results_cache.get(('recommendations', 'kept')) == ['cached']
+    assert bot.search_cache.misses - misses == bot.config.RESULT_CACHE_SIZE + 1
+
+
+def test_setup_without_budget_reports_missing_products(monkeypatch):
+    assert bot.catalog.reload(force=True)
+    edits = []
+
+    class Query:
+        async def answer(self):
+            pass
+
+        async def edit_message_text(self, text, **kwargs):
+            edits.append((text, kwargs.get('reply_markup')))
+
+    async def no_setups(*args):
+        return []
+    monkeypatch.setattr(bot, 'pick_gaming_setup', no_setups)
+    update = SimpleNamespace(callback_query=Query())
+    context = SimpleNamespace(user_data={'gaming_setup': {'genre': 'shooter', 'hand_size': 'medium',
+                                                          'switch_type': 'linear'}})
+    asyncio.run(bot.generate_gaming_setup(update, context, '0'))
+    asyncio.run(bot.generate_gaming_setup(update, context, '100'))
+
+    assert edits[0] == (bot.SETUP_UNAVAILABLE_TEXT, bot.MENU_MARKUP)
+    assert edits[1][1] is bot.SETUP_BUDGETS_MARKUP and '$100' in edits[1][0]
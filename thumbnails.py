@@ -0,0 +1,135 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from PIL import Image
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.jpg'
+# Исходники крупнее не скачиваются: это уже не фото товара
+MAX_SOURCE_BYTES = 20 * 2 ** 20
+FETCH_WORKERS = 2
+
+
+class ThumbnailCache:
+    """Уменьшенные копии фото товаров на диске для отправки в Telegram файлом.
+
+    Фото скачивается один раз, уменьшается до max_side по большей стороне и
+    хранится JPEG-файлом с именем по хэшу ссылки. Когда файлы занимают больше
+    max_bytes, удаляются давно не использованные; порядок использования — mtime
+    файла, поэтому он переживает перезапуск.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = None, max_side: int = None):
+        self.directory = directory
+        self.max_bytes = max_bytes or config.THUMBNAIL_CACHE_BYTES
+        self.max_side = max_side or config.THUMBNAIL_MAX_SIDE
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='thumbnails')
+        self._session = requests.Session()
+        os.makedirs(directory, exist_ok=True)
+
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._files = OrderedDict((name, size) for _, name, size in sorted(entries))  # от давних к свежим
+        self.size = sum(self._files.values())
+        with self._lock:
+            self._evict()
+        logger.info(f"Кэш миниатюр: {len(self._files)} файлов, {self.size / 2 ** 20:.1f} МБ в {directory}")
+
+    def __len__(self):
+        return len(self._files)
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha1(url.encode()).hexdigest() + SUFFIX
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Байты миниатюры или None, если её ещё нет."""
+        name = self._name(url)
+        with self._lock:
+            if name not in self._files:
+                self.misses += 1
+                return None
+            self._files.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError as e:
+            logger.warning(f"Кэш миниатюр: не удалось прочитать {name}: {e}")
+            with self._lock:
+                self.size -= self._files.pop(name, 0)
+            return None
+        return data
+
+    def prefetch(self, url: str):
+        """Скачивает и уменьшает фото в фоне, если его ещё нет в кэше и оно уже не загружается."""
+        name = self._name(url)
+        with self._lock:
+            if name in self._files or name in self._pending:
+                return
+            self._pending.add(name)
+        self._executor.submit(self._fetch, url, name)
+
+    def _fetch(self, url: str, name: str):
+        try:
+            data = self.fetch(url)
+            path = os.path.join(self.directory, name)
+            # Запись через временный файл: читатель не увидит обрезанный JPEG
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+            with self._lock:
+                self.size += len(data) - self._files.pop(name, 0)
+                self._files[name] = len(data)
+                self._evict()
+        except Exception as e:
+            logger.warning(f"Не удалось подготовить миниатюру {url}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def fetch(self, url: str) -> bytes:
+        """Скачивает фото и возвращает JPEG не больше max_side по большей стороне."""
+        with self._session.get(url, timeout=config.THUMBNAIL_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            source = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(source) > MAX_SOURCE_BYTES:
+            raise ValueError(f"фото больше {MAX_SOURCE_BYTES // 2 ** 20} МБ")
+        with Image.open(io.BytesIO(source)) as image:
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=config.THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.warning(f"Кэш миниатюр: не удалось удалить {name}: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()